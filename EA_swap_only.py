@@ -15,6 +15,7 @@ from utils import (
     rank_macros_area,
     rank_macros_mixed_port,
     get_m2m_flow,
+    m2m_flow_file,
     cal_hpwl,
     draw_macros,
     Record,
@@ -150,7 +151,7 @@ def main(place_func):
 
     hpwl_save_dir += "{}_seed_{}.csv".format(dataset, seed1)
     placement_save_dir += "{}_seed_{}.csv".format(dataset, seed1)
-    m2m_flow_file = "benchmarks/{}/macro2macro.csv".format(dataset)
+    m2m_file = m2m_flow_file(dataset)
 
     best_placed_macro = hot_start(
         init_round,
@@ -161,10 +162,10 @@ def main(place_func):
         place_func,
         hpwl_save_dir,
         placement_save_dir,
-        m2m_flow_file,
+        m2m_file,
     )
 
-    m2m_flow = get_m2m_flow(m2m_flow_file)
+    m2m_flow = get_m2m_flow(m2m_file)
     pic_save_dir += "{}_seed_{}_datamask_hot_mixed2.png".format(dataset, seed1)
     draw_macros(placedb, placement_save_dir, grid_size, m2m_flow, pic_save_dir)
 
@@ -0,0 +1,273 @@
+import argparse
+import csv
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+from common import benchmark_list, method_list
+from grid_search import (
+    grid_search,
+    point_store_key,
+    run_points,
+    search_points,
+    search_records,
+)
+from result_store import ResultStore, code_version
+
+Point = Tuple[int, int, int]
+
+
+def pareto_mask(values: np.ndarray) -> np.ndarray:
+    # values 每一行为一个点的 (hpwl, overflow)，均为越小越好；返回非支配点的 mask
+    mask = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        dominated = np.all(values <= value, axis=1) & np.any(values < value, axis=1)
+        mask[i] = not np.any(dominated)
+    return mask
+
+
+def rbf(x1: np.ndarray, x2: np.ndarray, length_scale: float) -> np.ndarray:
+    dist = np.sum((x1[:, None, :] - x2[None, :, :]) ** 2, axis=-1)
+    return np.exp(-0.5 * dist / length_scale**2)
+
+
+def gp_posterior(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
+    x_test: np.ndarray,
+    length_scales=(0.1, 0.2, 0.3, 0.5, 1.0),
+    noise: float = 1e-3,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # 零均值 GP（y 先标准化），length scale 取边际似然最大的一个，
+    # 返回 x_test 上的均值和标准差
+    y_mean = y_train.mean()
+    y_std = y_train.std() if y_train.std() > 0 else 1.0
+    y = (y_train - y_mean) / y_std
+    best = None
+    for length_scale in length_scales:
+        kernel = rbf(x_train, x_train, length_scale) + noise * np.eye(len(x_train))
+        factor = cho_factor(kernel, lower=True)
+        weight = cho_solve(factor, y)
+        log_likelihood = -0.5 * y @ weight - np.sum(np.log(np.diag(factor[0])))
+        if best is None or log_likelihood > best[0]:
+            best = (log_likelihood, length_scale, factor, weight)
+    _, length_scale, factor, weight = best
+    k_star = rbf(x_test, x_train, length_scale)
+    mean = k_star @ weight
+    v = solve_triangular(factor[0], k_star.T, lower=True)
+    var = np.maximum(1.0 - np.sum(v**2, axis=0), 1e-12)
+    return mean * y_std + y_mean, np.sqrt(var) * y_std
+
+
+class SimplexSearch:
+    # 在 alpha + beta + gamma = 1 的 0.1 网格上，对 (log hpwl, overflow) 两个目标的自适应搜索。
+    # 先评估 init_points，之后每个目标各拟合一个 GP，乐观估计 mean - kappa * std
+    # 每次 propose 时，乐观估计也被观测到的 Pareto front 支配的候选点被剪枝；
+    # 剪枝按当前的后验重新计算，新的观测改变 GP 后，之前剪掉的点仍可能被选中；
+    # 其余候选点用权重轮换的增广 Chebyshev 标量化选择，得到覆盖整个 front 的点
+    def __init__(
+        self,
+        points: List[Point],
+        init_points: List[Point],
+        budget: int,
+        kappa: float = 2.0,
+    ) -> None:
+        self.points = points
+        self.init_points = [point for point in init_points if point in points]
+        self.budget = budget
+        self.kappa = kappa
+        self.observed: Dict[Point, Tuple[float, float]] = {}
+        self.failed = set()
+        # 最近一次 propose 剪掉的点，只用于报告
+        self.pruned = set()
+        self.asked = 0
+
+    def tell(self, point: Point, metrics: Dict[str, float]):
+        # metrics 为空表示评估失败，不再重试
+        if metrics:
+            self.observed[point] = (metrics["hpwl"], metrics["overflow"])
+        else:
+            self.failed.add(point)
+
+    def remaining(self) -> List[Point]:
+        done = set(self.observed) | self.failed
+        return [point for point in self.points if point not in done]
+
+    def evaluations(self) -> int:
+        return len(self.observed) + len(self.failed)
+
+    @staticmethod
+    def coords(points: List[Point]) -> np.ndarray:
+        return np.array([point[:2] for point in points], dtype=float) / 10
+
+    def front(self) -> List[Point]:
+        points = list(self.observed)
+        if not points:
+            return []
+        mask = pareto_mask(np.array([self.observed[point] for point in points]))
+        return [point for point, keep in zip(points, mask) if keep]
+
+    def propose(self, n: int = 1) -> List[Point]:
+        # 返回下一批要评估的点，为空表示搜索结束
+        n = min(n, self.budget - self.evaluations())
+        if n <= 0:
+            return []
+        proposal = [point for point in self.init_points if point in self.remaining()]
+        if proposal or len(self.observed) < 2:
+            if not proposal:
+                proposal = self.remaining()
+            return proposal[:n]
+
+        candidates = self.remaining()
+        if not candidates:
+            return []
+        observed = list(self.observed)
+        values = np.array([self.observed[point] for point in observed])
+        values[:, 0] = np.log(values[:, 0])
+        x_train, x_test = self.coords(observed), self.coords(candidates)
+        lcb = np.zeros((len(candidates), 2))
+        for obj in range(2):
+            mean, std = gp_posterior(x_train, values[:, obj], x_test)
+            lcb[:, obj] = mean - self.kappa * std
+
+        # 乐观估计也被 front 严格支配的点不可能进入 front
+        front = values[pareto_mask(values)]
+        self.pruned = set()
+        keep = []
+        for i, bound in enumerate(lcb):
+            if np.any(np.all(front <= bound, axis=1) & np.any(front < bound, axis=1)):
+                self.pruned.add(candidates[i])
+            else:
+                keep.append(i)
+        if not keep:
+            return []
+        lcb = lcb[keep]
+        candidates = [candidates[i] for i in keep]
+
+        low, high = values.min(axis=0), values.max(axis=0)
+        scaled = (lcb - low) / np.maximum(high - low, 1e-12)
+        proposal = []
+        for _ in range(n):
+            # 每三次中有一次只看 hpwl（grid_search 的选择规则），其余的权重按黄金分割轮换
+            if self.asked % 3 == 0:
+                weight = 1.0
+            else:
+                weight = (self.asked * 0.618034) % 1.0
+            self.asked += 1
+            w = np.array([weight, 1.0 - weight])
+            score = np.max(w * scaled, axis=1) + 0.05 * np.sum(w * scaled, axis=1)
+            for i in np.argsort(score, kind="stable"):
+                if candidates[i] not in proposal:
+                    proposal.append(candidates[i])
+                    break
+        return proposal
+
+
+def adaptive_search(
+    method_list: List[str],
+    benchmark_list: List[str],
+    store_root: str = "result_store",
+    seed: int = 2027,
+    version: str = None,
+    budget: int = 16,
+    batch: int = 1,
+    jobs: int = 1,
+    kappa: float = 2.0,
+    max_sessions: int = None,
+):
+    # 每个 (method, benchmark) 独立搜索，每一轮把所有搜索提出的点一起交给 run_points。
+    # store 中已有的结果直接使用，同样计入 budget
+    version = version or code_version()
+    store = ResultStore(store_root)
+    points = search_points()
+    # 三个顶点和中心附近的点
+    init_points = [(10, 0, 0), (0, 10, 0), (0, 0, 10), (3, 3, 4)]
+    searches: Dict[Tuple[str, str], SimplexSearch] = {}
+    for method in method_list:
+        for b in benchmark_list:
+            search = SimplexSearch(points, init_points, budget, kappa)
+            for point in points:
+                metrics = store.metrics(
+                    point_store_key(b, method, point, seed, version)
+                )
+                if metrics:
+                    search.tell(point, metrics)
+            searches[(method, b)] = search
+
+    while True:
+        todo, asked = [], []
+        for (method, b), search in searches.items():
+            for point in search.propose(batch):
+                todo.append((store_root, method, [b], point, seed, version))
+                asked.append((method, b, point))
+        if not todo:
+            break
+        print(f"run {len(todo)} points")
+        run_points(todo, jobs, max_sessions)
+        for method, b, point in asked:
+            metrics = store.metrics(point_store_key(b, method, point, seed, version))
+            searches[(method, b)].tell(point, metrics)
+
+    for (method, b), search in searches.items():
+        print(
+            f"{method} {b}: evaluated {search.evaluations()}/{len(points)}, "
+            f"pruned {len(search.pruned)}, front {sorted(search.front())}"
+        )
+    return searches
+
+
+def write_pareto_front(searches: Dict[Tuple[str, str], SimplexSearch], csv_file: str):
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["method", "benchmark", "alpha", "beta", "gamma", "hpwl", "overflow"]
+        )
+        for (method, b), search in searches.items():
+            for point in sorted(search.front()):
+                hpwl, overflow = search.observed[point]
+                writer.writerow([method, b, *[x / 10 for x in point], hpwl, overflow])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="adaptive hyperparameter search")
+    parser.add_argument("--store", default="result_store")
+    parser.add_argument("--seed", default=2027)
+    parser.add_argument("--code_version", default=None)
+    # 每个 (method, benchmark) 最多评估的点数，网格共 66 个点
+    parser.add_argument("--budget", default=16)
+    # 每个搜索每一轮提出的点数，以及同时运行的点数
+    parser.add_argument("--batch", default=1)
+    parser.add_argument("--jobs", default=1)
+    parser.add_argument("--kappa", default=2.0)
+    # 常驻 detailed 进程中最多保留的设计个数，默认每个 benchmark 一个
+    parser.add_argument("--max_sessions", default=None)
+    args = parser.parse_args()
+    version = args.code_version or code_version()
+    seed = int(args.seed)
+
+    searches = adaptive_search(
+        method_list,
+        benchmark_list,
+        args.store,
+        seed,
+        version,
+        int(args.budget),
+        int(args.batch),
+        int(args.jobs),
+        float(args.kappa),
+        int(args.max_sessions) if args.max_sessions else None,
+    )
+    write_pareto_front(searches, "pareto_front.csv")
+    # 与 grid_search 相同的规则从已评估的点中选择，未评估的点为 my_inf
+    search_record_hpwl, search_record_congestion = search_records(
+        ResultStore(args.store),
+        method_list,
+        benchmark_list,
+        search_points(),
+        seed,
+        version,
+    )
+    grid_search(
+        method_list, benchmark_list, search_record_hpwl, search_record_congestion
+    )
@@ -4,7 +4,7 @@ from scipy.spatial import distance
 from typing import Dict, List, Tuple
 
 from place_db import PlaceDB
-from utils import Record, get_m2m_flow, read_placement
+from utils import Record, get_m2m_flow, m2m_flow_file, read_placement
 from common import grid_setting, my_inf
 
 
@@ -46,7 +46,7 @@ def cal_one_dataflow_loss(benchmark: str):
     print(benchmark)
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
 
     df_loss = DataflowLoss()
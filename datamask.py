@@ -12,6 +12,7 @@ from utils import (
     rank_macros_area,
     rank_macros_mixed_port,
     get_m2m_flow,
+    m2m_flow_file,
     cal_hpwl,
     draw_macros,
     Record,
@@ -93,7 +94,7 @@ def main():
 
     hpwl_save_dir += "{}_seed_{}_datamask_iter3.csv".format(dataset, seed1)
     placement_save_dir += "{}_seed_{}_datamask_iter3.csv".format(dataset, seed1)
-    m2m_flow_file = "benchmarks/{}/macro2macro.csv".format(dataset)
+    m2m_file = m2m_flow_file(dataset)
 
     best_placed_macro = hot_start(
         init_round,
@@ -103,10 +104,10 @@ def main():
         grid_size,
         hpwl_save_dir,
         placement_save_dir,
-        m2m_flow_file,
+        m2m_file,
     )
 
-    m2m_flow = get_m2m_flow(m2m_flow_file)
+    m2m_flow = get_m2m_flow(m2m_file)
     pic_save_dir += "{}_seed_{}_datamask_iter3.png".format(dataset, seed1)
     draw_macros(placedb, placement_save_dir, grid_size, m2m_flow, pic_save_dir)
 
@@ -9,10 +9,10 @@ from place_db import PlaceDB
 from utils import (
     M2MFlow,
     PlaceRecord,
-    Record,
     draw_detailed_placement,
     draw_macro_placement,
     get_m2m_flow,
+    m2m_flow_file,
     read_placement,
 )
 
@@ -41,19 +41,16 @@ def cal_dataflow(placedb: PlaceDB, place_record: PlaceRecord, m2m_flow: M2MFlow)
 
 
 def db2record(placedb: PlaceDB, grid_size: int) -> PlaceRecord:
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     for node_name in placedb.node_info:
         chosen_loc_x = placedb.node_info[node_name].bottom_left_x // grid_size
         chosen_loc_y = placedb.node_info[node_name].bottom_left_y // grid_size
-        place_record[node_name] = Record(
+        place_record.set(
             node_name,
-            placedb.node_info[node_name].width,
-            placedb.node_info[node_name].height,
             chosen_loc_x,
             chosen_loc_y,
             placedb.node_info[node_name].bottom_left_x,
             placedb.node_info[node_name].bottom_left_y,
-            grid_size,
         )
     return place_record
 
@@ -74,7 +71,7 @@ def read_pl_file(placedb: PlaceDB, pl_file: str):
 def draw_wiremask(benchmark: str):
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = "result/EA_swap_only/placement/{}_seed_2027_wiremask_hot.csv".format(
         benchmark
@@ -87,7 +84,7 @@ def draw_wiremask(benchmark: str):
 def draw_datamask(benchmark):
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = "result/EA_swap_only/placement/{}_seed_2027_datamask_hot.csv".format(
         benchmark
@@ -100,7 +97,7 @@ def draw_datamask(benchmark):
 def draw_mixedmask(benchmark):
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = (
         "result/EA_swap_only/placement/{}_seed_2027_mixedmask_iter_regu.csv".format(
@@ -150,7 +147,7 @@ def draw_macro_front_dreamplace_mixed(benchmark):
     print(f"draw_macro_front_dreamplace_mixed {benchmark}")
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join(
         "results_macro_front_dreamplace-mixed", benchmark, f"{benchmark}.gp.pl"
@@ -171,7 +168,7 @@ def draw_macro_refine_dreamplace_mixed(benchmark):
     placedb = PlaceDB(benchmark, grid_size)
     placedb.deal_center_core(scale_factor=refine_center_scaled_factor)
     placedb.deal_virtual_boundary(scale_factor=refine_virtual_boundary_scaled_factor)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join(
         # "results_v8_grid_search_820",
@@ -250,7 +247,7 @@ def draw_macro_front_bbo(benchmark):
     print(f"draw_macro_front_bbo {benchmark}")
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join("results_macro_front_bbo", benchmark, f"{benchmark}.gp.pl")
     read_pl_file(placedb, pl_file)
@@ -267,7 +264,7 @@ def draw_macro_refine_bbo(benchmark):
     placedb = PlaceDB(benchmark, grid_size)
     placedb.deal_center_core(scale_factor=refine_center_scaled_factor)
     placedb.deal_virtual_boundary(scale_factor=refine_virtual_boundary_scaled_factor)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join(
         "results_macro_refine-EA_bbo", benchmark, f"{benchmark}.gp.pl"
@@ -330,7 +327,7 @@ def draw_macro_front_dreamplace_macro(benchmark):
     print(f"draw_macro_front_dreamplace_macro {benchmark}")
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join(
         "results_macro_front_dreamplace-macro", benchmark, f"{benchmark}.gp.pl"
@@ -351,7 +348,7 @@ def draw_macro_refine_dreamplace_macro(benchmark):
     placedb = PlaceDB(benchmark, grid_size)
     placedb.deal_center_core(scale_factor=refine_center_scaled_factor)
     placedb.deal_virtual_boundary(scale_factor=refine_virtual_boundary_scaled_factor)
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     pl_file = os.path.join(
         # "results_v8_grid_search_820",
@@ -428,7 +425,7 @@ def draw_detailed_refine_dreamplace_macro(benchmark):
 
 def draw_area_dataflow(benchmark):
     grid_size = grid_setting[benchmark]["grid_size"]
-    m2m_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
+    m2m_file = m2m_flow_file(benchmark)
     m2m_flow = get_m2m_flow(m2m_file)
     placedb = PlaceDB(benchmark, grid_size)
     cnt = len(placedb.macro_name)
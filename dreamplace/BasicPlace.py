@@ -283,27 +283,98 @@ class BasicPlace(nn.Module):
         torch.manual_seed(params.random_seed)
         super(BasicPlace, self).__init__()
 
+        self.init_pos = self.initialize_position(params, placedb)
+
+        self.device = torch.device("cuda" if params.gpu else "cpu")
+
+        # position should be parameter
+        # must be defined in BasicPlace
         tt = time.time()
-        self.init_pos = np.zeros(placedb.num_nodes * 2, dtype=placedb.dtype)
+        self.pos = nn.ParameterList(
+            [nn.Parameter(torch.from_numpy(self.init_pos).to(self.device))])
+        logging.debug("build pos takes %.2f seconds" % (time.time() - tt))
+        # shared data on device for building ops
+        # I do not want to construct the data from placedb again and again for each op
+        tt = time.time()
+        self.data_collections = PlaceDataCollection(self.pos, params, placedb,
+                                                    self.device)
+        logging.debug("build data_collections takes %.2f seconds" %
+                      (time.time() - tt))
+
+        # similarly I wrap all ops
+        tt = time.time()
+        self.op_collections = PlaceOpCollection()
+        logging.debug("build op_collections takes %.2f seconds" %
+                      (time.time() - tt))
+
+        tt = time.time()
+        # position to pin position
+        self.op_collections.pin_pos_op = self.build_pin_pos(
+            params, placedb, self.data_collections, self.device)
+        # bound nodes to layout region
+        self.op_collections.move_boundary_op = self.build_move_boundary(
+            params, placedb, self.data_collections, self.device)
+        # hpwl and density overflow ops for evaluation
+        self.op_collections.hpwl_op = self.build_hpwl(
+            params, placedb, self.data_collections,
+            self.op_collections.pin_pos_op, self.device)
+        self.op_collections.pws_op = self.build_pws(placedb, self.data_collections)
+        # rectilinear minimum steiner tree wirelength from flute
+        # can only be called once
+        #self.op_collections.rmst_wl_op = self.build_rmst_wl(params, placedb, self.op_collections.pin_pos_op, torch.device("cpu"))
+        self.op_collections.timing_op = self.build_timing_op(params, placedb, timer)
+        # legality check
+        self.op_collections.legality_check_op = self.build_legality_check(
+            params, placedb, self.data_collections, self.device)
+        # legalization
+        if len(placedb.regions) > 0:
+            self.op_collections.legalize_op, self.op_collections.individual_legalize_op = self.build_multi_fence_region_legalization(
+            params, placedb, self.data_collections, self.device)
+        else:
+            self.op_collections.legalize_op = self.build_legalization(
+            params, placedb, self.data_collections, self.device)
+        # detailed placement
+        self.op_collections.detailed_place_op = self.build_detailed_placement(
+            params, placedb, self.data_collections, self.device)
+        # draw placement
+        self.op_collections.draw_place_op = self.build_draw_placement(
+            params, placedb)
+
+        # flag for rmst_wl_op
+        # can only read once
+        self.read_lut_flag = True
+
+        logging.debug("build BasicPlace ops takes %.2f seconds" %
+                      (time.time() - tt))
+
+    def initialize_position(self, params, placedb):
+        """
+        @brief initial locations of cells, including fillers, from placedb.
+        Consumes np.random, so seed it before calling for reproducible results.
+        @param params parameters
+        @param placedb placement database
+        """
+        tt = time.time()
+        init_pos = np.zeros(placedb.num_nodes * 2, dtype=placedb.dtype)
         # x position
-        self.init_pos[0:placedb.num_physical_nodes] = placedb.node_x
+        init_pos[0:placedb.num_physical_nodes] = placedb.node_x
         if params.global_place_flag and params.random_center_init_flag:  # move to center of layout
             logging.info(
                 "move cells to the center of layout with random noise")
-            self.init_pos[0:placedb.num_movable_nodes] = np.random.normal(
+            init_pos[0:placedb.num_movable_nodes] = np.random.normal(
                 loc=(placedb.xl * 1.0 + placedb.xh * 1.0) / 2,
                 scale=(placedb.xh - placedb.xl) * 0.001,
                 size=placedb.num_movable_nodes)
 
         # y position
-        self.init_pos[placedb.num_nodes:placedb.num_nodes +
-                      placedb.num_physical_nodes] = placedb.node_y
+        init_pos[placedb.num_nodes:placedb.num_nodes +
+                 placedb.num_physical_nodes] = placedb.node_y
         if params.global_place_flag and params.random_center_init_flag:  # move to center of layout
-            self.init_pos[placedb.num_nodes:placedb.num_nodes +
-                          placedb.num_movable_nodes] = np.random.normal(
-                              loc=(placedb.yl * 1.0 + placedb.yh * 1.0) / 2,
-                              scale=(placedb.yh - placedb.yl) * 0.001,
-                              size=placedb.num_movable_nodes)
+            init_pos[placedb.num_nodes:placedb.num_nodes +
+                     placedb.num_movable_nodes] = np.random.normal(
+                         loc=(placedb.yl * 1.0 + placedb.yh * 1.0) / 2,
+                         scale=(placedb.yh - placedb.yl) * 0.001,
+                         size=placedb.num_movable_nodes)
 
         if placedb.num_filler_nodes:  # uniformly distribute filler cells in the layout
             if len(placedb.regions) > 0:
@@ -321,7 +392,7 @@ class BasicPlace(nn.Module):
                     ).astype(np.int32)
                     for j, subregion in enumerate(region):
                         sub_filler_beg, sub_filler_end = subregion_num_filler_start_map[j : j + 2]
-                        self.init_pos[
+                        init_pos[
                             placedb.num_physical_nodes
                             + filler_beg
                             + sub_filler_beg : placedb.num_physical_nodes
@@ -332,7 +403,7 @@ class BasicPlace(nn.Module):
                             high=subregion[2] - placedb.filler_size_x_fence_region[i],
                             size=sub_filler_end - sub_filler_beg,
                         )
-                        self.init_pos[
+                        init_pos[
                             placedb.num_nodes
                             + placedb.num_physical_nodes
                             + filler_beg
@@ -348,14 +419,14 @@ class BasicPlace(nn.Module):
 
                 ### for cells outside fence region
                 filler_beg, filler_end = placedb.filler_start_map[-2:]
-                self.init_pos[
+                init_pos[
                     placedb.num_physical_nodes + filler_beg : placedb.num_physical_nodes + filler_end
                 ] = np.random.uniform(
                     low=placedb.xl,
                     high=placedb.xh - placedb.filler_size_x_fence_region[-1],
                     size=filler_end - filler_beg,
                 )
-                self.init_pos[
+                init_pos[
                     placedb.num_nodes
                     + placedb.num_physical_nodes
                     + filler_beg : placedb.num_nodes
@@ -368,12 +439,12 @@ class BasicPlace(nn.Module):
                 )
 
             else:
-                self.init_pos[placedb.num_physical_nodes : placedb.num_nodes] = np.random.uniform(
+                init_pos[placedb.num_physical_nodes : placedb.num_nodes] = np.random.uniform(
                     low=placedb.xl,
                     high=placedb.xh - placedb.node_size_x[-placedb.num_filler_nodes],
                     size=placedb.num_filler_nodes,
                 )
-                self.init_pos[
+                init_pos[
                     placedb.num_nodes + placedb.num_physical_nodes : placedb.num_nodes * 2
                 ] = np.random.uniform(
                     low=placedb.yl,
@@ -383,68 +454,7 @@ class BasicPlace(nn.Module):
 
         logging.debug("prepare init_pos takes %.2f seconds" %
                       (time.time() - tt))
-
-        self.device = torch.device("cuda" if params.gpu else "cpu")
-
-        # position should be parameter
-        # must be defined in BasicPlace
-        tt = time.time()
-        self.pos = nn.ParameterList(
-            [nn.Parameter(torch.from_numpy(self.init_pos).to(self.device))])
-        logging.debug("build pos takes %.2f seconds" % (time.time() - tt))
-        # shared data on device for building ops
-        # I do not want to construct the data from placedb again and again for each op
-        tt = time.time()
-        self.data_collections = PlaceDataCollection(self.pos, params, placedb,
-                                                    self.device)
-        logging.debug("build data_collections takes %.2f seconds" %
-                      (time.time() - tt))
-
-        # similarly I wrap all ops
-        tt = time.time()
-        self.op_collections = PlaceOpCollection()
-        logging.debug("build op_collections takes %.2f seconds" %
-                      (time.time() - tt))
-
-        tt = time.time()
-        # position to pin position
-        self.op_collections.pin_pos_op = self.build_pin_pos(
-            params, placedb, self.data_collections, self.device)
-        # bound nodes to layout region
-        self.op_collections.move_boundary_op = self.build_move_boundary(
-            params, placedb, self.data_collections, self.device)
-        # hpwl and density overflow ops for evaluation
-        self.op_collections.hpwl_op = self.build_hpwl(
-            params, placedb, self.data_collections,
-            self.op_collections.pin_pos_op, self.device)
-        self.op_collections.pws_op = self.build_pws(placedb, self.data_collections)
-        # rectilinear minimum steiner tree wirelength from flute
-        # can only be called once
-        #self.op_collections.rmst_wl_op = self.build_rmst_wl(params, placedb, self.op_collections.pin_pos_op, torch.device("cpu"))
-        self.op_collections.timing_op = self.build_timing_op(params, placedb, timer)
-        # legality check
-        self.op_collections.legality_check_op = self.build_legality_check(
-            params, placedb, self.data_collections, self.device)
-        # legalization
-        if len(placedb.regions) > 0:
-            self.op_collections.legalize_op, self.op_collections.individual_legalize_op = self.build_multi_fence_region_legalization(
-            params, placedb, self.data_collections, self.device)
-        else:
-            self.op_collections.legalize_op = self.build_legalization(
-            params, placedb, self.data_collections, self.device)
-        # detailed placement
-        self.op_collections.detailed_place_op = self.build_detailed_placement(
-            params, placedb, self.data_collections, self.device)
-        # draw placement
-        self.op_collections.draw_place_op = self.build_draw_placement(
-            params, placedb)
-
-        # flag for rmst_wl_op
-        # can only read once
-        self.read_lut_flag = True
-
-        logging.debug("build BasicPlace ops takes %.2f seconds" %
-                      (time.time() - tt))
+        return init_pos
 
     def __call__(self, params, placedb):
         """
@@ -5,6 +5,7 @@
 # @brief  Evaluation metrics
 #
 
+import json
 import time
 import torch
 import pdb
@@ -97,6 +98,21 @@ class EvalMetrics (object):
         """
         return self.__str__()
 
+    def to_dict(self):
+        """
+        @brief convert to a json serializable dict, skip metrics that are not evaluated
+        """
+        record = {}
+        for key, value in self.__dict__.items():
+            if value is None:
+                continue
+            if torch.is_tensor(value):
+                value = value.item() if value.numel() == 1 else value.tolist()
+            elif isinstance(value, tuple):
+                value = list(value)
+            record[key] = value
+        return record
+
     def evaluate(self, placedb, ops, var, data_collections=None):
         """
         @brief evaluate metrics
@@ -139,3 +155,83 @@ class EvalMetrics (object):
                 pin_utilization_map_sum = pin_utilization_map.sum()
                 self.pin_utilization = pin_utilization_map.sub_(1).clamp_(min=0).sum() / pin_utilization_map_sum
         self.eval_time = time.time() - tt
+
+
+def flatten_metrics(metrics):
+    """
+    @brief flatten the nested metrics returned by NonLinearPlace in iteration order
+    @param metrics metrics or nested lists of metrics
+    """
+    if isinstance(metrics, EvalMetrics):
+        yield metrics
+    else:
+        for metric in metrics:
+            yield from flatten_metrics(metric)
+
+
+def summarize(metrics, **kwargs):
+    """
+    @brief summary of the final solution.
+    The final metric is the last one with hpwl, overflow and max density,
+    i.e., the one extract_results reads from the log.
+    @param metrics all metrics returned by NonLinearPlace
+    @param kwargs additional fields, e.g., runtime
+    """
+    final = None
+    num_evaluations = 0
+    for metric in flatten_metrics(metrics):
+        num_evaluations += 1
+        if metric.hpwl is not None and metric.overflow is not None and metric.max_density is not None:
+            final = metric
+    record = {"type": "summary", "num_evaluations": num_evaluations}
+    if final is not None:
+        final = final.to_dict()
+        for key in ["iteration", "hpwl", "overflow", "max_density"]:
+            if key in final:
+                record[key] = final[key]
+    record.update(kwargs)
+    return record
+
+
+class MetricsSidecar (object):
+    """
+    @brief machine readable metrics written next to the log, one json object per line.
+    Each evaluation is a record with "type": "iteration", and the last line is
+    a record with "type": "summary" once the placement finishes.
+    """
+    def __init__(self, filename):
+        """
+        @brief initialization
+        @param filename path of the json lines file, truncated if it exists
+        """
+        self.filename = filename
+        self.file = open(filename, "w", encoding="utf8", buffering=1)
+
+    def write(self, metric, stage):
+        """
+        @brief append one evaluation
+        @param metric EvalMetrics
+        @param stage placement stage, e.g., global, legalize, detailed
+        """
+        record = {"type": "iteration", "stage": stage}
+        record.update(metric.to_dict())
+        self.file.write(json.dumps(record) + "\n")
+
+    def summary(self, metrics, **kwargs):
+        """
+        @brief append the summary of the final solution and close the file
+        @param metrics all metrics returned by NonLinearPlace
+        @param kwargs additional fields, e.g., runtime
+        @return the summary record
+        """
+        record = summarize(metrics, **kwargs)
+        self.file.write(json.dumps(record) + "\n")
+        self.close()
+        return record
+
+    def close(self):
+        """
+        @brief close the file
+        """
+        if not self.file.closed:
+            self.file.close()
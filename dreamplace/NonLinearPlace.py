@@ -44,11 +44,12 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         """
         super(NonLinearPlace, self).__init__(params, placedb, timer)
 
-    def __call__(self, params, placedb):
+    def __call__(self, params, placedb, sidecar=None):
         """
         @brief Top API to solve placement.
         @param params parameters
         @param placedb placement database
+        @param sidecar optional EvalMetrics.MetricsSidecar to record every evaluation
         """
         iteration = 0
         all_metrics = []
@@ -421,6 +422,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
 
                     # actually reports the metric before step
                     logging.info(cur_metric)
+                    if sidecar is not None:
+                        sidecar.write(cur_metric, "global")
                     # record the best outer cell overflow
                     if (
                         best_metric[0] is None
@@ -887,6 +890,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 placedb, {"hpwl": self.op_collections.hpwl_op}, self.pos[0]
             )
             logging.info(cur_metric)
+            if sidecar is not None:
+                sidecar.write(cur_metric, "initial")
 
         # dump global placement solution for legalization
         if params.dump_global_place_solution_flag:
@@ -936,6 +941,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 )
 
             logging.info(cur_metric)
+            if sidecar is not None:
+                sidecar.write(cur_metric, "legalize")
             iteration += 1
 
         # plot placement
@@ -969,6 +976,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 self.pos[0],
             )
             logging.info(cur_metric)
+            if sidecar is not None:
+                sidecar.write(cur_metric, "detailed")
             iteration += 1
 
         # save results
@@ -0,0 +1,175 @@
+##
+# @file   PlacementSession.py
+# @brief  Keep the placement database and ops resident across runs
+#         that only differ in the macro placement.
+#
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import torch
+
+# for consistency between python2 and python3
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+import EvalMetrics  # noqa: E402
+import NonLinearPlace  # noqa: E402
+import Params  # noqa: E402
+import PlaceDB  # noqa: E402
+import Placer  # noqa: E402
+
+import dreamplace.configure as configure  # noqa: E402
+
+
+class PlacementSession(object):
+    """
+    @brief The refine flow of Placer.place for a sequence of macro placements of one design.
+    The design is read and the ops in BasicPlace are built once. Each run restores
+    the node locations of the benchmark, applies the macro placement, reseeds
+    the random generators and runs NonLinearPlace, so it starts from the same
+    state as a fresh Placer.place.
+    """
+
+    def __init__(self, params):
+        """
+        @brief read the design and build the ops
+        @param params parameters
+        """
+        assert (not params.gpu) or configure.compile_configurations[
+            "CUDA_FOUND"
+        ] == "TRUE", "CANNOT enable GPU without CUDA compiled"
+        # the timer updates net weights in placedb during placement, which cannot be reused
+        assert (
+            not params.timing_opt_flag
+        ), "timing-driven placement is not supported, use Placer.place"
+        self.params = params
+
+        np.random.seed(params.random_seed)
+        tt = time.time()
+        self.placedb = PlaceDB.PlaceDB()
+        self.placedb(params)
+        # locations in the benchmark, restored before each run
+        self.node_x = self.placedb.node_x.copy()
+        self.node_y = self.placedb.node_y.copy()
+        logging.info("reading database takes %.2f seconds" % (time.time() - tt))
+
+        tt = time.time()
+        self.placer = NonLinearPlace.NonLinearPlace(params, self.placedb, None)
+        logging.info(
+            "non-linear placement initialization takes %.2f seconds"
+            % (time.time() - tt)
+        )
+        self.num_runs = 0
+
+    def load(self, macro_placement: Union[str, Dict[str, Tuple[int, int]]]):
+        """
+        @brief restore the benchmark locations and apply a macro placement
+        @param macro_placement path of a .gp.pl file, or a dict from node name to
+        bottom left (x, y) in the same coordinates as the .gp.pl file
+        """
+        placedb = self.placedb
+        placedb.node_x[:] = self.node_x
+        placedb.node_y[:] = self.node_y
+        if isinstance(macro_placement, str):
+            Placer.read_pl_file(placedb, macro_placement, self.params.shift_factor)
+        else:
+            shift_x, shift_y = self.params.shift_factor
+            for node_name, (x, y) in macro_placement.items():
+                idx = placedb.node_name2id_map[node_name]
+                placedb.node_x[idx] = x - shift_x
+                placedb.node_y[idx] = y - shift_y
+
+    def run(
+        self,
+        macro_placement: Union[str, Dict[str, Tuple[int, int]]],
+        result_dir: str = None,
+    ) -> Dict:
+        """
+        @brief place the design with one macro placement
+        @param macro_placement see load
+        @param result_dir if given, write the solution and metrics.jsonl to
+        result_dir/design as Placer.place does
+        @return summary of the final solution, see EvalMetrics.summarize
+        """
+        params, placedb, placer = self.params, self.placedb, self.placer
+        tt = time.time()
+        # same random state as a fresh Placer.place
+        np.random.seed(params.random_seed)
+        torch.manual_seed(params.random_seed)
+        self.load(macro_placement)
+        placer.init_pos = placer.initialize_position(params, placedb)
+        with torch.no_grad():
+            placer.pos[0].data.copy_(
+                torch.from_numpy(placer.init_pos).to(placer.device)
+            )
+
+        sidecar = None
+        if result_dir is not None:
+            path = os.path.join(result_dir, params.design_name())
+            os.makedirs(path, exist_ok=True)
+            sidecar = EvalMetrics.MetricsSidecar(os.path.join(path, "metrics.jsonl"))
+        try:
+            metrics = placer(params, placedb, sidecar)
+        except BaseException:
+            if sidecar is not None:
+                sidecar.close()
+            raise
+        logging.info("non-linear placement takes %.2f seconds" % (time.time() - tt))
+        self.num_runs += 1
+
+        info = {"design": params.design_name(), "place_time": time.time() - tt}
+        if sidecar is None:
+            return EvalMetrics.summarize(metrics, **info)
+        summary = sidecar.summary(metrics, **info)
+        gp_out_file = os.path.join(
+            path, "%s.gp.%s" % (params.design_name(), params.solution_file_suffix())
+        )
+        placedb.write(params, gp_out_file)
+        return summary
+
+
+if __name__ == "__main__":
+    # e.g., python dreamplace/PlacementSession.py --config test/ispd2005/adaptec1.json
+    #     --pl a/adaptec1.gp.pl b/adaptec1.gp.pl --result_dirs a_detailed b_detailed
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--pl", nargs="+", required=True)
+    parser.add_argument("--result_dirs", nargs="*", default=None)
+    # rerun the last .gp.pl with a new session and compare with the resident one
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+    if args.result_dirs:
+        assert len(args.result_dirs) == len(args.pl)
+
+    logging.root.name = "DREAMPlace"
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(levelname)-7s] %(name)s - %(message)s",
+        stream=sys.stdout,
+    )
+    params = Params.Params()
+    params.load(args.config)
+    os.environ["OMP_NUM_THREADS"] = "%d" % (params.num_threads)
+
+    tt = time.time()
+    session = PlacementSession(params)
+    logging.info("session setup takes %.3f seconds" % (time.time() - tt))
+    summaries = []
+    for i, pl_file in enumerate(args.pl):
+        result_dir = args.result_dirs[i] if args.result_dirs else None
+        summaries.append(session.run(pl_file, result_dir))
+        print(json.dumps({"pl": pl_file, **summaries[-1]}))
+
+    if args.check:
+        fresh = PlacementSession(params).run(args.pl[-1])
+        for key in ["hpwl", "overflow"]:
+            logging.info(
+                "%s resident %g fresh %g" % (key, summaries[-1][key], fresh[key])
+            )
@@ -19,6 +19,7 @@ import numpy as np
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if root_dir not in sys.path:
     sys.path.append(root_dir)
+import EvalMetrics  # noqa: E402
 import NonLinearPlace  # noqa: E402
 import Params  # noqa: E402
 import PlaceDB  # noqa: E402
@@ -151,19 +152,28 @@ def place(params):
         # timer.dump_pin_cap("pin_caps.txt")
         # timer.dump_graph("timing_graph.txt")
 
+    # machine readable metrics next to result.log, read by extract_results
+    path = "%s/%s" % (params.result_dir, params.design_name())
+    os.makedirs(path, exist_ok=True)
+    sidecar = EvalMetrics.MetricsSidecar(os.path.join(path, "metrics.jsonl"))
+
     # solve placement
     tt = time.time()
     placer = NonLinearPlace.NonLinearPlace(params, placedb, timer)
     logging.info(
         "non-linear placement initialization takes %.2f seconds" % (time.time() - tt)
     )
-    metrics = placer(params, placedb)
-    logging.info("non-linear placement takes %.2f seconds" % (time.time() - tt))
+    try:
+        metrics = placer(params, placedb, sidecar)
+        logging.info("non-linear placement takes %.2f seconds" % (time.time() - tt))
+        sidecar.summary(
+            metrics, design=params.design_name(), place_time=time.time() - tt
+        )
+    finally:
+        # keep the records written so far if placement fails
+        sidecar.close()
 
     # write placement solution
-    path = "%s/%s" % (params.result_dir, params.design_name())
-    if not os.path.exists(path):
-        os.system("mkdir -p %s" % (path))
     gp_out_file = os.path.join(
         path, "%s.gp.%s" % (params.design_name(), params.solution_file_suffix())
     )
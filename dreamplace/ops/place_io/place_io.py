@@ -6,6 +6,8 @@
 import os
 import sys
 
+import numpy as np
+
 from torch.autograd import Function
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -79,3 +81,36 @@ class PlaceIOFunction(Function):
         @param node_y y coordinates of cells, only need movable cells
         """
         return place_io_cpp.apply(raw_db, node_x, node_y)
+
+    @staticmethod
+    def dataflow(
+        raw_db, depth, filename=None, comb_depth=64, mode="propagate", num_threads=0
+    ):
+        """
+        @brief compute macro-to-macro dataflow, weighted by 0.5^k for k registers on the way.
+        mode "propagate" propagates sparse vectors level by level over the directed pin graph.
+        Walks instead of simple paths are counted, which differs from the DFS in dDataflowCaler
+        only when the netlist has loops; combinational loops are cut after comb_depth hops.
+        mode "dfs" keeps the simple path semantics and runs one DFS per macro on a thread pool.
+        @param raw_db original placement database
+        @param depth maximum number of registers between two macros
+        @param filename if given, write the result as macro2macro .npz (CSR with macro names)
+        @param comb_depth maximum number of cells between two registers, propagate mode only
+        @param mode propagate|dfs
+        @param num_threads number of threads for dfs mode, 0 for all cores
+        @return macro names, data, indices, indptr
+        """
+        macro_name, data, indices, indptr = place_io_cpp.dataflow(
+            raw_db, depth, comb_depth, mode, num_threads
+        )
+        if filename:
+            tmp_file = filename + ".tmp.npz"
+            np.savez(
+                tmp_file,
+                macro_name=np.array(macro_name, dtype=str),
+                data=data,
+                indices=indices.astype(np.int32),
+                indptr=indptr.astype(np.int32),
+            )
+            os.replace(tmp_file, filename)
+        return macro_name, data, indices, indptr
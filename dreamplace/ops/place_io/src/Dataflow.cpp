@@ -1,10 +1,13 @@
 #include <spdlog/spdlog.h>
+#include <algorithm>
 #include <cassert>
 #include <cmath>
 #include <iomanip>
 #include <iostream>
 #include <unordered_set>
 
+#include <omp.h>
+
 #include "Dataflow.h"
 #include "Net.h"
 #include "Node.h"
@@ -141,6 +144,92 @@ std::vector<dPath> dDataflowCaler::DFS(dStack& s) {
     return dPathList;
 }
 
+// 与 DFS 相同的遍历，但不保存路径，直接把 0.5^k 累加到 row；
+// paths 非空时额外保存路径，仅用于调试
+unsigned long dDataflowCaler::DFSAccumulate(dStack& s,
+                                            dSparseVector& row,
+                                            std::vector<dPath>* paths) const {
+    unsigned long numPath = 0;
+    if (!s.empty() && s.depth() < _depthMax) {
+        dPathNode const& n = s.back();
+        dNode const& boundary = *n.endNode();
+        for (dPathNode neighborNode : boundary.getNeighbors(*this)) {
+            if (s.is_inPath(neighborNode) != 0 || neighborNode.endNode()->is_IOPin()) {
+                continue;  // 跳过该 node
+            } else if (neighborNode.endNode()->is_Macro()) {
+                // 路径上 register 个数就是 s.depth()，终点 macro 不计
+                row.add(neighborNode.endNode()->macro_id(), powf64(0.5, s.depth()));
+                ++numPath;
+                if (paths != nullptr) {
+                    dPath newPath(s.getPath());
+                    newPath.add(neighborNode);
+                    paths->push_back(newPath);
+                }
+            } else {
+                s.push(neighborNode);
+                numPath += DFSAccumulate(s, row, paths);
+                s.pop();
+            }
+        }
+    }
+    return numPath;
+}
+
+// 每个 macro 的 DFS 作为一个独立任务并行执行，各自累加到 flow 矩阵中自己的那一行，
+// 内存只与线程数和非零元素个数有关。路径的遍历和求和顺序与 compute() 相同，结果一致
+void dDataflowCaler::computeParallel(unsigned int numThreads, bool dumpPath) {
+    if (_dNodeList.empty()) {
+        dNodeInit();
+    }
+    if (numThreads == 0) {
+        numThreads = omp_get_max_threads();
+    }
+    spdlog::info("macro num: {}, threads: {}", _numMacro, numThreads);
+
+    std::vector<dNode const*> macros = macroList();
+    std::vector<std::vector<std::pair<unsigned int, double>>> rows(_numMacro);
+    std::vector<std::vector<dPath>> macroPaths(dumpPath ? _numMacro : 0);
+    std::atomic<unsigned int> cnt(0);
+    std::atomic<unsigned long> totalPath(0);
+#pragma omp parallel num_threads(numThreads)
+    {
+        dSparseVector row;
+        row.resize(_numMacro);
+        dStack s;
+#pragma omp for schedule(dynamic, 1)
+        for (unsigned int i = 0; i < _numMacro; ++i) {
+            row.clear();
+            s.init(*macros[i]);
+            unsigned long numPath = DFSAccumulate(s, row, dumpPath ? &macroPaths[i] : nullptr);
+            std::vector<unsigned int> index = row.index();
+            std::sort(index.begin(), index.end());
+            for (unsigned int j : index) {
+                rows[i].emplace_back(j, row.at(j));
+            }
+            totalPath += numPath;
+            spdlog::info("{}/{}: macro {} has {} paths, total {} paths", ++cnt, _numMacro,
+                         macros[i]->node_id(), numPath, totalPath.load());
+        }
+    }
+
+    _dMacro2MacroSparse.indptr.assign(1, 0);
+    _dMacro2MacroSparse.indices.clear();
+    _dMacro2MacroSparse.data.clear();
+    for (auto const& line : rows) {
+        for (auto const& [j, df] : line) {
+            _dMacro2MacroSparse.indices.push_back(j);
+            _dMacro2MacroSparse.data.push_back(df);
+        }
+        _dMacro2MacroSparse.indptr.push_back(_dMacro2MacroSparse.indices.size());
+    }
+    if (dumpPath) {
+        _allMacro2MacroPath.clear();
+        for (auto const& paths : macroPaths) {
+            _allMacro2MacroPath.insert(_allMacro2MacroPath.end(), paths.begin(), paths.end());
+        }
+    }
+}
+
 void dDataflowCaler::computeMacro2MacroDataflow() {
     // 初始化 _dMacro2MacroFlow
     _dMacro2MacroFlow.resize(_numMacro);
@@ -163,6 +252,145 @@ void dDataflowCaler::computeMacro2MacroDataflow() {
     }
 }
 
+// 按 macro_id 排列的 macro
+std::vector<dNode const*> dDataflowCaler::macroList() const {
+    std::vector<dNode const*> macros(_numMacro, nullptr);
+    for (dNode const& node : _dNodeList) {
+        if (node.is_Macro()) {
+            macros.at(node.macro_id()) = &node;
+        }
+    }
+    return macros;
+}
+
+std::vector<std::string> dDataflowCaler::macroNames() const {
+    std::vector<std::string> names;
+    for (dNode const* node : macroList()) {
+        names.push_back(node->name());
+    }
+    return names;
+}
+
+// 把 getNeighbors 的结果合并成 node 之间的有向图，平行的 pin 对合并为边的计数
+void dDataflowCaler::buildPinGraph() {
+    unsigned int numNode = _dNodeList.size();
+    _adjStart.assign(numNode + 1, 0);
+    _adjNode.clear();
+    _adjCount.clear();
+    dSparseVector succ;
+    succ.resize(numNode);
+    for (unsigned int u = 0; u < numNode; ++u) {
+        dNode const& node = _dNodeList[u];
+        if (!node.is_IOPin()) {  // DFS 不会经过 IOPin
+            for (dPathNode const& n : node.getNeighbors(*this)) {
+                if (!n.endNode()->is_IOPin()) {
+                    succ.add(n.endNode()->node_id(), 1);
+                }
+            }
+        }
+        std::vector<unsigned int> index = succ.index();
+        std::sort(index.begin(), index.end());
+        for (unsigned int v : index) {
+            _adjNode.push_back(v);
+            _adjCount.push_back(succ.at(v));
+        }
+        succ.clear();
+        _adjStart[u + 1] = _adjNode.size();
+    }
+    spdlog::info("pin graph: {} nodes, {} edges", numNode, _adjNode.size());
+}
+
+// 从 source 出发按 register 层数逐层传播，cur 中是当前层的前沿，
+// 经过 cell 留在本层（comb），经过 register 进入下一层（nxt），到达 macro 时累加到 row。
+// 与 DFS 的区别：这里统计的是 walk 而不是简单路径，
+// 1. 同一 node/net/pin 可以在一条 walk 中重复出现（例如 register 之间的环路），
+//    只要 register 个数不超过 _depthMax 就会被计入；
+// 2. 组合逻辑环路在每一层最多传播 _combDepthMax 跳。
+// 对不含环路的数据通路，两者结果一致
+void dDataflowCaler::propagateMacro(dNode const& source,
+                                    dSparseVector& cur,
+                                    dSparseVector& nxt,
+                                    dSparseVector& comb,
+                                    dSparseVector& row) const {
+    cur.clear();
+    nxt.clear();
+    comb.clear();
+    row.clear();
+    cur.add(source.node_id(), 1);
+    for (unsigned int depth = 0; depth < _depthMax && !cur.empty(); ++depth) {
+        double weight = std::ldexp(1.0, -static_cast<int>(depth));
+        for (unsigned int hop = 0; !cur.empty(); ++hop) {
+            for (unsigned int u : cur.index()) {
+                double w = cur.at(u);
+                for (unsigned int e = _adjStart[u]; e < _adjStart[u + 1]; ++e) {
+                    unsigned int v = _adjNode[e];
+                    dNode const& neighborNode = _dNodeList[v];
+                    if (v == source.node_id()) {
+                        continue;  // 和 DFS 一样不回到起点
+                    } else if (neighborNode.is_Macro()) {
+                        row.add(neighborNode.macro_id(), w * _adjCount[e] * weight);
+                    } else if (neighborNode.is_Register()) {
+                        if (depth + 1 < _depthMax) {
+                            nxt.add(v, w * _adjCount[e]);
+                        }
+                    } else if (hop < _combDepthMax) {
+                        comb.add(v, w * _adjCount[e]);
+                    }
+                }
+            }
+            cur.clear();
+            cur.swap(comb);
+        }
+        cur.swap(nxt);
+    }
+}
+
+// 以稀疏向量逐层传播代替 DFS 枚举路径，复杂度为 O(macro 数 * 层数 * 可达边数)
+void dDataflowCaler::computePropagate(unsigned int combDepthMax) {
+    if (_dNodeList.empty()) {
+        dNodeInit();
+    }
+    _combDepthMax = combDepthMax;
+    spdlog::info("macro num: {}", _numMacro);
+
+    spdlog::info("start buildPinGraph");
+    buildPinGraph();
+
+    spdlog::info("start propagate dataflow");
+    dSparseVector cur, nxt, comb, row;
+    cur.resize(_dNodeList.size());
+    nxt.resize(_dNodeList.size());
+    comb.resize(_dNodeList.size());
+    row.resize(_numMacro);
+    _dMacro2MacroSparse.indptr.assign(1, 0);
+    _dMacro2MacroSparse.indices.clear();
+    _dMacro2MacroSparse.data.clear();
+    unsigned int cnt = 0;
+    for (dNode const* node : macroList()) {
+        propagateMacro(*node, cur, nxt, comb, row);
+        std::vector<unsigned int> index = row.index();
+        std::sort(index.begin(), index.end());
+        for (unsigned int j : index) {
+            _dMacro2MacroSparse.indices.push_back(j);
+            _dMacro2MacroSparse.data.push_back(row.at(j));
+        }
+        _dMacro2MacroSparse.indptr.push_back(_dMacro2MacroSparse.indices.size());
+        spdlog::info("{}: macro {} reaches {} macros", cnt++, node->node_id(), index.size());
+    }
+}
+
+// 稀疏结果转为 _dMacro2MacroFlow，供 print/writeMacro2MacroFlow 使用
+void dDataflowCaler::sparseToDense() {
+    _dMacro2MacroFlow.assign(_numMacro, std::vector<double>(_numMacro, 0));
+    for (unsigned int i = 0; i + 1 < _dMacro2MacroSparse.indptr.size(); ++i) {
+        for (unsigned int k = _dMacro2MacroSparse.indptr[i]; k < _dMacro2MacroSparse.indptr[i + 1];
+             ++k) {
+            _dMacro2MacroFlow.at(i).at(_dMacro2MacroSparse.indices[k]) =
+                _dMacro2MacroSparse.data[k];
+        }
+    }
+}
+
 void dDataflowCaler::printMacro2MacroFlow() const {
     const unsigned int width = 10;
     std::cout << std::setw(width) << " ";
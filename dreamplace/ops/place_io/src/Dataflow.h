@@ -1,5 +1,6 @@
 #pragma once
 
+#include <atomic>
 #include <cassert>
 #include <iomanip>
 #include <iostream>
@@ -116,10 +117,11 @@ class dNode {
     unsigned int _macro_id_ori;  // PlaceDB 中的 macro id
     DreamPlace::Node const* _node;
     DreamPlace::Macro const* _macro;
-    dPlaceDB const& _db;
+    DreamPlace::PlaceDB const& _db;
 
   public:
-    dNode(DreamPlace::Node const& node, std::string const& name, dPlaceDB const& db) : _db(db) {
+    dNode(DreamPlace::Node const& node, std::string const& name, DreamPlace::PlaceDB const& db)
+        : _db(db) {
         _node = &node;
         _name = name;
         _node_id = _db.nodeName2Index().at(name);
@@ -147,7 +149,7 @@ class dNode {
             }
         }
     }
-    dNode(DreamPlace::Macro const& macro, dPlaceDB const& db) : _db(db) {
+    dNode(DreamPlace::Macro const& macro, DreamPlace::PlaceDB const& db) : _db(db) {
         assert("Abandoned");
 
         _name = macro.name();
@@ -405,13 +407,60 @@ class dStack {
 
 typedef std::vector<std::vector<double>> dDataflow;
 // typedef std::unordered_map<std::string, std::unordered_map<std::string, double>> dDataflow;
+
+// 按行压缩存储的 macro2macro dataflow，与 macro2macro.npz 的 data/indices/indptr 一致
+struct dSparseDataflow {
+    std::vector<unsigned int> indptr;
+    std::vector<unsigned int> indices;
+    std::vector<double> data;
+};
+
+// 稠密存储、同时记录非零位置的向量，clear 的代价只和非零个数有关
+class dSparseVector {
+  private:
+    std::vector<double> _value;
+    std::vector<unsigned int> _index;
+
+  public:
+    void resize(unsigned int n) {
+        _value.assign(n, 0);
+        _index.clear();
+    }
+    void add(unsigned int i, double w) {
+        if (_value[i] == 0) {
+            _index.push_back(i);
+        }
+        _value[i] += w;
+    }
+    double at(unsigned int i) const { return _value[i]; }
+    std::vector<unsigned int> const& index() const { return _index; }
+    bool empty() const { return _index.empty(); }
+    void clear() {
+        for (unsigned int i : _index) {
+            _value[i] = 0;
+        }
+        _index.clear();
+    }
+    void swap(dSparseVector& rhs) {
+        _value.swap(rhs._value);
+        _index.swap(rhs._index);
+    }
+};
+
 class dDataflowCaler {
   private:
-    dPlaceDB const& _db;
+    DreamPlace::PlaceDB const& _db;
     std::vector<dNode> _dNodeList;
     std::vector<dPath> _allMacro2MacroPath;
     dDataflow _dMacro2MacroFlow;
+    dSparseDataflow _dMacro2MacroSparse;
+    // 有向 pin 图，_adjNode[_adjStart[u] : _adjStart[u + 1]] 为 u 的后继，
+    // _adjCount 为 u 的 output pin 与后继的 input pin 在同一 net 上的 pin 对个数
+    std::vector<unsigned int> _adjStart;
+    std::vector<unsigned int> _adjNode;
+    std::vector<double> _adjCount;
     unsigned int _depthMax;
+    unsigned int _combDepthMax;
     unsigned int _numMacro;
     unsigned int _numRegister;
     unsigned int _numIOPin;
@@ -421,12 +470,17 @@ class dDataflowCaler {
     void computeMacro2MacroPath();
     void computeMacro2MacroDataflow();
     void compute();  // TODO! 修改返回值类型
+    void buildPinGraph();
+    void computePropagate(unsigned int combDepthMax = 64);
+    void computeParallel(unsigned int numThreads = 0, bool dumpPath = false);
+    void sparseToDense();
     void printMacro2MacroFlow() const;
     void printMacro2MacroPath() const;
     void writeMacro2MacroFlow(std::string const& filename) const;
 
   public:
-    dDataflowCaler(dPlaceDB const& _db, unsigned int depth) : _db(_db), _depthMax(depth) {
+    dDataflowCaler(DreamPlace::PlaceDB const& _db, unsigned int depth)
+        : _db(_db), _depthMax(depth), _combDepthMax(64) {
         dNodeInit();
     }
     ~dDataflowCaler() {}
@@ -434,7 +488,16 @@ class dDataflowCaler {
     unsigned int getNumMacro() const { return _numMacro; }
     dDataflow const& getdMacro2MacroFlow() const { return _dMacro2MacroFlow; }
     dDataflow getdMacro2MacroFlow() { return _dMacro2MacroFlow; }
+    dSparseDataflow const& getSparseMacro2MacroFlow() const { return _dMacro2MacroSparse; }
+    std::vector<std::string> macroNames() const;
 
   private:
     std::vector<dPath> DFS(dStack& s);  // TODO! 存储 dNode 还是 dNode const& ?
+    unsigned long DFSAccumulate(dStack& s, dSparseVector& row, std::vector<dPath>* paths) const;
+    std::vector<dNode const*> macroList() const;
+    void propagateMacro(dNode const& source,
+                        dSparseVector& cur,
+                        dSparseVector& nxt,
+                        dSparseVector& comb,
+                        dSparseVector& row) const;
 };
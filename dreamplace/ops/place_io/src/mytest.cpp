@@ -281,7 +281,21 @@ char* strcat_n(const char* s1, const char* s2) {
     return result;
 }
 
-void ispd2005(const char* benchmark, int depth) {
+// mode: dfs 枚举简单路径；parallel 每个 macro 的 DFS 并行执行，不保存路径；
+// propagate 按 register 层数稀疏传播
+void computeDataflow(dDataflowCaler& cdf, std::string const& mode) {
+    if (mode == "propagate") {
+        cdf.computePropagate();
+        cdf.sparseToDense();
+    } else if (mode == "parallel") {
+        cdf.computeParallel();
+        cdf.sparseToDense();
+    } else {
+        cdf.compute();
+    }
+}
+
+void ispd2005(const char* benchmark, int depth, std::string const& mode = "dfs") {
     int argc = 5;
     std::stringstream dir_stream;
     dir_stream << "benchmarks/ispd2005/" << benchmark;
@@ -296,7 +310,7 @@ void ispd2005(const char* benchmark, int depth) {
 
     spdlog::info("start calculate dataflow\n");
     dDataflowCaler cdf(db, depth);
-    cdf.compute();
+    computeDataflow(cdf, mode);
     spdlog::info("end calculate dataflow\n");
 
     std::stringstream csv_stream;
@@ -336,7 +350,7 @@ void debugFunction_ispd2015(dPlaceDB const& db) {
     std::cout << std::endl;
 }
 
-void ispd2015(const char* benchmark, unsigned int depth) {
+void ispd2015(const char* benchmark, unsigned int depth, std::string const& mode = "dfs") {
     int argc = 11;
     std::stringstream dir_stream;
     dir_stream << "benchmarks/ispd2015/" << benchmark;
@@ -374,7 +388,7 @@ void ispd2015(const char* benchmark, unsigned int depth) {
 
     debugFunction_ispd2015(db);
 
-    cdf.compute();
+    computeDataflow(cdf, mode);
     spdlog::info("end calculate dataflow\n");
 
     std::stringstream csv_stream;
@@ -410,7 +424,7 @@ void debugFunction_ispd2019(dPlaceDB const& db) {
     std::cout << std::endl;
 }
 
-void ispd2019(const char* benchmark, unsigned int depth) {
+void ispd2019(const char* benchmark, unsigned int depth, std::string const& mode = "dfs") {
     int argc = 7;
     std::stringstream dir_stream;
     dir_stream << "benchmarks/ispd2019/" << benchmark;
@@ -438,7 +452,7 @@ void ispd2019(const char* benchmark, unsigned int depth) {
 
     debugFunction_ispd2019(db);
 
-    cdf.compute();
+    computeDataflow(cdf, mode);
     spdlog::info("end calculate dataflow\n");
 
     std::stringstream csv_stream;
@@ -455,10 +469,14 @@ int main(int argc, char* argv[]) {
     assert(argc >= 2);
     const char* benchmark = argv[1];
     int depth = 3;
-    if (argc == 3) {
+    if (argc >= 3) {
         depth = atoi(argv[2]);
     }
-    ispd2005(benchmark, depth);
+    std::string mode = "dfs";
+    if (argc >= 4) {
+        mode = argv[3];
+    }
+    ispd2005(benchmark, depth, mode);
     // ispd2015(benchmark, depth);
     // ispd2019(benchmark, depth);
     // decode();
@@ -6,6 +6,7 @@
  */
 
 #include "PyPlaceDB.h"
+#include "Dataflow.h"
 
 DREAMPLACE_BEGIN_NAMESPACE
 
@@ -138,6 +139,33 @@ PlaceDB place_io_forward(pybind11::list const& args) {
     return db;
 }
 
+/// macro2macro dataflow, return (macro names, data, indices, indptr) in CSR format
+/// mode: propagate (sparse propagation over walks) or dfs (simple paths, one task per macro)
+pybind11::tuple place_io_dataflow(PlaceDB const& db,
+                                  unsigned int depth,
+                                  unsigned int combDepth,
+                                  std::string const& mode,
+                                  unsigned int numThreads) {
+    dDataflowCaler cdf(db, depth);
+    if (mode == "propagate") {
+        cdf.computePropagate(combDepth);
+    } else if (mode == "dfs") {
+        cdf.computeParallel(numThreads);
+    } else {
+        dreamplaceAssertMsg(false, "unknown dataflow mode %s", mode.c_str());
+    }
+    dSparseDataflow const& flow = cdf.getSparseMacro2MacroFlow();
+
+    pybind11::list names;
+    for (std::string const& name : cdf.macroNames()) {
+        names.append(name);
+    }
+    return pybind11::make_tuple(
+        names, pybind11::array_t<double>(flow.data.size(), flow.data.data()),
+        pybind11::array_t<unsigned int>(flow.indices.size(), flow.indices.data()),
+        pybind11::array_t<unsigned int>(flow.indptr.size(), flow.indptr.data()));
+}
+
 DREAMPLACE_END_NAMESPACE
 
 // create Python binding
@@ -186,4 +214,8 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
         [](DREAMPLACE_NAMESPACE::PlaceDB const& db) { return DREAMPLACE_NAMESPACE::PyPlaceDB(db); },
         "Convert PlaceDB to PyPlaceDB");
     m.def("forward", &DREAMPLACE_NAMESPACE::place_io_forward, "PlaceDB IO Read");
+    m.def("dataflow", &DREAMPLACE_NAMESPACE::place_io_dataflow,
+          "Macro-to-macro dataflow", pybind11::arg("db"), pybind11::arg("depth"),
+          pybind11::arg("comb_depth") = 64, pybind11::arg("mode") = "propagate",
+          pybind11::arg("num_threads") = 0);
 }
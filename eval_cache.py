@@ -0,0 +1,107 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+
+from place_db import PlaceDB
+from utils import PlaceRecord, PlacerTrace
+
+
+class EvalCache:
+    # placer 结果的 LRU 缓存。placer 是确定性的，结果只取决于放置顺序和 guiding 位置，
+    # 因此以二者的哈希为 key，保存放置结果、目标值和 trace。
+    # 所有存取都返回副本，调用方可以直接修改（例如 swap）而不影响缓存
+    def __init__(self, placedb: PlaceDB, max_bytes: int = 256 << 20) -> None:
+        self.node_index = placedb.node_index
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, node_name_ls: List[str], place_record: PlaceRecord) -> bytes:
+        node_idx = np.fromiter(
+            (self.node_index[node_name] for node_name in node_name_ls),
+            dtype=np.int64,
+            count=len(node_name_ls),
+        )
+        h = hashlib.blake2b(digest_size=16)
+        h.update(node_idx.tobytes())
+        h.update(place_record.grid_x[node_idx].tobytes())
+        h.update(place_record.grid_y[node_idx].tobytes())
+        # port 直接使用 guiding 中的坐标
+        h.update(place_record.bottom_left_x[node_idx].tobytes())
+        h.update(place_record.bottom_left_y[node_idx].tobytes())
+        return h.digest()
+
+    @staticmethod
+    def entry_bytes(place_record: PlaceRecord, trace: PlacerTrace) -> int:
+        # 估计值：数组本身加上 order 和 trace 中的 python 对象
+        nbytes = sum(
+            array.nbytes
+            for array in [
+                place_record.placed,
+                place_record.grid_x,
+                place_record.grid_y,
+                place_record.bottom_left_x,
+                place_record.bottom_left_y,
+                place_record.scaled_width,
+                place_record.scaled_height,
+                place_record.center_x,
+                place_record.center_y,
+            ]
+        )
+        nbytes += 8 * len(place_record.order)
+        if trace is not None:
+            nbytes += 200 * len(trace)
+        return nbytes
+
+    def get(self, key: bytes) -> Tuple[PlaceRecord, float, PlacerTrace]:
+        # 未命中时返回 None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        place_record, value, trace, _ = entry
+        return (
+            place_record.copy(),
+            value,
+            trace.copy() if trace is not None else None,
+        )
+
+    def put(
+        self,
+        key: bytes,
+        place_record: PlaceRecord,
+        value: float,
+        trace: PlacerTrace = None,
+    ):
+        if key in self.entries:
+            return
+        nbytes = self.entry_bytes(place_record, trace)
+        if nbytes > self.max_bytes:
+            return
+        while self.bytes + nbytes > self.max_bytes:
+            _, (_, _, _, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        self.entries[key] = (
+            place_record.copy(),
+            value,
+            trace.copy() if trace is not None else None,
+            nbytes,
+        )
+        self.bytes += nbytes
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (
+            f"eval cache: {self.hits} hits, {self.misses} misses, "
+            f"hit rate {hit_rate:.4f}, {len(self.entries)} entries, "
+            f"{self.bytes / (1 << 20):.1f}MB, {self.evictions} evictions"
+        )
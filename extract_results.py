@@ -1,24 +1,66 @@
+import json
 import os
 import pandas as pd
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Tuple
 from common import method_list, benchmark_list
 
 
+def reverse_lines(file_name: str, block_size: int = 1 << 16) -> Iterator[str]:
+    # 从文件末尾按块向前读取，逐行倒序返回，只读取到需要的行为止
+    with open(file_name, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + tail).split(b"\n")
+            # 第一行可能不完整，与前一块拼接后再返回
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                yield line.decode("utf8", errors="replace")
+        yield tail.decode("utf8", errors="replace")
+
+
+def read_summary(file_name: str) -> Dict:
+    # Placer.place 写在 metrics.jsonl 最后一行的 summary，没有时（运行中断）返回 None
+    for line in reverse_lines(file_name):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:  # 中断时写了一半的行
+            return None
+        return record if record.get("type") == "summary" else None
+    return None
+
+
 def extract_one_log(file_name: str) -> Tuple[float, float]:
+    # 优先使用 result.log 同目录下的 metrics.jsonl；没有 summary 说明运行没有完成，返回 (0, 0)。
+    # 没有 metrics.jsonl 的旧结果从 result.log 末尾向前查找最后的结果
+    metrics_file = os.path.join(os.path.dirname(file_name), "metrics.jsonl")
+    if os.path.exists(metrics_file):
+        summary = read_summary(metrics_file)
+        if summary is None or "hpwl" not in summary:
+            return 0, 0
+        overflow = summary["overflow"]
+        if isinstance(overflow, list):
+            overflow = overflow[-1]
+        # metrics.jsonl 保存完整精度，按 result.log 中的 %.6E 舍入，
+        # 保证与从日志读取的结果一致（grid_search 按 hpwl == min_hpwl 选取配置）
+        return float("%.6E" % summary["hpwl"]), float("%.6E" % overflow)
+
     hpwl = 0
     overflow = 0
-    with open(file_name, "r", encoding="utf8") as f:
-        lines = f.readlines()
-        lines.reverse()
-        for line in lines:
-            if "wHPWL" in line and "Overflow" in line and "MaxDensity" in line:
-                line = line.split(",")
-                for piece in line:
-                    if "wHPWL" in piece:
-                        hpwl = float(piece.split()[-1])
-                    elif "Overflow" in piece:
-                        overflow = float(piece.split()[-1])
-                break
+    for line in reverse_lines(file_name):
+        if "wHPWL" in line and "Overflow" in line and "MaxDensity" in line:
+            line = line.split(",")
+            for piece in line:
+                if "wHPWL" in piece:
+                    hpwl = float(piece.split()[-1])
+                elif "Overflow" in piece:
+                    overflow = float(piece.split()[-1])
+            break
     return hpwl, overflow
 
 
@@ -1,7 +1,7 @@
 import os
 from common import grid_setting, benchmark_list
-from place_db import PlaceDB, Pin, Net
-from utils import draw_macro_placement, get_m2m_flow
+from place_db import PlaceDB, Pin, Net, NetsTokenizer
+from utils import draw_macro_placement, get_m2m_flow, m2m_flow_file
 from draw_placement import db2record
 from typing import Dict
 
@@ -55,29 +55,19 @@ def write_pl_cell(src_file: str, dst_file: str):
 
 def write_nets_cell(src_file: str, dst_file: str, placedb: PlaceDB):
     net_info: Dict[str, Net] = dict()
-    num_nets = 0
-    num_pins = 0
     with open(src_file, "r", encoding="utf8") as fread:
-        for line in fread:
-            line = line.strip()
-            if line.startswith("NumNets"):
-                num_nets = int(line.split()[-1])
-            elif line.startswith("NumPins"):
-                num_pins = int(line.split()[-1])
-            elif line.startswith("NetDegree"):
-                net_name = line.split()[-1]
-                net_info[net_name] = dict()
-            elif line.startswith("o"):
-                line = line.split()
-                node_name = line[0]
-                direc = line[1]
-                pos_x, pos_y = float(line[-1]), float(line[-2])
-                if node_name in placedb.port_to_delete:
-                    num_pins -= 1
-                else:
-                    if node_name not in net_info[net_name]:
-                        net_info[net_name][node_name] = []
-                    net_info[net_name][node_name].append(Pin(direc, pos_x, pos_y))
+        nets = NetsTokenizer(
+            fread, keep=lambda node_name: node_name not in placedb.port_to_delete
+        )
+        for net_name, _, pins in nets:
+            net_info[net_name] = dict()
+            for node_name, direc, x_offset, y_offset in pins:
+                pos_x, pos_y = y_offset, x_offset
+                if node_name not in net_info[net_name]:
+                    net_info[net_name][node_name] = []
+                net_info[net_name][node_name].append(Pin(direc, pos_x, pos_y))
+    num_nets = nets.num_nets
+    num_pins = nets.num_pins - nets.skipped_pins
     for net_name in list(net_info):
         have_in = False
         have_out = False
@@ -160,8 +150,7 @@ def for_human_preprocessing(benchmark: str):
     )
 
     # 生成布局对应的图片
-    m2m_csv_file = os.path.join("benchmarks", benchmark, "macro2macro.csv")
-    m2m_flow = get_m2m_flow(m2m_csv_file)
+    m2m_flow = get_m2m_flow(m2m_flow_file(benchmark))
     place_record = db2record(placedb, grid_size)
     pic_file = os.path.join(benchmarks_for_human_dir, f"{benchmark}_dataflow_id.png")
     draw_macro_placement(place_record, pic_file, placedb, m2m_flow, True)
@@ -1,24 +1,192 @@
+import argparse
+import glob
+import multiprocessing
 import os
-import pickle as pk
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import pandas as pd
 from typing import List, Tuple, Dict
-from extract_results import extract_all
+from extract_results import extract_one_log, read_summary
 from common import my_inf, method_list, benchmark_list
 from auto_run import run_one_hyperparameter
+import pipeline
+from pipeline import resident_executor
+from result_store import ResultStore, code_version, point_key, point_params
 
 
 SearchRecord = Dict[str, Dict[str, np.ndarray]]
 
+# 每个 point 在单独的工作目录中运行，只链接只读的输入，
+# 多个 point 并行时不会写入同一个 results_* 目录
+shared_inputs = ["benchmarks", "test", "thirdparty", "results_macro_front_*"]
+# 常驻的 detailed 进程（pipeline.resident_executor），每个运行 run_point 的进程一个，
+# 在该进程运行的所有 point 之间复用，已经构建的 PlacementSession 不再重新读取设计
+detailed_executor = None
 
-def run_all_cases(
-    method_list: List[str], benchmark_list: List[str]
-) -> Tuple[SearchRecord, SearchRecord]:
+
+def get_detailed_executor():
+    # 常驻进程异常退出（例如 GPU 内存不足）后进程池不再可用，重新创建
+    global detailed_executor
+    if detailed_executor is not None:
+        try:
+            detailed_executor.submit(int).result()
+        except BrokenProcessPool:
+            detailed_executor.shutdown()
+            detailed_executor = None
+    if detailed_executor is None:
+        detailed_executor = resident_executor()
+    return detailed_executor
+
+
+def search_points() -> List[Tuple[int, int, int]]:
     left = 0
     right = 10
     step = 1
-    candidates = np.arange(left, right + step, step)
+    points = []
+    for i in np.arange(left, right + step, step):
+        for j in np.arange(0, right - i + step, step):
+            points.append((int(i), int(j), int(10 - i - j)))
+    return points
+
+
+def run_point(
+    store_root: str,
+    method: str,
+    benchmark_list: List[str],
+    point: Tuple[int, int, int],
+    seed: int,
+    version: str,
+    max_sessions: int = None,
+):
+    # 运行一个 (method, point) 中还没有结果的 benchmark，成功的结果提交到 store；
+    # 没有提交的 benchmark 下次会重新运行。
+    # max_sessions 为常驻 detailed 进程中最多保留的设计个数，None 时每个 benchmark 保留一个
+    store = ResultStore(os.path.abspath(store_root))
+    alpha, beta, gamma = [x / 10 for x in point]
+    root = os.getcwd()
+    os.makedirs(os.path.join(store.root, "work"), exist_ok=True)
+    workdir = tempfile.mkdtemp(
+        prefix=f"{method}_{''.join(map(str, point))}_",
+        dir=os.path.join(store.root, "work"),
+    )
+    try:
+        for pattern in shared_inputs:
+            for name in glob.glob(pattern):
+                os.symlink(os.path.join(root, name), os.path.join(workdir, name))
+        os.chdir(workdir)
+        tasks = run_one_hyperparameter(
+            alpha,
+            beta,
+            gamma,
+            [method],
+            benchmark_list,
+            seed=seed,
+            detailed_executor=get_detailed_executor(),
+            max_sessions=max_sessions,
+        )
+        for b in benchmark_list:
+            # 只提交 detailed 任务成功、且 metrics.jsonl 中有 summary 的结果；
+            # 中途失败的运行在 result.log 中也有 global placement 迭代的 hpwl，不能作为结果
+            if tasks[f"detailed/{method}/{b}"].status != "done":
+                continue
+            result_dir = os.path.join(f"results_detailed_refine-EA_{method}", b)
+            metrics_file = os.path.join(result_dir, "metrics.jsonl")
+            if not os.path.exists(metrics_file) or read_summary(metrics_file) is None:
+                continue
+            hpwl, overflow = extract_one_log(os.path.join(result_dir, "result.log"))
+            if hpwl <= 0:
+                continue
+            store.commit(
+                point_params(b, method, alpha, beta, gamma, seed, version),
+                {
+                    "macro": os.path.join(f"results_macro_refine-EA_{method}", b),
+                    "detailed": os.path.join(f"results_detailed_refine-EA_{method}", b),
+                },
+                {"hpwl": hpwl, "overflow": overflow},
+            )
+    finally:
+        os.chdir(root)
+        shutil.rmtree(workdir)
 
+
+def run_all_cases(
+    method_list: List[str],
+    benchmark_list: List[str],
+    store_root: str = "result_store",
+    seed: int = 2027,
+    version: str = None,
+    jobs: int = 1,
+    max_sessions: int = None,
+    detailed_jobs: int = 1,
+) -> Tuple[SearchRecord, SearchRecord]:
+    # store 中已有结果的 (benchmark, method, point) 不再运行，中断后可以直接重新执行
+    version = version or code_version()
+    store = ResultStore(store_root)
+    points = search_points()
+
+    todo = []
+    for point in points:
+        for method in method_list:
+            missing = [
+                b
+                for b in benchmark_list
+                if not store.has(point_store_key(b, method, point, seed, version))
+            ]
+            if missing:
+                todo.append((store_root, method, missing, point, seed, version))
+    print(f"{len(todo)} (method, point) to run, code version {version}")
+    run_points(todo, jobs, max_sessions, detailed_jobs)
+
+    return search_records(store, method_list, benchmark_list, points, seed, version)
+
+
+def point_store_key(b, method, point, seed, version) -> str:
+    alpha, beta, gamma = [x / 10 for x in point]
+    return point_key(point_params(b, method, alpha, beta, gamma, seed, version))
+
+
+def run_points(
+    todo: List[Tuple],
+    jobs: int = 1,
+    max_sessions: int = None,
+    detailed_jobs: int = 1,
+):
+    # todo 中每一项为 run_point 的参数，jobs > 1 时并行运行。
+    # 每个 worker 有自己的常驻 detailed 进程（最多 jobs 个进程持有 GPU 上下文和设计），
+    # 它们共享 pipeline.detailed_slots，同时运行的 detailed placement 不超过 detailed_jobs 个
+    if jobs > 1:
+        pipeline.detailed_slots = multiprocessing.get_context("fork").Semaphore(
+            detailed_jobs
+        )
+        try:
+            with ProcessPoolExecutor(
+                max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                futures = [
+                    executor.submit(run_point, *args, max_sessions=max_sessions)
+                    for args in todo
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            pipeline.detailed_slots = None
+    else:
+        for args in todo:
+            run_point(*args, max_sessions=max_sessions)
+
+
+def search_records(
+    store: ResultStore,
+    method_list: List[str],
+    benchmark_list: List[str],
+    points: List[Tuple[int, int, int]],
+    seed: int,
+    version: str,
+) -> Tuple[SearchRecord, SearchRecord]:
+    # 没有结果的 point 为 my_inf
     search_record_hpwl: SearchRecord = {}
     search_record_congestion: SearchRecord = {}
     for method in method_list:
@@ -27,49 +195,14 @@ def run_all_cases(
         for b in benchmark_list:
             search_record_hpwl[method][b] = np.ones((11, 11)) * my_inf
             search_record_congestion[method][b] = np.ones((11, 11)) * my_inf
-
-    os.system("mkdir -p search_results")
-    for i in candidates:
-        for j in np.arange(0, right - i + step, step):
-            k = 10 - i - j
-            alpha = i / 10
-            beta = j / 10
-            gamma = k / 10
-            pivot = str(i) + str(j) + str(k)
-            dirname = f"results_v11_grid_search_{pivot}"
-            if not os.path.exists(dirname):
-                run_one_hyperparameter(alpha, beta, gamma)
-
-                os.system(f"mkdir {dirname}")
-                os.system(f"cp -r results_detailed_* {dirname}")
-                os.system(f"cp -r results_macro_* {dirname}")
-                os.system("rm -rf results_*_refine*")
-
-            # else:
-            #     with open(f"search_results/search_record_hpwl_{pivot}.pk", "rb") as f:
-            #         search_record_hpwl = pk.load(f)
-            #     with open(
-            #         f"search_results/search_record_congestion_{pivot}.pk", "rb"
-            #     ) as f:
-            #         search_record_congestion = pk.load(f)
-
-            df_hpwl, df_congestion = extract_all(method_list, benchmark_list, dirname)
-            os.system(f"mv results_hpwl.csv {dirname}")
-            os.system(f"mv results_congestion.csv {dirname}")
-
-            idx = (i, j)
-            for method in method_list:
-                for b in benchmark_list:
-                    search_record_hpwl[method][b][idx] = df_hpwl.loc[
-                        "refine-EA_" + method, b
-                    ]
-                    search_record_congestion[method][b][idx] = df_congestion.loc[
-                        "refine-EA_" + method, b
-                    ]
-            with open(f"search_results/search_record_hpwl_{pivot}.pk", "wb") as f:
-                pk.dump(search_record_hpwl, f)
-            with open(f"search_results/search_record_congestion_{pivot}.pk", "wb") as f:
-                pk.dump(search_record_congestion, f)
+            for point in points:
+                metrics = store.metrics(
+                    point_store_key(b, method, point, seed, version)
+                )
+                if metrics:
+                    idx = point[:2]
+                    search_record_hpwl[method][b][idx] = metrics["hpwl"]
+                    search_record_congestion[method][b][idx] = metrics["overflow"]
     return search_record_hpwl, search_record_congestion
 
 
@@ -111,8 +244,27 @@ if __name__ == "__main__":
     #     "bigblue3",
     #     "bigblue4",
     # ]
+    parser = argparse.ArgumentParser(description="grid search")
+    parser.add_argument("--store", default="result_store")
+    parser.add_argument("--seed", default=2027)
+    # 默认为 git HEAD，工作区有改动时带 -dirty- 和改动的哈希
+    parser.add_argument("--code_version", default=None)
+    # 同时运行的 (method, point) 个数
+    parser.add_argument("--jobs", default=1)
+    # 常驻 detailed 进程中最多保留的设计个数，默认每个 benchmark 一个
+    parser.add_argument("--max_sessions", default=None)
+    # --jobs > 1 时所有 point 中同时运行的 detailed placement 个数
+    parser.add_argument("--detailed_jobs", default=1)
+    args = parser.parse_args()
     search_record_hpwl, search_record_congestion = run_all_cases(
-        method_list, benchmark_list
+        method_list,
+        benchmark_list,
+        args.store,
+        int(args.seed),
+        args.code_version,
+        int(args.jobs),
+        int(args.max_sessions) if args.max_sessions else None,
+        int(args.detailed_jobs),
     )
     grid_search(
         method_list, benchmark_list, search_record_hpwl, search_record_congestion
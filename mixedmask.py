@@ -3,23 +3,25 @@ import csv
 import os
 import random
 import time
-import copy
 from typing import Tuple
 
 import numpy as np
 
 from common import my_inf, grid_setting
+from eval_cache import EvalCache
 from place_db import PlaceDB
+from surrogate import SwapSurrogate
 from utils import (
     M2MFlow,
     PlaceRecord,
-    Record,
+    PlacerTrace,
     cal_dataflow,
     cal_hpwl,
     cal_regularity,
     draw_macros,
     draw_macro_placement,
     get_m2m_flow,
+    m2m_flow_file,
     mixed_placer,
     rank_macros_mixed_port,
     write_final_placement,
@@ -37,25 +39,22 @@ def set_seed(seed: int):
 
 
 def db2record(placedb: PlaceDB, grid_size: int) -> PlaceRecord:
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     for node_name in placedb.node_info:
         chosen_loc_x = int(placedb.node_info[node_name].bottom_left_x / grid_size)
         chosen_loc_y = int(placedb.node_info[node_name].bottom_left_y / grid_size)
-        place_record[node_name] = Record(
+        place_record.set(
             node_name,
-            placedb.node_info[node_name].width,
-            placedb.node_info[node_name].height,
             chosen_loc_x,
             chosen_loc_y,
             placedb.node_info[node_name].bottom_left_x,
             placedb.node_info[node_name].bottom_left_y,
-            grid_size,
         )
     return place_record
 
 
 def pl2record(pl_file, placedb: PlaceDB, grid_size: int) -> PlaceRecord:
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     with open(pl_file, "r", encoding="utf8") as f:
         for line in f:
             if line.startswith("o"):
@@ -67,35 +66,26 @@ def pl2record(pl_file, placedb: PlaceDB, grid_size: int) -> PlaceRecord:
                 if node_name in placedb.node_info:
                     chosen_loc_x = bottom_left_x // grid_size
                     chosen_loc_y = bottom_left_y // grid_size
-                    place_record[node_name] = Record(
+                    place_record.set(
                         node_name,
-                        placedb.node_info[node_name].width,
-                        placedb.node_info[node_name].height,
                         chosen_loc_x,
                         chosen_loc_y,
                         bottom_left_x,
                         bottom_left_y,
-                        grid_size,
                     )
     return place_record
 
 
-def swap(node1: Record, node2: Record, grid_size: int):
-    node1.bottom_left_x, node2.bottom_left_x = node2.bottom_left_x, node1.bottom_left_x
-    node1.bottom_left_y, node2.bottom_left_y = node2.bottom_left_y, node1.bottom_left_y
-
-    node1.grid_x, node2.grid_x = node2.grid_x, node1.grid_x
-    node1.grid_y, node2.grid_y = node2.grid_y, node1.grid_y
-
-    node1.refresh(grid_size)
-    node2.refresh(grid_size)
-
-
 class Disturbance:
-    def __init__(self, placedb: PlaceDB) -> None:
+    def __init__(
+        self,
+        placedb: PlaceDB,
+        m2m_flow: M2MFlow = None,
+        surrogate: SwapSurrogate = None,
+    ) -> None:
         self.candidates = sorted(placedb.macro_name)
-        m2m_file = os.path.join("benchmarks", placedb.benchmark, "macro2macro.csv")
-        m2m_flow = get_m2m_flow(m2m_file)
+        if m2m_flow is None:
+            m2m_flow = get_m2m_flow(m2m_flow_file(placedb.benchmark))
         self.priority = np.array(
             [sum(m2m_flow[node_name].values()) for node_name in self.candidates]
         )
@@ -105,6 +95,8 @@ class Disturbance:
         #     )
         # )
         self.priority /= np.sum(self.priority)
+        # surrogate 不为空时，从按 priority 抽取的一批交换中预筛选
+        self.surrogate = surrogate
         self.action_record = None
         self.clist = [
             ("o451498", "o450953"),
@@ -116,21 +108,28 @@ class Disturbance:
         ]
         self.i = 0
 
-    def disturbance(self, place_record: PlaceRecord, grid_size: int):
-        place_record_new = copy.deepcopy(place_record)
+    def sample(self) -> Tuple[str, str]:
         node_name1, node_name2 = np.random.choice(
             self.candidates, 2, replace=False, p=self.priority
         )
+        return node_name1, node_name2
+
+    def disturbance(self, place_record: PlaceRecord, grid_size: int):
+        place_record_new = place_record.copy()
+        if self.surrogate is None:
+            node_name1, node_name2 = self.sample()
+        else:
+            node_name1, node_name2 = self.surrogate.propose(place_record, self.sample)
         # node_name1, node_name2 = self.clist[self.i]
         # self.i += 1
         print(node_name1, node_name2)
-        swap(place_record_new[node_name1], place_record_new[node_name2], grid_size)
+        place_record_new.swap(node_name1, node_name2)
         self.action_record = (node_name1, node_name2)
         return place_record_new, node_name1, node_name2
 
     def recover(self, place_record: PlaceRecord, grid_size: int):
         node_name1, node_name2 = self.action_record
-        swap(place_record[node_name1], place_record[node_name2], grid_size)
+        place_record.swap(node_name1, node_name2)
 
 
 class EvalRecord:
@@ -244,6 +243,8 @@ def refine_EA(
     mask_alpha,
     mask_beta,
     mask_gamma,
+    use_surrogate=False,
+    eval_cache: EvalCache = None,
 ) -> Tuple[PlaceRecord, EvalRecord]:
     # benchmark = "adaptec3"
     # result_dir = os.path.join("results_macro_refine-EA_dreamplace-mixed", benchmark)
@@ -255,7 +256,10 @@ def refine_EA(
     # print(node_id_ls)
 
     evaluator = Evaluator(evaluate_alpha, evaluate_beta, evaluate_gamma)
-    disturbancer = Disturbance(placedb)
+    surrogate = None
+    if use_surrogate:
+        surrogate = SwapSurrogate(placedb, sorted(placedb.macro_name), m2m_flow)
+    disturbancer = Disturbance(placedb, m2m_flow, surrogate)
 
     place_record = pl2record(pl_file, placedb, grid_size)
     eval_record = evaluator.evaluate(place_record, placedb, m2m_flow)
@@ -293,6 +297,7 @@ def refine_EA(
     # EA 迭代
     print("\nEA")
     best_placed_record, best_eval = place_record, eval_record
+    best_trace = PlacerTrace(grid_num, grid_size)
     for i in range(iter_rounds):
         print(i)
         place_record_new, node_name1, node_name2 = disturbancer.disturbance(
@@ -303,17 +308,29 @@ def refine_EA(
         node_id_ls_new.remove(node_name2)
         node_id_ls_new.insert(placedb.port_cnt, node_name2)
         node_id_ls_new.insert(placedb.port_cnt, node_name1)
-        place_record_new, is_legal = mixed_placer(
-            node_id_ls_new,
-            placedb,
-            grid_num,
-            grid_size,
-            place_record_new,
-            m2m_flow,
-            mask_alpha,
-            mask_beta,
-            mask_gamma,
-        )
+        cached = None
+        if eval_cache is not None:
+            key = eval_cache.key(node_id_ls_new, place_record_new)
+            cached = eval_cache.get(key)
+        if cached is not None:
+            place_record_new, is_legal, trace = cached
+        else:
+            # 交换的 macro 被移到了 port 之后，只能复用 port 部分的前缀
+            trace = best_trace.copy()
+            place_record_new, is_legal = mixed_placer(
+                node_id_ls_new,
+                placedb,
+                grid_num,
+                grid_size,
+                place_record_new,
+                m2m_flow,
+                mask_alpha,
+                mask_beta,
+                mask_gamma,
+                trace,
+            )
+            if eval_cache is not None:
+                eval_cache.put(key, place_record_new, is_legal, trace)
         if is_legal:
             eval_record = evaluator.evaluate(place_record_new, placedb, m2m_flow)
             eval_record.show()
@@ -327,9 +344,12 @@ def refine_EA(
                 ]
             )
             curve_fp.flush()
+        if surrogate is not None:
+            surrogate.update(best_eval.value, eval_record.value if is_legal else my_inf)
         if is_legal and eval_record < best_eval:
             best_eval = eval_record
             best_placed_record = place_record_new
+            best_trace = trace
             write_final_placement(best_placed_record, best_eval.hpwl, placement_file)
             # draw_macros(placedb, placement_file, grid_size, m2m_flow, pic_file)
         else:
@@ -346,62 +366,81 @@ def refine_EA(
     )
     curve_writer.writerow([])
     curve_fp.flush()
+    if surrogate is not None:
+        print(surrogate.report())
+    if eval_cache is not None:
+        print(eval_cache.report())
     write_final_placement(best_placed_record, best_eval.hpwl, placement_file)
     return best_placed_record, best_eval
 
 
-def main():
-    parser = argparse.ArgumentParser(description="argparse testing")
-    parser.add_argument("--dataset", required=True)
-    parser.add_argument("--seed", default=2027)
-    parser.add_argument("--iter_rounds", default=10)
-    parser.add_argument("--front", default="bbo")
-    parser.add_argument("--alpha", default=0.3)
-    parser.add_argument("--beta", default=0.3)
-    parser.add_argument("--gamma", default=0.4)
-
-    args = parser.parse_args()
-    benchmark = args.dataset
-    iter_rounds = int(args.iter_rounds)
-    seed = int(args.seed)
-    set_seed(seed)
-    front = args.front
-    evaluate_alpha = mask_alpha = float(args.alpha)
-    evaluate_beta = mask_beta = float(args.beta)
-    evaluate_gamma = mask_gamma = float(args.gamma)
-
-    grid_num = grid_setting[benchmark]["grid_num"]
+def refine_placedb(benchmark: str) -> PlaceDB:
     grid_size = grid_setting[benchmark]["grid_size"]
-
     placedb = PlaceDB(benchmark, grid_size)
     placedb.deal_center_core(scale_factor=refine_center_scaled_factor)
     placedb.deal_virtual_boundary(scale_factor=refine_virtual_boundary_scaled_factor)
-    print("#port", placedb.port_cnt)
-    print("#macro", len(placedb.macro_name))
+    return placedb
+
 
+def front_pl_file(front: str, benchmark: str) -> str:
+    # refine 的初始布局
     if front == "bbo":
-        init_macro_pl_file = os.path.join(
+        return os.path.join(
             "results_macro_front_bbo_ori", benchmark, f"{benchmark}.gp.pl"
         )
-        result_dir = os.path.join("results_macro_refine-EA_bbo", benchmark)
     elif front == "dreamplace-mixed":
-        init_macro_pl_file = os.path.join(
+        return os.path.join(
             "results_macro_front_dreamplace-mixed", benchmark, f"{benchmark}.gp.pl"
         )
-        result_dir = os.path.join("results_macro_refine-EA_dreamplace-mixed", benchmark)
     elif front == "dreamplace-macro":
-        init_macro_pl_file = os.path.join(
+        return os.path.join(
             "results_macro_front_dreamplace-macro", benchmark, f"{benchmark}.gp.pl"
         )
-        result_dir = os.path.join("results_macro_refine-EA_dreamplace-macro", benchmark)
     else:
         raise NotImplementedError
 
+
+def run_refine(
+    benchmark: str,
+    front: str,
+    alpha: float,
+    beta: float,
+    gamma: float,
+    seed: int = 2027,
+    iter_rounds: int = 10,
+    regularity_cache: bool = False,
+    use_surrogate: bool = False,
+    eval_cache_mb: int = 256,
+    placedb: PlaceDB = None,
+    m2m_flow: M2MFlow = None,
+):
+    # placedb 和 m2m_flow 为空时重新读取；不为空时必须是 refine_placedb 的结果，
+    # 可以在多次 refine 之间复用
+    set_seed(seed)
+    evaluate_alpha = mask_alpha = alpha
+    evaluate_beta = mask_beta = beta
+    evaluate_gamma = mask_gamma = gamma
+
+    grid_num = grid_setting[benchmark]["grid_num"]
+    grid_size = grid_setting[benchmark]["grid_size"]
+
+    if placedb is None:
+        placedb = refine_placedb(benchmark)
+    if regularity_cache:
+        placedb.load_regularity_mask()
+    print("#port", placedb.port_cnt)
+    print("#macro", len(placedb.macro_name))
+
+    init_macro_pl_file = front_pl_file(front, benchmark)
+    result_dir = os.path.join(f"results_macro_refine-EA_{front}", benchmark)
     if not os.path.exists(result_dir):
         os.makedirs(result_dir)
 
-    m2m_flow_file = "benchmarks/{}/macro2macro.csv".format(benchmark)
-    m2m_flow = get_m2m_flow(m2m_flow_file)
+    if m2m_flow is None:
+        m2m_flow = get_m2m_flow(m2m_flow_file(benchmark))
+    eval_cache = None
+    if eval_cache_mb > 0:
+        eval_cache = EvalCache(placedb, eval_cache_mb << 20)
 
     curve_file = os.path.join(result_dir, "curve.csv")
     placement_file = os.path.join(result_dir, "placement.csv")
@@ -423,14 +462,49 @@ def main():
         mask_alpha,
         mask_beta,
         mask_gamma,
+        use_surrogate,
+        eval_cache,
     )
     end = time.time()
     print(f"time: {end - start}s")
     write_pl_for_detailed(best_placed_macro, pl_file)
+    # 先写出 refine 的结果，缓存保存失败不影响结果
+    if regularity_cache:
+        placedb.save_regularity_mask()
 
     pic_file = os.path.join(result_dir, f"{benchmark}.png")
     draw_macros(placedb, placement_file, grid_size, m2m_flow, pic_file)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="argparse testing")
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--seed", default=2027)
+    parser.add_argument("--iter_rounds", default=10)
+    parser.add_argument("--front", default="bbo")
+    parser.add_argument("--alpha", default=0.3)
+    parser.add_argument("--beta", default=0.3)
+    parser.add_argument("--gamma", default=0.4)
+    # 从 benchmark 目录读取/保存规整度 mask 的缓存
+    parser.add_argument("--regularity_cache", action="store_true")
+    parser.add_argument("--surrogate", action="store_true")
+    # EA 评估缓存的内存上限（MB），0 表示不使用缓存
+    parser.add_argument("--eval_cache_mb", default=256)
+
+    args = parser.parse_args()
+    run_refine(
+        args.dataset,
+        args.front,
+        float(args.alpha),
+        float(args.beta),
+        float(args.gamma),
+        int(args.seed),
+        int(args.iter_rounds),
+        args.regularity_cache,
+        args.surrogate,
+        int(args.eval_cache_mb),
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,455 @@
+import argparse
+import contextlib
+import gc
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List
+
+import draw_placement
+from common import benchmark_list, method_list
+from mixedmask import front_pl_file, refine_placedb, run_refine
+from place_db import PlaceDB
+from utils import M2MFlow, get_m2m_flow, m2m_flow_file
+
+# worker 由 fork 创建，继承父进程中预先读取的 placedb；
+# 之后读取的 placedb 保存在 worker 自己的进程中，供同一 worker 的后续任务复用
+warm_placedb: Dict[str, PlaceDB] = {}
+warm_m2m_flow: Dict[str, M2MFlow] = {}
+# detailed placement 的 PlacementSession，按配置文件保存在常驻的 detailed 进程中（见 resident_executor），
+# 同一 benchmark 的后续 detailed 任务不再重新读取设计和构建算子；按最近使用的顺序排列
+warm_session: "OrderedDict[str, object]" = OrderedDict()
+# 多个进程各自有常驻的 detailed 进程时（grid_search --jobs > 1），由调用方在 fork 之前设置为共享的信号量，
+# detailed placement 在其中运行，同时运行的个数不超过信号量的初值
+detailed_slots = None
+
+
+def get_warm(benchmark: str):
+    if benchmark not in warm_placedb:
+        warm_placedb[benchmark] = refine_placedb(benchmark)
+        warm_m2m_flow[benchmark] = get_m2m_flow(m2m_flow_file(benchmark))
+    return warm_placedb[benchmark], warm_m2m_flow[benchmark]
+
+
+class Task:
+    # DAG 中的一个任务，deps 全部完成后才会提交；
+    # 任一 dep 失败或被跳过时，该任务被跳过
+    def __init__(
+        self,
+        name: str,
+        stage: str,
+        func: Callable,
+        args: tuple = (),
+        deps: List["Task"] = None,
+        log_file: str = None,
+    ) -> None:
+        self.name = name
+        self.stage = stage
+        self.func = func
+        self.args = args
+        self.deps = deps or []
+        self.log_file = log_file
+        self.status = "pending"  # pending, running, done, failed, skipped
+        self.error: str = None
+        self.start_time: float = None
+        self.end_time: float = None
+
+
+def redirect_output(log_file: str):
+    # 在 fd 层面重定向，C++ 扩展的输出也会写入 log；返回用于恢复的 fd
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    saved = os.dup(1), os.dup(2)
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    return saved
+
+
+def restore_output(saved):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(saved[0], 1)
+    os.dup2(saved[1], 2)
+    os.close(saved[0])
+    os.close(saved[1])
+
+
+def run_task(func: Callable, args: tuple, log_file: str = None, cwd: str = None):
+    # 在 worker 中执行，异常以字符串返回，避免不可序列化的异常对象；
+    # 常驻进程在两次提交之间调用方可能切换了工作目录（grid_search 的每个 point），按提交时的 cwd 执行
+    if cwd is not None:
+        os.chdir(cwd)
+    saved = None
+    if log_file is not None:
+        saved = redirect_output(log_file)
+    try:
+        func(*args)
+        return None
+    except Exception:
+        error = traceback.format_exc()
+        print(error)
+        return error
+    finally:
+        if saved is not None:
+            restore_output(saved)
+
+
+def resident_executor() -> ProcessPoolExecutor:
+    # 只有一个 worker 的常驻进程，用于 detailed stage：warm_session 保存在其中，
+    # 由调用方持有，在多次 run_one_hyperparameter 之间复用，只有这一个进程使用 GPU
+    executor = ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("fork")
+    )
+    # 在 fork 出的 worker 中创建时，进程退出前 multiprocessing 会等待所有子进程结束，
+    # 需要先关闭 executor，否则常驻进程一直等待新的任务；
+    # 优先级要高于 executor 内部 Queue 的 finalizer（10），在 Queue 关闭之前发出结束信号
+    multiprocessing.util.Finalize(executor, executor.shutdown, exitpriority=20)
+    return executor
+
+
+class Pipeline:
+    # 持久的进程池上的 DAG 调度器：每个任务在其依赖完成后立即提交，
+    # stage_limits 限制某个 stage 同时运行的任务数（例如占用 GPU 的 detailed placement），
+    # stage_executors 中的 stage 提交到调用方持有的 executor，其余提交到 run 中创建的进程池
+    def __init__(
+        self,
+        max_workers: int = 16,
+        stage_limits: Dict[str, int] = None,
+        stage_executors: Dict[str, Executor] = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.stage_limits = stage_limits or {}
+        self.stage_executors = stage_executors or {}
+        self.tasks: Dict[str, Task] = {}
+
+    def add(self, task: Task) -> Task:
+        # 依赖必须先加入，保证没有环
+        assert task.name not in self.tasks, task.name
+        for dep in task.deps:
+            assert self.tasks.get(dep.name) is dep, dep.name
+        self.tasks[task.name] = task
+        return task
+
+    def ready(self, task: Task) -> bool:
+        return all(dep.status == "done" for dep in task.deps)
+
+    def blocked(self, task: Task) -> bool:
+        return any(dep.status in ["failed", "skipped"] for dep in task.deps)
+
+    def run(self, prewarm: List[str] = None) -> Dict[str, Task]:
+        for benchmark in prewarm or []:
+            get_warm(benchmark)
+        pending = list(self.tasks.values())
+        running = {}
+        stage_running: Dict[str, int] = {}
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            while pending or running:
+                for task in pending:
+                    if self.blocked(task):
+                        task.status = "skipped"
+                        print(f"[pipeline] skip {task.name}")
+                pending = [task for task in pending if task.status == "pending"]
+                for task in pending:
+                    if len(running) >= self.max_workers:
+                        break
+                    limit = self.stage_limits.get(task.stage, self.max_workers)
+                    if (
+                        not self.ready(task)
+                        or stage_running.get(task.stage, 0) >= limit
+                    ):
+                        continue
+                    task.status = "running"
+                    task.start_time = time.time()
+                    stage_running[task.stage] = stage_running.get(task.stage, 0) + 1
+                    running[
+                        self.stage_executors.get(task.stage, executor).submit(
+                            run_task, task.func, task.args, task.log_file, os.getcwd()
+                        )
+                    ] = task
+                    print(f"[pipeline] start {task.name}")
+                pending = [task for task in pending if task.status == "pending"]
+                if not running:
+                    if pending:
+                        raise RuntimeError("no runnable task, check stage_limits")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    stage_running[task.stage] -= 1
+                    task.end_time = time.time()
+                    try:
+                        task.error = future.result()
+                    except Exception:
+                        # worker 进程异常退出
+                        task.error = traceback.format_exc()
+                    task.status = "failed" if task.error else "done"
+                    print(
+                        f"[pipeline] {task.status} {task.name} "
+                        f"{task.end_time - task.start_time:.2f}s"
+                    )
+                    if task.error:
+                        print(task.error)
+        self.report()
+        return self.tasks
+
+    def report(self):
+        for task in self.tasks.values():
+            duration = ""
+            if task.end_time is not None:
+                duration = f"{task.end_time - task.start_time:.2f}s"
+            print(f"{task.name:<48} {task.status:<8} {duration}")
+
+
+def check_front(method: str, benchmark: str):
+    # front 的结果由单独的流程生成，这里只检查其存在
+    pl_file = front_pl_file(method, benchmark)
+    if not os.path.exists(pl_file):
+        raise FileNotFoundError(pl_file)
+
+
+def refine(method, benchmark, alpha, beta, gamma, seed, iter_rounds):
+    placedb, m2m_flow = get_warm(benchmark)
+    run_refine(
+        benchmark,
+        method,
+        alpha,
+        beta,
+        gamma,
+        seed,
+        iter_rounds,
+        placedb=placedb,
+        m2m_flow=m2m_flow,
+    )
+
+
+def detailed(
+    method: str,
+    benchmark: str,
+    config: str = None,
+    resident: bool = True,
+    max_sessions: int = None,
+):
+    # 与 python dreamplace/Placer.py --type refine --method {method} 相同，
+    # 结果直接写入 results_detailed_refine-EA_{method}/{benchmark}；
+    # resident 时使用当前进程中常驻的 PlacementSession，最多保留 max_sessions 个（None 为不限），
+    # 超出时释放最久未使用的一个。
+    # PlacementSession 不支持 timing-driven placement 和外部 detailed placement，这两种情况仍调用 Placer.place
+    dreamplace_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "dreamplace"
+    )
+    if dreamplace_dir not in sys.path:
+        sys.path.insert(0, dreamplace_dir)
+    import Params
+    import Placer
+    import torch
+    from PlacementSession import PlacementSession
+
+    logging.root.name = "DREAMPlace"
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(levelname)-7s] %(name)s - %(message)s",
+        stream=sys.stdout,
+        force=True,
+    )
+    params = Params.Params()
+    params.printWelcome()
+    params.type = "refine"
+    params.method = method
+    config = config or os.path.join("test", "ispd2005", f"{benchmark}.json")
+    params.load(config)
+    params.result_dir = detailed_result_dir(method)
+    logging.info("parameters = %s" % (params))
+    os.environ["OMP_NUM_THREADS"] = "%d" % (params.num_threads)
+    tt = time.time()
+    # 见 detailed_slots
+    with detailed_slots or contextlib.nullcontext():
+        external_dp = params.detailed_place_engine and os.path.exists(
+            params.detailed_place_engine
+        )
+        if not resident or params.timing_opt_flag or external_dp:
+            Placer.place(params)
+        else:
+            # 不同 point 的工作目录中 test 是指向同一目录的链接，按实际路径区分设计
+            key = os.path.realpath(config)
+            if key in warm_session:
+                warm_session.move_to_end(key)
+            else:
+                while (
+                    warm_session
+                    and max_sessions is not None
+                    and len(warm_session) >= max_sessions
+                ):
+                    evicted, session = warm_session.popitem(last=False)
+                    logging.info("release placement session of %s" % (evicted))
+                    del session
+                    gc.collect()
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                warm_session[key] = PlacementSession(params)
+            session = warm_session[key]
+            # 画图等输出路径取自 params.result_dir
+            session.params.result_dir = params.result_dir
+            design = params.design_name()
+            pl_file = os.path.join(
+                f"results_macro_refine-EA_{method}", design, f"{design}.gp.pl"
+            )
+            session.run(pl_file, params.result_dir)
+            logging.info("session runs %d placements" % (session.num_runs))
+    logging.info("placement takes %.3f seconds" % (time.time() - tt))
+
+
+def draw(method: str, benchmark: str):
+    suffix = method.replace("-", "_")
+    getattr(draw_placement, f"draw_macro_refine_{suffix}")(benchmark)
+    getattr(draw_placement, f"draw_detailed_refine_{suffix}")(benchmark)
+
+
+def detailed_result_dir(method: str) -> str:
+    return f"results_detailed_refine-EA_{method}"
+
+
+def build_refine_pipeline(
+    method_list: List[str],
+    benchmark_list: List[str],
+    alpha: float,
+    beta: float,
+    gamma: float,
+    seed: int = 2027,
+    max_workers: int = 16,
+    detailed_jobs: int = 1,
+    resident: bool = True,
+    detailed_executor: Executor = None,
+    max_sessions: int = None,
+) -> Pipeline:
+    # 每个 (method, benchmark) 一条 front -> refine -> detailed -> draw 的链；
+    # resident 时 detailed stage 全部提交到 detailed_executor（resident_executor），依次运行
+    for method in method_list:
+        if os.path.exists(detailed_result_dir(method)):
+            raise FileExistsError(detailed_result_dir(method))
+
+    if resident:
+        assert detailed_executor is not None
+        pipeline = Pipeline(
+            max_workers, {"detailed": 1}, {"detailed": detailed_executor}
+        )
+    else:
+        pipeline = Pipeline(max_workers, {"detailed": detailed_jobs})
+    for method in method_list:
+        for b in benchmark_list:
+            front = pipeline.add(
+                Task(f"front/{method}/{b}", "front", check_front, (method, b))
+            )
+            iter_rounds = 5 if b == "bigblue4" else 20
+            refined = pipeline.add(
+                Task(
+                    f"refine/{method}/{b}",
+                    "refine",
+                    refine,
+                    (method, b, alpha, beta, gamma, seed, iter_rounds),
+                    [front],
+                    os.path.join(f"results_macro_refine-EA_{method}", b, "refine.log"),
+                )
+            )
+            placed = pipeline.add(
+                Task(
+                    f"detailed/{method}/{b}",
+                    "detailed",
+                    detailed,
+                    (method, b, None, resident, max_sessions),
+                    [refined],
+                    os.path.join(detailed_result_dir(method), b, "result.log"),
+                )
+            )
+            pipeline.add(
+                Task(
+                    f"draw/{method}/{b}",
+                    "draw",
+                    draw,
+                    (method, b),
+                    [placed],
+                    os.path.join(detailed_result_dir(method), b, "draw.log"),
+                )
+            )
+    return pipeline
+
+
+def run_one_hyperparameter(
+    alpha: float,
+    beta: float,
+    gamma: float,
+    method_list: List[str] = method_list,
+    benchmark_list: List[str] = benchmark_list,
+    max_workers: int = 16,
+    detailed_jobs: int = 1,
+    seed: int = 2027,
+    resident: bool = True,
+    detailed_executor: Executor = None,
+    max_sessions: int = None,
+) -> Dict[str, Task]:
+    # resident 时 detailed placement 在 detailed_executor 中运行，调用方传入同一个
+    # resident_executor() 即可在多次调用之间复用 PlacementSession；为空时只在本次调用中使用
+    print(f"alpha {alpha:.1f}, beta {beta:.1f}, gamma {gamma:.1f}")
+    own_executor = resident and detailed_executor is None
+    if own_executor:
+        detailed_executor = resident_executor()
+    try:
+        pipeline = build_refine_pipeline(
+            method_list,
+            benchmark_list,
+            alpha,
+            beta,
+            gamma,
+            seed,
+            max_workers=max_workers,
+            detailed_jobs=detailed_jobs,
+            resident=resident,
+            detailed_executor=detailed_executor,
+            max_sessions=max_sessions,
+        )
+        return pipeline.run(prewarm=benchmark_list)
+    finally:
+        if own_executor:
+            detailed_executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="refine pipeline")
+    parser.add_argument("--alpha", default=0.3)
+    parser.add_argument("--beta", default=0.3)
+    parser.add_argument("--gamma", default=0.4)
+    parser.add_argument("--method", nargs="+", default=method_list)
+    parser.add_argument("--dataset", nargs="+", default=benchmark_list)
+    parser.add_argument("--workers", default=16)
+    # --fresh_detailed 时同时运行的 detailed placement 个数，默认与原先一样串行
+    parser.add_argument("--detailed_jobs", default=1)
+    # 每个 detailed 任务在进程池中重新调用 Placer.place，不使用常驻的 detailed 进程
+    parser.add_argument("--fresh_detailed", action="store_true")
+    args = parser.parse_args()
+    tasks = run_one_hyperparameter(
+        float(args.alpha),
+        float(args.beta),
+        float(args.gamma),
+        args.method,
+        args.dataset,
+        int(args.workers),
+        int(args.detailed_jobs),
+        resident=not args.fresh_detailed,
+    )
+    if any(task.status != "done" for task in tasks.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
 import argparse
+import copy
+import json
 import math
 import os
+import re
+import shutil
 import numpy as np
 
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 normal_set = {"adaptec1", "adaptec2", "bigblue1"}
 delete_set = {"adaptec3", "adaptec4", "bigblue3", "bigblue4"}
+# PlaceDB 快照的格式版本，解析或预处理的逻辑变化时需要加 1，使旧快照失效
+snapshot_version = 1
+snapshot_scalars = [
+    "cell_area",
+    "node_cnt",
+    "pin_cnt",
+    "net_cnt",
+    "max_height",
+    "max_width",
+    "min_height",
+    "min_width",
+    "aver_area",
+    "port_cnt",
+]
 
 
 class Node:
@@ -62,7 +80,7 @@ def read_node_file(fopen, grid_size):
     node_info: Dict[str, Node] = {}
     node_cnt = 0
     cell_area = 0
-    for line in fopen.readlines():
+    for line in fopen:
         line = line.strip()
         if line.startswith("o") or line.startswith("p"):
             line = line.split()
@@ -80,28 +98,101 @@ def read_node_file(fopen, grid_size):
     return node_info, cell_area
 
 
+# .nets 中的三种有效行：NetDegree 行取度数和最后一个字段（net 名，可以省略），
+# pin 行取 node 名、方向和最后两个字段（x/y 偏移），以及文件头的 NumNets/NumPins；
+# 其余以 NetDegree 开头的行由最后一项匹配，解析时报错
+net_token_re = re.compile(
+    r"^[ \t]*(?:"
+    r"NetDegree[ \t]*:[ \t]*(\d+)(?:(?:[ \t]+\S+)*?[ \t]+(\S+))?"
+    r"|(o\S*)[ \t]+(\S+)(?:[ \t]+\S+)*?[ \t]+(\S+)[ \t]+(\S+)"
+    r"|(NumNets|NumPins)[ \t]*:[ \t]*(\d+)"
+    r"|(NetDegree[^\n]*?)"
+    r")[ \t]*\r?$",
+    re.M,
+)
+
+
+class NetsTokenizer:
+    # 流式读取 bookshelf .nets 文件：按大块读入，用正则逐个匹配 net 头和 pin 行，
+    # keep(node_name) 为假的 pin 直接跳过，不做切分和数值转换，
+    # 内存占用只与保留的数据有关，而不是整个文件
+    def __init__(self, fopen, keep=None, chunk_size: int = 1 << 24) -> None:
+        self.fopen = fopen
+        self.keep = keep
+        self.chunk_size = chunk_size
+        # 文件头中的 NumNets/NumPins
+        self.num_nets = 0
+        self.num_pins = 0
+        # 被 keep 过滤掉的 pin 数
+        self.skipped_pins = 0
+
+    def chunks(self):
+        # 每次产出若干完整的行
+        rest = ""
+        while True:
+            chunk = self.fopen.read(self.chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            end = chunk.rfind("\n") + 1
+            rest = chunk[end:]
+            if end > 0:
+                yield chunk[:end]
+        if rest:
+            yield rest
+
+    def __iter__(self):
+        # 每个 net 产出一次 (net_name, degree, pins)，
+        # pins 为保留的 pin 的 (node_name, direct, x_offset, y_offset)，按文件中的顺序
+        net_name, degree, pins = None, 0, []
+        for chunk in self.chunks():
+            for match in net_token_re.finditer(chunk):
+                (
+                    degree_str,
+                    next_net_name,
+                    node_name,
+                    direct,
+                    x_offset,
+                    y_offset,
+                    header,
+                    header_value,
+                    bad_net_line,
+                ) = match.groups()
+                if node_name is not None:
+                    if self.keep is None or self.keep(node_name):
+                        pins.append(
+                            (node_name, direct, float(x_offset), float(y_offset))
+                        )
+                    else:
+                        self.skipped_pins += 1
+                elif degree_str is not None:
+                    if net_name is not None:
+                        yield net_name, degree, pins
+                    # 没有 net 名时与 line.split()[-1] 相同，取度数作为 net 名
+                    net_name = next_net_name or degree_str
+                    degree, pins = int(degree_str), []
+                elif bad_net_line is not None:
+                    raise ValueError("invalid NetDegree line: %r" % bad_net_line)
+                elif header == "NumNets":
+                    self.num_nets = int(header_value)
+                else:
+                    self.num_pins = int(header_value)
+        if net_name is not None:
+            yield net_name, degree, pins
+
+
 def read_net_file(fopen, node_info):
     net_info: Dict[str, Net] = {}
     pin_cnt = 0
-    for line in fopen.readlines():
-        line: str = line.strip()
-        if line.startswith("NetDegree"):
-            net_name = line.split()[-1]
-        elif line.startswith("o"):
-            line = line.split()
-            node_name = line[0]
-            pin_direct = line[1]
-            if node_name in node_info:  # 只留 macro
-                pin_cnt += 1
-                if net_name not in net_info:
-                    net_info[net_name] = {}
-                if node_name not in net_info[net_name]:
-                    net_info[net_name][node_name] = []
-                x_offset = float(line[-2])
-                y_offset = float(line[-1])
-                net_info[net_name][node_name].append(
-                    Pin(pin_direct, x_offset, y_offset)
-                )
+    # 只留 macro
+    for net_name, _, pins in NetsTokenizer(fopen, keep=node_info.__contains__):
+        for node_name, pin_direct, x_offset, y_offset in pins:
+            pin_cnt += 1
+            if net_name not in net_info:
+                net_info[net_name] = {}
+            if node_name not in net_info[net_name]:
+                net_info[net_name][node_name] = []
+            net_info[net_name][node_name].append(Pin(pin_direct, x_offset, y_offset))
     print("adjust net size = {}".format(len(net_info)))
     return net_info, pin_cnt
 
@@ -111,7 +202,7 @@ def read_pl_file(fopen, node_info: Dict[str, Node]):
     max_width = 0
     min_height = 999999
     min_width = 999999
-    for line in fopen.readlines():
+    for line in fopen:
         line = line.strip()
         if line.startswith("o") or line.startswith("p"):
             line = line.strip().split()
@@ -135,23 +226,52 @@ def read_pl_file(fopen, node_info: Dict[str, Node]):
 
 
 class PlaceDB:
-    def __init__(self, benchmark="adaptec1", grid_size=1, boundary_radio: float = 0.1):
+    def __init__(
+        self,
+        benchmark="adaptec1",
+        grid_size=1,
+        boundary_radio: float = 0.1,
+        use_snapshot: bool = True,
+    ):
+        # use_snapshot 为 True 时，优先读取解析和预处理后保存的快照，
+        # 快照不存在或源文件有变化时重新解析，并写入新的快照
         self.benchmark = benchmark
         self.grid_size = grid_size
         assert os.path.exists(os.path.join("benchmarks", benchmark))
-        node_file = open(
-            os.path.join("benchmarks", benchmark, benchmark + ".nodes"), "r"
+
+        self.center_core = False
+        self.virtual_boundary = False
+        # 规整度 mask 的缓存，key 为 (width, height, grid_num, grid_size, *regularity_params())
+        self.regularity_mask: Dict[Tuple, np.ndarray] = {}
+
+        if not (use_snapshot and self.load_snapshot(boundary_radio)):
+            self.read_benchmark(boundary_radio)
+            if use_snapshot:
+                self.save_snapshot(boundary_radio)
+        self.build_net_index()
+
+        # if grid_size == 1:
+        #     for ni in self.node_info.values():
+        #         ni.resize_grid(self.grid_size)
+
+    def benchmark_file(self, suffix: str) -> str:
+        # benchmark 可以是子目录，例如 simple/adder32
+        return os.path.join(
+            "benchmarks", self.benchmark, os.path.basename(self.benchmark) + suffix
         )
-        self.node_info, self.cell_area = read_node_file(node_file, grid_size)
+
+    def read_benchmark(self, boundary_radio: float = 0.1):
+        node_file = open(self.benchmark_file(".nodes"), "r")
+        self.node_info, self.cell_area = read_node_file(node_file, self.grid_size)
         self.node_cnt = len(self.node_info)
         node_file.close()
 
-        net_file = open(os.path.join("benchmarks", benchmark, benchmark + ".nets"), "r")
+        net_file = open(self.benchmark_file(".nets"), "r")
         self.net_info, self.pin_cnt = read_net_file(net_file, self.node_info)
         self.net_cnt = len(self.net_info)
         net_file.close()
 
-        pl_file = open(os.path.join("benchmarks", benchmark, benchmark + ".pl"), "r")
+        pl_file = open(self.benchmark_file(".pl"), "r")
         self.max_height, self.max_width, self.min_height, self.min_width = read_pl_file(
             pl_file, self.node_info
         )
@@ -161,9 +281,6 @@ class PlaceDB:
             sum([ni.area for ni in self.node_info.values()]) / self.node_cnt
         )
 
-        self.center_core = False
-        self.virtual_boundary = False
-
         # if grid_size == 1:
         #     min_width = min([ni.width for ni in self.node_info.values()])
         #     min_height = min([ni.height for ni in self.node_info.values()])
@@ -181,10 +298,144 @@ class PlaceDB:
         #         self.grid_num = lower
 
         self.preprocess(boundary_radio)
+        self.build_pin_table()
+
+    def snapshot_dir(self, boundary_radio: float) -> str:
+        return os.path.join(
+            "benchmarks",
+            self.benchmark,
+            "snapshot",
+            f"placedb_v{snapshot_version}_radio_{boundary_radio}",
+        )
 
-        # if grid_size == 1:
-        #     for ni in self.node_info.values():
-        #         ni.resize_grid(self.grid_size)
+    def source_stat(self) -> Dict[str, List[int]]:
+        # 用源文件的修改时间和大小判断快照是否过期
+        source_stat = {}
+        for suffix in [".nodes", ".nets", ".pl"]:
+            stat = os.stat(self.benchmark_file(suffix))
+            source_stat[suffix] = [stat.st_mtime_ns, stat.st_size]
+        return source_stat
+
+    def save_snapshot(self, boundary_radio: float = 0.1):
+        # 快照为一个目录：每个数组一个 .npy，标量和校验信息在 meta.json 中。
+        # 先写到临时目录再 rename，并发的读者要么读到完整的快照，要么读不到
+        snapshot_dir = self.snapshot_dir(boundary_radio)
+        tmp_dir = f"{snapshot_dir}.{os.getpid()}.tmp"
+        node_ls = list(self.node_info.values())
+        arrays = {
+            "node_name": np.array([node.name for node in node_ls], dtype=str),
+            "node_id": np.array([node.id for node in node_ls], dtype=np.int64),
+            "node_x": np.array(
+                [node.bottom_left_x for node in node_ls], dtype=np.int64
+            ),
+            "node_y": np.array(
+                [node.bottom_left_y for node in node_ls], dtype=np.int64
+            ),
+            "node_width": np.array([node.width for node in node_ls], dtype=np.int64),
+            "node_height": np.array([node.height for node in node_ls], dtype=np.int64),
+            "node_is_port": np.array([node.is_port for node in node_ls], dtype=bool),
+            # 按插入顺序保存，重建的 set 与解析得到的一致
+            "macro_name": np.array(
+                [name for name in self.node_info if name in self.macro_name], dtype=str
+            ),
+            "port_name": np.array(
+                [name for name in self.node_info if name in self.port_name], dtype=str
+            ),
+            "port_to_delete": np.array(list(self.port_to_delete), dtype=str),
+            "net_name": np.array(list(self.net_info), dtype=str),
+            "net_start": self.net_start,
+            "pin_node": self.pin_node,
+            "pin_direct": self.pin_direct,
+            "pin_x_offset": self.pin_x_offset,
+            "pin_y_offset": self.pin_y_offset,
+        }
+        meta = {
+            "version": snapshot_version,
+            "boundary_radio": boundary_radio,
+            "source": self.source_stat(),
+            "scalar": {name: getattr(self, name) for name in snapshot_scalars},
+        }
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf8") as f:
+                json.dump(meta, f)
+            if os.path.exists(snapshot_dir):  # 过期的快照
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+            os.rename(tmp_dir, snapshot_dir)
+        except OSError:
+            # 其他进程已经写入了快照，或者 benchmark 目录不可写
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def load_snapshot(self, boundary_radio: float = 0.1) -> bool:
+        # 快照省去的是解析文本的时间，而不是内存：node_info/net_info 仍由数组重建为 Python 对象。
+        # 只有 pin 表（net_start、pin_node 等，surrogate 和 hpwl 计算直接使用的数组）
+        # 保持 mmap 只读打开，同时运行的多个进程共享这部分页缓存
+        snapshot_dir = self.snapshot_dir(boundary_radio)
+        try:
+            with open(os.path.join(snapshot_dir, "meta.json"), encoding="utf8") as f:
+                meta = json.load(f)
+            if (
+                meta["version"] != snapshot_version
+                or meta["boundary_radio"] != boundary_radio
+                or meta["source"] != self.source_stat()
+            ):
+                return False
+            data = {
+                name[: -len(".npy")]: np.load(
+                    os.path.join(snapshot_dir, name), mmap_mode="r"
+                )
+                for name in os.listdir(snapshot_dir)
+                if name.endswith(".npy")
+            }
+            for name in snapshot_scalars:
+                setattr(self, name, meta["scalar"][name])
+
+            self.node_info: Dict[str, Node] = {}
+            for name, node_id, x, y, width, height, is_port in zip(
+                data["node_name"].tolist(),
+                data["node_id"].tolist(),
+                data["node_x"].tolist(),
+                data["node_y"].tolist(),
+                data["node_width"].tolist(),
+                data["node_height"].tolist(),
+                data["node_is_port"].tolist(),
+            ):
+                node = Node(node_id, name, x, y, width, height, self.grid_size)
+                node.is_port = is_port
+                self.node_info[name] = node
+            self.macro_name = set(data["macro_name"].tolist())
+            self.port_name = set(data["port_name"].tolist())
+            self.port_to_delete = set(data["port_to_delete"].tolist())
+
+            self.net_start = data["net_start"]
+            self.pin_node = data["pin_node"]
+            self.pin_direct = data["pin_direct"]
+            self.pin_x_offset = data["pin_x_offset"]
+            self.pin_y_offset = data["pin_y_offset"]
+            node_name_ls = list(self.node_info)
+            net_start = self.net_start.tolist()
+            pin_node = self.pin_node.tolist()
+            pin_direct = self.pin_direct.tolist()
+            pin_x_offset = self.pin_x_offset.tolist()
+            pin_y_offset = self.pin_y_offset.tolist()
+            self.net_info: Dict[str, Net] = {}
+            for i, net_name in enumerate(data["net_name"].tolist()):
+                net: Net = {}
+                for pin_id in range(net_start[i], net_start[i + 1]):
+                    net.setdefault(node_name_ls[pin_node[pin_id]], []).append(
+                        Pin(
+                            pin_direct[pin_id],
+                            pin_x_offset[pin_id],
+                            pin_y_offset[pin_id],
+                        )
+                    )
+                self.net_info[net_name] = net
+        except (OSError, ValueError, KeyError):
+            return False
+        print("load snapshot", snapshot_dir)
+        return True
 
     def node_list(self):
         return list(self.node_info.values())
@@ -241,6 +492,76 @@ class PlaceDB:
                 self.net_cnt -= 1
         return self.port_to_delete
 
+    def build_pin_table(self):
+        # 把 net_info 展开为按 net 排列的 pin 表（CSR）：
+        # net i 的 pin 为 [net_start[i], net_start[i + 1])，同一 node 的 pin 连续存放
+        node_index = {name: i for i, name in enumerate(self.node_info)}
+        net_start = [0]
+        pin_node, pin_direct, pin_x_offset, pin_y_offset = [], [], [], []
+        for net in self.net_info.values():
+            for node_name, pins in net.items():
+                for pin in pins:
+                    pin_node.append(node_index[node_name])
+                    pin_direct.append(pin.direct)
+                    pin_x_offset.append(pin.x_offset)
+                    pin_y_offset.append(pin.y_offset)
+            net_start.append(len(pin_node))
+        self.net_start = np.array(net_start, dtype=np.int64)
+        self.pin_node = np.array(pin_node, dtype=np.int64)
+        self.pin_direct = np.array(pin_direct, dtype=str)
+        self.pin_x_offset = np.array(pin_x_offset, dtype=float)
+        self.pin_y_offset = np.array(pin_y_offset, dtype=float)
+
+    def resize_grid(self, grid_size: int) -> "PlaceDB":
+        # 换一个网格大小的 PlaceDB，解析结果和各种索引都共享，
+        # 只有 node 的 scaled_width/scaled_height 与网格有关，需要复制
+        placedb = copy.copy(self)
+        placedb.grid_size = grid_size
+        placedb.node_info = {}
+        for node_name, node in self.node_info.items():
+            node = copy.copy(node)
+            node.resize_grid(grid_size)
+            placedb.node_info[node_name] = node
+        return placedb
+
+    def build_net_index(self):
+        # 由 pin 表构建一次 node 下标和尺寸数组、node -> nets 的索引
+        self.node_name_ls = list(self.node_info)
+        self.node_index = {name: i for i, name in enumerate(self.node_name_ls)}
+        self.node_width = np.array(
+            [self.node_info[name].width for name in self.node_name_ls], dtype=np.int64
+        )
+        self.node_height = np.array(
+            [self.node_info[name].height for name in self.node_name_ls], dtype=np.int64
+        )
+        self.net_name_ls = list(self.net_info)
+        self.net_index = {name: i for i, name in enumerate(self.net_name_ls)}
+        self.pin_net = np.repeat(
+            np.arange(len(self.net_name_ls), dtype=np.int64), np.diff(self.net_start)
+        )
+        # 按 node 展开的 pin 下标（CSR）：node i 的 pin 为
+        # node_pin[node_pin_start[i]:node_pin_start[i + 1]]，按 net 顺序排列
+        self.node_pin = np.argsort(self.pin_node, kind="stable")
+        self.node_pin_start = np.zeros(len(self.node_name_ls) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(self.pin_node, minlength=len(self.node_name_ls)),
+            out=self.node_pin_start[1:],
+        )
+        self.node_net_ls: Dict[str, List[str]] = {}
+        # 每个 node 的 pin 按 net 顺序排列：(net 下标, x_offset, y_offset)
+        self.node_pins: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for i, node_name in enumerate(self.node_name_ls):
+            pin_ids = self.node_pin[self.node_pin_start[i] : self.node_pin_start[i + 1]]
+            net_ids = self.pin_net[pin_ids]
+            self.node_net_ls[node_name] = [
+                self.net_name_ls[net_id] for net_id in np.unique(net_ids).tolist()
+            ]
+            self.node_pins[node_name] = (
+                net_ids,
+                self.pin_x_offset[pin_ids],
+                self.pin_y_offset[pin_ids],
+            )
+
     def is_port(self, node_name):
         if self.node_info[node_name].area < self.aver_area:
             self.node_info[node_name].is_port = True
@@ -405,6 +726,53 @@ NumPins : {self.pin_cnt}
         if self.center_core:
             self.L2 = (self.boundary_length / 2 - self.r) * self.r
 
+    def regularity_params(self) -> Tuple:
+        # 规整度计算用到的全部参数，需要先调用 deal_center_core 和 deal_virtual_boundary
+        return (
+            float(self.r),
+            float(self.center_x),
+            float(self.center_y),
+            float(self.L2),
+            float(self.left_boundary),
+            float(self.right_boundary),
+            float(self.bottom_boundary),
+            float(self.top_boundary),
+        )
+
+    def regularity_mask_file(self) -> str:
+        return os.path.join("benchmarks", self.benchmark, "regularity_mask.npz")
+
+    def load_regularity_mask(self, file_path: str = None):
+        file_path = self.regularity_mask_file() if file_path is None else file_path
+        if not os.path.exists(file_path):
+            return
+        with np.load(file_path) as data:
+            for i, key in enumerate(data["keys"]):
+                regu_mask = data[f"mask_{i}"]
+                regu_mask.flags.writeable = False
+                self.regularity_mask.setdefault(tuple(key.tolist()), regu_mask)
+
+    def save_regularity_mask(self, file_path: str = None):
+        # 合并文件中已有的 mask 后整体写入临时文件再 rename，
+        # 多个进程同时保存时不会读到不完整的文件
+        file_path = self.regularity_mask_file() if file_path is None else file_path
+        self.load_regularity_mask(file_path)
+        keys = list(self.regularity_mask)
+        if not keys:
+            return
+        masks = {f"mask_{i}": self.regularity_mask[key] for i, key in enumerate(keys)}
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f, keys=np.array(keys, dtype=float).reshape(len(keys), -1), **masks
+                )
+            os.replace(tmp_path, file_path)
+        finally:
+            # 写入失败时删除临时文件，成功时临时文件已经被 rename
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def in_virtual_boundary(self, left_x, right_x, bottom_y, top_y):
         if (
             left_x >= self.left_boundary
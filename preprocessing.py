@@ -1,25 +1,28 @@
 import os
 
 from common import grid_setting, benchmark_list
-from place_db import PlaceDB, Net, Pin
-from utils import PlaceRecord, Record, draw_macro_placement, get_m2m_flow
+from place_db import PlaceDB, Net, NetsTokenizer, Pin
+from utils import (
+    PlaceRecord,
+    convert_m2m_flow,
+    draw_macro_placement,
+    get_m2m_flow,
+    m2m_flow_file,
+)
 from typing import Dict
 
 
 def db2record(placedb: PlaceDB, grid_size: int) -> PlaceRecord:
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     for node_name in placedb.node_info:
         chosen_loc_x = placedb.node_info[node_name].bottom_left_x // grid_size
         chosen_loc_y = placedb.node_info[node_name].bottom_left_y // grid_size
-        place_record[node_name] = Record(
+        place_record.set(
             node_name,
-            placedb.node_info[node_name].width,
-            placedb.node_info[node_name].height,
             chosen_loc_x,
             chosen_loc_y,
             placedb.node_info[node_name].bottom_left_x,
             placedb.node_info[node_name].bottom_left_y,
-            grid_size,
         )
     return place_record
 
@@ -75,29 +78,19 @@ def write_pl_cell(src_file: str, dst_file: str):
 
 def write_nets_cell(src_file: str, dst_file: str, placedb: PlaceDB):
     net_info: Dict[str, Net] = dict()
-    num_nets = 0
-    num_pins = 0
     with open(src_file, "r", encoding="utf8") as fread:
-        for line in fread:
-            line = line.strip()
-            if line.startswith("NumNets"):
-                num_nets = int(line.split()[-1])
-            elif line.startswith("NumPins"):
-                num_pins = int(line.split()[-1])
-            elif line.startswith("NetDegree"):
-                net_name = line.split()[-1]
-                net_info[net_name] = dict()
-            elif line.startswith("o"):
-                line = line.split()
-                node_name = line[0]
-                direc = line[1]
-                pos_x, pos_y = float(line[-1]), float(line[-2])
-                if node_name in placedb.port_to_delete:
-                    num_pins -= 1
-                else:
-                    if node_name not in net_info[net_name]:
-                        net_info[net_name][node_name] = []
-                    net_info[net_name][node_name].append(Pin(direc, pos_x, pos_y))
+        nets = NetsTokenizer(
+            fread, keep=lambda node_name: node_name not in placedb.port_to_delete
+        )
+        for net_name, _, pins in nets:
+            net_info[net_name] = dict()
+            for node_name, direc, x_offset, y_offset in pins:
+                pos_x, pos_y = y_offset, x_offset
+                if node_name not in net_info[net_name]:
+                    net_info[net_name][node_name] = []
+                net_info[net_name][node_name].append(Pin(direc, pos_x, pos_y))
+    num_nets = nets.num_nets
+    num_pins = nets.num_pins - nets.skipped_pins
     for net_name in list(net_info):
         have_in = False
         have_out = False
@@ -181,8 +174,7 @@ def mixedsize_preprocessing(benchmark: str):
     )
 
     # 生成布局对应的图片
-    m2m_csv_file = os.path.join("benchmarks", benchmark, "macro2macro.csv")
-    m2m_flow = get_m2m_flow(m2m_csv_file)
+    m2m_flow = get_m2m_flow(m2m_flow_file(benchmark))
     pic_file = os.path.join(benchmarks_mixedsize_dir, f"{benchmark}.png")
     place_record = db2record(placedb, grid_size)
     draw_macro_placement(place_record, pic_file, placedb, m2m_flow)
@@ -226,8 +218,7 @@ def to_detailed_preprocessing(benchmark: str):
     )
 
     # 生成布局对应的图片
-    m2m_csv_file = os.path.join("benchmarks", benchmark, "macro2macro.csv")
-    m2m_flow = get_m2m_flow(m2m_csv_file)
+    m2m_flow = get_m2m_flow(m2m_flow_file(benchmark))
     pic_file = os.path.join(benchmarks_to_detailed_dir, f"{benchmark}.png")
     place_record = db2record(placedb, grid_size)
     draw_macro_placement(place_record, pic_file, placedb, m2m_flow)
@@ -251,8 +242,15 @@ def macro_preprocessing(benchmark: str):
     os.system(f"cp -f {origin_benchmark_dir}/{benchmark}.wts {benchmarks_macro_dir}")
 
 
+def m2m_preprocessing(benchmark: str):
+    # macro2macro.csv 转为稀疏的 macro2macro.npz
+    print(benchmark)
+    convert_m2m_flow(os.path.join("benchmarks", benchmark, "macro2macro.csv"))
+
+
 if __name__ == "__main__":
     for b in benchmark_list:
+        m2m_preprocessing(b)
         to_detailed_preprocessing(b)
         mixedsize_preprocessing(b)
         macro_preprocessing(b)
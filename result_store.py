@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List
+
+# 以 (benchmark, method, alpha, beta, gamma, seed, code_version) 的哈希为 key 保存结果。
+# 一个 point 的结果先复制到 objects 下唯一命名的目录，再在同一个事务中写入 points 和
+# metrics 两张表；points 中有记录才算完成，中途崩溃只会留下没有被引用的目录。
+# metrics 只追加不修改，同名 metric 以最后追加的为准；同一个 point 重复提交时以先提交的为准
+
+schema = """
+CREATE TABLE IF NOT EXISTS points (
+    key TEXT PRIMARY KEY,
+    benchmark TEXT NOT NULL,
+    method TEXT NOT NULL,
+    alpha REAL NOT NULL,
+    beta REAL NOT NULL,
+    gamma REAL NOT NULL,
+    seed INTEGER NOT NULL,
+    code_version TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_key ON metrics (key);
+"""
+
+
+def code_version(repo_dir: str = None) -> str:
+    # git HEAD，工作区有改动时加上 -dirty- 和 git diff HEAD 的哈希，
+    # 不同的本地修改得到不同的版本；不在 git 仓库中时为 unknown
+    repo_dir = repo_dir or os.path.dirname(os.path.abspath(__file__))
+    try:
+        head = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir, stderr=subprocess.DEVNULL
+        )
+        diff = subprocess.check_output(
+            ["git", "diff", "HEAD", "--binary"],
+            cwd=repo_dir,
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    version = head.decode().strip()
+    if diff:
+        version += "-dirty-" + hashlib.sha1(diff).hexdigest()[:12]
+    return version
+
+
+def point_params(
+    benchmark: str,
+    method: str,
+    alpha: float,
+    beta: float,
+    gamma: float,
+    seed: int,
+    code_version: str,
+) -> Dict:
+    # 超参数取 6 位小数，避免 0.1 * 3 与 0.3 这类浮点误差产生不同的 key
+    return {
+        "benchmark": benchmark,
+        "method": method,
+        "alpha": round(float(alpha), 6),
+        "beta": round(float(beta), 6),
+        "gamma": round(float(gamma), 6),
+        "seed": int(seed),
+        "code_version": code_version,
+    }
+
+
+def point_key(params: Dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf8")).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, root: str = "result_store") -> None:
+        self.root = root
+        self.object_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.object_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.db_file = os.path.join(root, "results.db")
+        with self.connect() as conn:
+            conn.executescript(schema)
+
+    @contextmanager
+    def connect(self):
+        # 每次操作一个事务，结束时提交并关闭连接。
+        # 多个 sweep 进程可以同时读写，写操作由 sqlite 的锁串行化
+        conn = sqlite3.connect(self.db_file, timeout=600)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def has(self, key: str) -> bool:
+        with self.connect() as conn:
+            row = conn.execute("SELECT 1 FROM points WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def path(self, key: str) -> str:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT path FROM points WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else os.path.join(self.object_dir, row[0])
+
+    def metrics(self, key: str) -> Dict[str, float]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT name, value FROM metrics WHERE key = ? ORDER BY id", (key,)
+            ).fetchall()
+        return dict(rows)
+
+    def append_metrics(self, key: str, metrics: Dict[str, float]):
+        # 为已提交的 point 追加 metric，例如之后补充的评价指标
+        assert self.has(key), key
+        now = time.time()
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT INTO metrics (key, name, value, created) VALUES (?, ?, ?, ?)",
+                [(key, name, value, now) for name, value in metrics.items()],
+            )
+
+    def commit(
+        self,
+        params: Dict,
+        src_dirs: Dict[str, str] = None,
+        metrics: Dict[str, float] = None,
+    ) -> bool:
+        # 把 src_dirs（名字 -> 目录）复制到 store 中，并记录 metrics。
+        # 返回 False 表示该 point 已经被提交过，本次结果被丢弃
+        key = point_key(params)
+        if self.has(key):
+            return False
+        name = f"{key}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.tmp_dir, name)
+        os.makedirs(tmp_path)
+        for dst, src in (src_dirs or {}).items():
+            shutil.copytree(src, os.path.join(tmp_path, dst))
+        with open(os.path.join(tmp_path, "params.json"), "w", encoding="utf8") as f:
+            json.dump(params, f, indent=2, sort_keys=True)
+        object_path = os.path.join(self.object_dir, name)
+        os.replace(tmp_path, object_path)
+
+        now = time.time()
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    params["benchmark"],
+                    params["method"],
+                    params["alpha"],
+                    params["beta"],
+                    params["gamma"],
+                    params["seed"],
+                    params["code_version"],
+                    name,
+                    now,
+                ),
+            )
+            committed = cursor.rowcount == 1
+            if committed:
+                conn.executemany(
+                    "INSERT INTO metrics (key, name, value, created) VALUES (?, ?, ?, ?)",
+                    [(key, k, v, now) for k, v in (metrics or {}).items()],
+                )
+        if not committed:
+            # 并发的另一个 sweep 先提交了同一个 point
+            shutil.rmtree(object_path)
+        return committed
+
+    def query(self, **conditions) -> List[Dict]:
+        # 例如 store.query(benchmark="adaptec1", method="bbo")
+        columns = [
+            "key",
+            "benchmark",
+            "method",
+            "alpha",
+            "beta",
+            "gamma",
+            "seed",
+            "code_version",
+        ]
+        sql = f"SELECT {', '.join(columns)} FROM points"
+        if conditions:
+            sql += " WHERE " + " AND ".join(f"{name} = ?" for name in conditions)
+        with self.connect() as conn:
+            rows = conn.execute(sql, tuple(conditions.values())).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def gc(self) -> int:
+        # 删除崩溃后遗留的、没有被 points 引用的目录，只能在没有 sweep 运行时调用
+        with self.connect() as conn:
+            used = {row[0] for row in conn.execute("SELECT path FROM points")}
+        removed = 0
+        for name in os.listdir(self.object_dir):
+            if name not in used:
+                shutil.rmtree(os.path.join(self.object_dir, name))
+                removed += 1
+        # tmp 为提交中的目录，work 为 sweep 的工作目录
+        for scratch in [self.tmp_dir, os.path.join(self.root, "work")]:
+            if not os.path.exists(scratch):
+                continue
+            for name in os.listdir(scratch):
+                shutil.rmtree(os.path.join(scratch, name))
+                removed += 1
+        return removed
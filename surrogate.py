@@ -0,0 +1,278 @@
+import argparse
+import csv
+import os
+import random
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from common import grid_setting, my_inf
+from place_db import PlaceDB
+from utils import M2MFlow, PlaceRecord
+
+
+def net_centers(place_record: PlaceRecord, placedb: PlaceDB) -> np.ndarray:
+    # 每个 net 中已放置 pin 的 bbox 中心，形状为 (2, net 数)，没有 pin 被放置的 net 为 nan
+    center = np.full((2, len(placedb.net_name_ls)), np.nan)
+    pin_mask = place_record.placed[placedb.pin_node]
+    if not np.any(pin_mask):
+        return center
+    pin_node = placedb.pin_node[pin_mask]
+    pin_net = placedb.pin_net[pin_mask]
+    pin_x = place_record.center_x[pin_node] + placedb.pin_x_offset[pin_mask]
+    pin_y = place_record.center_y[pin_node] + placedb.pin_y_offset[pin_mask]
+    seg_start = np.flatnonzero(np.diff(pin_net, prepend=-1))
+    nets = pin_net[seg_start]
+    center[0, nets] = 0.5 * (
+        np.maximum.reduceat(pin_x, seg_start) + np.minimum.reduceat(pin_x, seg_start)
+    )
+    center[1, nets] = 0.5 * (
+        np.maximum.reduceat(pin_y, seg_start) + np.minimum.reduceat(pin_y, seg_start)
+    )
+    return center
+
+
+class SwapSurrogate:
+    # 在线的交换收益预测模型。每次从 sampler 抽取 batch_size 个候选交换，
+    # 用岭回归预测 hpwl（或评价值）的相对下降量，只把预测最好的 top_k 个依次交给 placer，
+    # placer 的结果作为新样本更新模型。样本数少于 warmup 时直接使用 sampler 的结果，
+    # 另外以 epsilon 的概率随机选择，保证样本的多样性
+    def __init__(
+        self,
+        placedb: PlaceDB,
+        candidates: List[str],
+        m2m_flow: M2MFlow = None,
+        batch_size: int = 64,
+        top_k: int = 4,
+        warmup: int = 16,
+        epsilon: float = 0.1,
+        ridge: float = 1.0,
+    ) -> None:
+        self.placedb = placedb
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.warmup = warmup
+        self.epsilon = epsilon
+        self.ridge = ridge
+
+        # macro 的静态特征：面积、pin 数、dataflow
+        node_idx = np.array([placedb.node_index[node_name] for node_name in candidates])
+        area = placedb.node_width[node_idx] * placedb.node_height[node_idx]
+        degree = np.diff(placedb.node_pin_start)[node_idx]
+        dataflow = np.array(
+            [
+                sum(m2m_flow[node_name].values())
+                if m2m_flow is not None and node_name in m2m_flow
+                else 0.0
+                for node_name in candidates
+            ]
+        )
+        self.static = {
+            node_name: np.log1p([area[i], degree[i], dataflow[i]])
+            for i, node_name in enumerate(candidates)
+        }
+
+        self.sample_x: List[np.ndarray] = []
+        self.sample_y: List[float] = []
+        self.weight: np.ndarray = None
+        self.mean: np.ndarray = None
+        self.std: np.ndarray = None
+        self.queue: List[Tuple[Tuple[str, str], np.ndarray]] = []
+        self.pending: np.ndarray = None
+        # 统计
+        self.screened = 0
+        self.evaluated = 0
+        self.accepted = 0
+        self.start_time = time.time()
+
+    def pin_cost(self, node_name: str, center_x, center_y, center: np.ndarray):
+        # macro 中心位于 (center_x, center_y) 时，各 pin 到所在 net bbox 中心的 L1 距离之和
+        net_ids, pin_x_offset, pin_y_offset = self.placedb.node_pins[node_name]
+        if len(net_ids) == 0:
+            return 0.0
+        cost = np.abs(center_x + pin_x_offset - center[0, net_ids]) + np.abs(
+            center_y + pin_y_offset - center[1, net_ids]
+        )
+        return float(np.sum(cost[~np.isnan(cost)]))
+
+    def features(
+        self, place_record: PlaceRecord, pairs: List[Tuple[str, str]]
+    ) -> np.ndarray:
+        center = net_centers(place_record, self.placedb)
+        features = []
+        for node_a, node_b in pairs:
+            a, b = place_record[node_a], place_record[node_b]
+            cost_a = self.pin_cost(node_a, a.center_x, a.center_y, center)
+            cost_b = self.pin_cost(node_b, b.center_x, b.center_y, center)
+            # 交换 guiding 后按各自的中心位置估计的距离变化
+            swap_a = self.pin_cost(node_a, b.center_x, b.center_y, center)
+            swap_b = self.pin_cost(node_b, a.center_x, a.center_y, center)
+            static_a, static_b = self.static[node_a], self.static[node_b]
+            features.append(
+                np.concatenate(
+                    [
+                        [
+                            swap_a + swap_b - cost_a - cost_b,
+                            cost_a + cost_b,
+                            abs(a.center_x - b.center_x) + abs(a.center_y - b.center_y),
+                        ],
+                        np.abs(static_a - static_b),
+                        static_a + static_b,
+                    ]
+                )
+            )
+        return np.array(features)
+
+    def ready(self) -> bool:
+        return len(self.sample_y) >= self.warmup
+
+    def fit(self):
+        x = np.array(self.sample_x)
+        y = np.array(self.sample_y)
+        self.mean = x.mean(axis=0)
+        self.std = x.std(axis=0)
+        self.std[self.std == 0] = 1.0
+        x = np.hstack([(x - self.mean) / self.std, np.ones((len(x), 1))])
+        reg = self.ridge * np.eye(x.shape[1])
+        reg[-1, -1] = 0.0  # 常数项不加正则
+        self.weight = np.linalg.solve(x.T @ x + reg, x.T @ y)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        x = (features - self.mean) / self.std
+        return x @ self.weight[:-1] + self.weight[-1]
+
+    def propose(
+        self, place_record: PlaceRecord, sampler: Callable[[], Tuple[str, str]]
+    ) -> Tuple[str, str]:
+        # place_record 为当前最优解，返回下一个交给 placer 的交换
+        if not self.queue:
+            if not self.ready() or random.random() < self.epsilon:
+                pair = tuple(sampler())
+                self.queue = [(pair, self.features(place_record, [pair])[0])]
+            else:
+                pairs = [tuple(sampler()) for _ in range(self.batch_size)]
+                features = self.features(place_record, pairs)
+                pred = self.predict(features)
+                order = np.argsort(-pred, kind="stable")[: self.top_k]
+                self.queue = [(pairs[i], features[i]) for i in order]
+                self.screened += len(pairs)
+        pair, self.pending = self.queue.pop(0)
+        return pair
+
+    def update(self, best_value: float, value: float):
+        # best_value 为交换前的最优值，value 为 placer 的结果，越小越好
+        if value >= my_inf:
+            gain = -1.0
+        else:
+            gain = float(
+                np.clip((best_value - value) / max(abs(best_value), 1e-12), -1, 1)
+            )
+        self.sample_x.append(self.pending)
+        self.sample_y.append(gain)
+        self.pending = None
+        self.evaluated += 1
+        if gain > 0:
+            self.accepted += 1
+            self.queue = []  # 最优解变化，排队中的特征已经过时
+        if self.ready():
+            self.fit()
+
+    def report(self) -> str:
+        accept_rate = self.accepted / max(self.evaluated, 1)
+        return (
+            f"surrogate: evaluated {self.evaluated}, accepted {self.accepted}, "
+            f"accept rate {accept_rate:.4f}, screened {self.screened}, "
+            f"time {time.time() - self.start_time:.2f}s"
+        )
+
+
+def read_curve(curve_file) -> Tuple[float, List[Tuple[float, float]]]:
+    # wiremask 的 curve 文件：初始化阶段的最优 hpwl，以及 EA 部分每次评估的 (hpwl, time)
+    init_best = my_inf
+    curve = []
+    with open(curve_file, "r") as f:
+        for row in csv.reader(f):
+            if len(row) != 3:
+                continue
+            if row[2] == "init":
+                init_best = min(init_best, float(row[0]))
+            else:
+                curve.append((float(row[0]), float(row[1])))
+    return init_best, curve
+
+
+def accept_rate(init_best, curve) -> float:
+    best, accepted = init_best, 0
+    for hpwl, _ in curve:
+        if hpwl < best:
+            best = hpwl
+            accepted += 1
+    return accepted / max(len(curve), 1)
+
+
+def time_to_reach(init_best, curve, start_time, target) -> float:
+    best = init_best
+    for hpwl, t in curve:
+        best = min(best, hpwl)
+        if best <= target:
+            return t - start_time
+    return np.nan
+
+
+def main():
+    # 与均匀随机交换对比接受率以及达到同一 hpwl 所需的时间
+    import wiremask
+
+    parser = argparse.ArgumentParser(description="surrogate vs baseline")
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--seed", default=2027)
+    parser.add_argument("--init_round", default=10)
+    parser.add_argument("--stop_round", default=200)
+    args = parser.parse_args()
+    benchmark = args.dataset
+    grid_num = grid_setting[benchmark]["grid_num"]
+    grid_size = grid_setting[benchmark]["grid_size"]
+    placedb = PlaceDB(benchmark, grid_size)
+
+    result_dir = os.path.join("results_surrogate", benchmark)
+    os.makedirs(result_dir, exist_ok=True)
+    stats = {}
+    for mode in ["baseline", "surrogate"]:
+        random.seed(args.seed)
+        np.random.seed(int(args.seed))
+        curve_file = os.path.join(result_dir, f"curve_{mode}_seed_{args.seed}.csv")
+        placement_file = os.path.join(
+            result_dir, f"placement_{mode}_seed_{args.seed}.csv"
+        )
+        if os.path.exists(curve_file):
+            os.remove(curve_file)
+        surrogate = None
+        if mode == "surrogate":
+            surrogate = SwapSurrogate(placedb, sorted(placedb.macro_name))
+        start = time.time()
+        _, hpwl = wiremask.bbo(
+            int(args.init_round),
+            int(args.stop_round),
+            placedb,
+            grid_num,
+            grid_size,
+            curve_file,
+            placement_file,
+            surrogate=surrogate,
+        )
+        init_best, curve = read_curve(curve_file)
+        stats[mode] = (hpwl, init_best, curve, start)
+
+    target = max(stats[mode][0] for mode in stats)
+    for mode, (hpwl, init_best, curve, start) in stats.items():
+        print(
+            f"{mode}: hpwl {hpwl}, "
+            f"accept rate {accept_rate(init_best, curve):.4f}, "
+            f"time to {target}: "
+            f"{time_to_reach(init_best, curve, start, target):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
+import copy
 import csv
 import math
+import os
 import time
+from functools import lru_cache
 from typing import Dict, List, Tuple
 
 import matplotlib.patches as patches
@@ -8,10 +11,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-from scipy.spatial import distance
+from scipy import sparse
 
 from common import my_inf
-from place_db import Node, PlaceDB, Net
+from place_db import Node, PlaceDB
 
 
 class Record:
@@ -53,8 +56,196 @@ class Record:
         self.center_y: float = self.bottom_left_y + 0.5 * self.height
 
 
+class RecordView:
+    # PlaceRecord 中某个 node 的视图，属性与 Record 相同，读写直接作用于数组
+    __slots__ = ("place_record", "idx")
+
+    def __init__(self, place_record: "PlaceRecord", idx: int) -> None:
+        self.place_record = place_record
+        self.idx = idx
+
+    @property
+    def name(self) -> str:
+        return self.place_record.node_name_ls[self.idx]
+
+    @property
+    def width(self) -> int:
+        return int(self.place_record.width[self.idx])
+
+    @property
+    def height(self) -> int:
+        return int(self.place_record.height[self.idx])
+
+    @property
+    def grid_x(self) -> int:
+        return int(self.place_record.grid_x[self.idx])
+
+    @grid_x.setter
+    def grid_x(self, value: int):
+        self.place_record.grid_x[self.idx] = value
+
+    @property
+    def grid_y(self) -> int:
+        return int(self.place_record.grid_y[self.idx])
+
+    @grid_y.setter
+    def grid_y(self, value: int):
+        self.place_record.grid_y[self.idx] = value
+
+    @property
+    def bottom_left_x(self) -> int:
+        return int(self.place_record.bottom_left_x[self.idx])
+
+    @bottom_left_x.setter
+    def bottom_left_x(self, value: int):
+        self.place_record.bottom_left_x[self.idx] = value
+
+    @property
+    def bottom_left_y(self) -> int:
+        return int(self.place_record.bottom_left_y[self.idx])
+
+    @bottom_left_y.setter
+    def bottom_left_y(self, value: int):
+        self.place_record.bottom_left_y[self.idx] = value
+
+    @property
+    def scaled_width(self) -> int:
+        return int(self.place_record.scaled_width[self.idx])
+
+    @property
+    def scaled_height(self) -> int:
+        return int(self.place_record.scaled_height[self.idx])
+
+    @property
+    def center_x(self) -> float:
+        return float(self.place_record.center_x[self.idx])
+
+    @property
+    def center_y(self) -> float:
+        return float(self.place_record.center_y[self.idx])
+
+    def refresh(self, grid_size: int):
+        self.place_record.refresh(self.idx, grid_size)
+
+
+class PlaceRecord:
+    # 以数组形式（structure of arrays）保存的布局，下标与 placedb.node_index 一致。
+    # 提供与 Dict[str, Record] 相同的接口，按插入顺序遍历，record[node_name]
+    # 返回 RecordView；swap/copy/refresh 直接在数组上完成
+    def __init__(self, placedb: PlaceDB, grid_size: int) -> None:
+        self.grid_size = grid_size
+        # 与 placedb 共享，不随 copy 复制
+        self.node_name_ls = placedb.node_name_ls
+        self.node_index = placedb.node_index
+        self.width = placedb.node_width
+        self.height = placedb.node_height
+
+        node_cnt = len(self.node_name_ls)
+        self.placed = np.zeros(node_cnt, dtype=bool)
+        self.order: List[int] = []
+        self.grid_x = np.zeros(node_cnt, dtype=np.int64)
+        self.grid_y = np.zeros(node_cnt, dtype=np.int64)
+        self.bottom_left_x = np.zeros(node_cnt, dtype=np.int64)
+        self.bottom_left_y = np.zeros(node_cnt, dtype=np.int64)
+        self.scaled_width = np.zeros(node_cnt, dtype=np.int64)
+        self.scaled_height = np.zeros(node_cnt, dtype=np.int64)
+        self.center_x = np.zeros(node_cnt, dtype=float)
+        self.center_y = np.zeros(node_cnt, dtype=float)
+
+    def copy(self) -> "PlaceRecord":
+        place_record = copy.copy(self)
+        place_record.placed = self.placed.copy()
+        place_record.order = self.order.copy()
+        place_record.grid_x = self.grid_x.copy()
+        place_record.grid_y = self.grid_y.copy()
+        place_record.bottom_left_x = self.bottom_left_x.copy()
+        place_record.bottom_left_y = self.bottom_left_y.copy()
+        place_record.scaled_width = self.scaled_width.copy()
+        place_record.scaled_height = self.scaled_height.copy()
+        place_record.center_x = self.center_x.copy()
+        place_record.center_y = self.center_y.copy()
+        return place_record
+
+    def set(
+        self,
+        node_name: str,
+        grid_x: int,
+        grid_y: int,
+        bottom_left_x: int,
+        bottom_left_y: int,
+    ):
+        idx = self.node_index[node_name]
+        if not self.placed[idx]:
+            self.placed[idx] = True
+            self.order.append(idx)
+        self.grid_x[idx] = grid_x
+        self.grid_y[idx] = grid_y
+        self.bottom_left_x[idx] = bottom_left_x
+        self.bottom_left_y[idx] = bottom_left_y
+        self.refresh(idx)
+
+    def refresh(self, idx=None, grid_size: int = None):
+        # 按 Record.refresh 的公式重新计算 scaled 尺寸和中心，idx 为空时更新全部
+        grid_size = self.grid_size if grid_size is None else grid_size
+        if idx is None:
+            idx = slice(None)
+        width, height = self.width[idx], self.height[idx]
+        self.scaled_width[idx] = np.ceil(
+            (width + self.bottom_left_x[idx] - grid_size * self.grid_x[idx]) / grid_size
+        )
+        self.scaled_height[idx] = np.ceil(
+            (height + self.bottom_left_y[idx] - grid_size * self.grid_y[idx])
+            / grid_size
+        )
+        self.center_x[idx] = self.bottom_left_x[idx] + 0.5 * width
+        self.center_y[idx] = self.bottom_left_y[idx] + 0.5 * height
+
+    def swap(self, node_name1: str, node_name2: str):
+        # 交换两个 node 的位置，O(1)
+        idx = [self.node_index[node_name1], self.node_index[node_name2]]
+        rev = idx[::-1]
+        self.grid_x[idx] = self.grid_x[rev]
+        self.grid_y[idx] = self.grid_y[rev]
+        self.bottom_left_x[idx] = self.bottom_left_x[rev]
+        self.bottom_left_y[idx] = self.bottom_left_y[rev]
+        self.refresh(idx)
+
+    def __setitem__(self, node_name: str, record):
+        self.set(
+            node_name,
+            record.grid_x,
+            record.grid_y,
+            record.bottom_left_x,
+            record.bottom_left_y,
+        )
+
+    def __getitem__(self, node_name: str) -> RecordView:
+        idx = self.node_index.get(node_name)
+        if idx is None or not self.placed[idx]:
+            raise KeyError(node_name)
+        return RecordView(self, idx)
+
+    def __contains__(self, node_name) -> bool:
+        idx = self.node_index.get(node_name)
+        return idx is not None and bool(self.placed[idx])
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __iter__(self):
+        return (self.node_name_ls[idx] for idx in self.order)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [RecordView(self, idx) for idx in self.order]
+
+    def items(self):
+        return [(self.node_name_ls[idx], RecordView(self, idx)) for idx in self.order]
+
+
 M2MFlow = Dict[str, Dict[str, float]]
-PlaceRecord = Dict[str, Record]
 
 
 def is_float(s):
@@ -79,10 +270,8 @@ def l1_normalize(x: List) -> List:
 def random_guiding(
     node_name_list: List[str], placedb: PlaceDB, grid_size: int
 ) -> PlaceRecord:  # 将所有macro随机放置
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     for node_name in node_name_list:
-        width = placedb.node_info[node_name].width
-        height = placedb.node_info[node_name].height
         if placedb.node_info[node_name].is_port:
             loc_x = placedb.node_info[node_name].bottom_left_x // grid_size
             loc_y = placedb.node_info[node_name].bottom_left_y // grid_size
@@ -93,16 +282,7 @@ def random_guiding(
             loc_y = np.random.randint(0, grid_size)
             bottom_left_x = loc_x * grid_size
             bottom_left_y = loc_y * grid_size
-        place_record[node_name] = Record(
-            node_name,
-            width,
-            height,
-            loc_x,
-            loc_y,
-            bottom_left_x,
-            bottom_left_y,
-            grid_size,
-        )
+        place_record.set(node_name, loc_x, loc_y, bottom_left_x, bottom_left_y)
     return place_record
 
 
@@ -231,57 +411,277 @@ def rank_macros_mixed(
     return node_name_ls
 
 
-def cal_hpwl(place_record: PlaceRecord, placedb: PlaceDB) -> float:
-    hpwl = 0
-    net_hpwl = {}
-    for net_name in placedb.net_info:
-        for node_name in placedb.net_info[net_name]:
-            if node_name in place_record:
-                for pin in placedb.net_info[net_name][node_name]:
-                    pin_x = place_record[node_name].center_x + pin.x_offset
-                    pin_y = place_record[node_name].center_y + pin.y_offset
-                    if net_name not in net_hpwl.keys():
-                        net_hpwl[net_name] = {
-                            "x_max": pin_x,
-                            "x_min": pin_x,
-                            "y_max": pin_y,
-                            "y_min": pin_y,
-                        }
-                    else:
-                        if net_hpwl[net_name]["x_max"] < pin_x:
-                            net_hpwl[net_name]["x_max"] = pin_x
-                        elif net_hpwl[net_name]["x_min"] > pin_x:
-                            net_hpwl[net_name]["x_min"] = pin_x
-                        if net_hpwl[net_name]["y_max"] < pin_y:
-                            net_hpwl[net_name]["y_max"] = pin_y
-                        elif net_hpwl[net_name]["y_min"] > pin_y:
-                            net_hpwl[net_name]["y_min"] = pin_y
-    hpwl = sum(
-        [
-            net_hpwl[net_name]["x_max"]
-            - net_hpwl[net_name]["x_min"]
-            + net_hpwl[net_name]["y_max"]
-            - net_hpwl[net_name]["y_min"]
-            for net_name in net_hpwl
-        ]
+def cal_net_hpwl(place_record: PlaceRecord, placedb: PlaceDB) -> np.ndarray:
+    # 每个 net 的 hpwl，下标与 placedb.net_name_ls 一致，只统计已放置的 node 的 pin，
+    # 没有 pin 被放置的 net 为 0。pin 表按 net 连续存放，过滤后仍按 net 分段，
+    # 可以用 reduceat 一次求出所有 net 的 bbox
+    hpwl = np.zeros(len(placedb.net_name_ls))
+    pin_mask = place_record.placed[placedb.pin_node]
+    if not np.any(pin_mask):
+        return hpwl
+    pin_node = placedb.pin_node[pin_mask]
+    pin_net = placedb.pin_net[pin_mask]
+    pin_x = place_record.center_x[pin_node] + placedb.pin_x_offset[pin_mask]
+    pin_y = place_record.center_y[pin_node] + placedb.pin_y_offset[pin_mask]
+    seg_start = np.flatnonzero(np.diff(pin_net, prepend=-1))
+    hpwl[pin_net[seg_start]] = (
+        np.maximum.reduceat(pin_x, seg_start)
+        - np.minimum.reduceat(pin_x, seg_start)
+        + np.maximum.reduceat(pin_y, seg_start)
+        - np.minimum.reduceat(pin_y, seg_start)
     )
     return hpwl
 
 
-def get_m2m_flow(m2m_flow_file, threshold=1e-2) -> M2MFlow:
-    df = pd.read_csv(m2m_flow_file, index_col=0)
+def cal_hpwl(place_record: PlaceRecord, placedb: PlaceDB) -> float:
+    # 按 net 顺序逐个累加，与逐 net 求和的结果一致
+    return sum(cal_net_hpwl(place_record, placedb).tolist())
+
+
+def csr_rows(row_start: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 展开 CSR 中若干行的元素位置，返回 (元素位置, 所在行在 rows 中的下标)
+    lo = row_start[rows]
+    size = row_start[rows + 1] - lo
+    local = np.repeat(np.arange(len(rows)), size)
+    pos = np.arange(np.sum(size)) - np.repeat(np.cumsum(size) - size - lo, size)
+    return pos, local
+
+
+class IncrementalHPWL:
+    # 增量计算 hpwl：维护每个 net 的 bbox（x_min, x_max, y_min, y_max 四行），
+    # 以及落在每条边上的 pin 数。少数 node 移动时只更新与它们相连的 net，
+    # 只有移走的 pin 是某条边上的最后一个 pin 时才重新扫描该 net 的 pin，
+    # 代价与移动的 node 的度数成正比。
+    # propose 只计算新的 hpwl，commit 接受最近一次 propose 的结果。
+    # 只适用于每次移动的 node 较少的情况，几乎所有 node 都移动时不如直接调用 cal_hpwl
+    def __init__(self, place_record: PlaceRecord, placedb: PlaceDB) -> None:
+        self.placedb = placedb
+        self.placed = place_record.placed.copy()
+        self.center_x = place_record.center_x.copy()
+        self.center_y = place_record.center_y.copy()
+        nets = np.arange(len(placedb.net_name_ls))
+        self.bound, self.bound_cnt = self.scan(
+            nets, self.placed, self.center_x, self.center_y
+        )
+        self.net_hpwl = self.cal_net_hpwl(self.bound)
+        # 与 cal_hpwl 相同，按 net 顺序累加
+        self.hpwl = sum(self.net_hpwl.tolist())
+        self.pending = None
+
+    def pin_loc(self, pin: np.ndarray, center_x: np.ndarray, center_y: np.ndarray):
+        node = self.placedb.pin_node[pin]
+        pin_x = center_x[node] + self.placedb.pin_x_offset[pin]
+        pin_y = center_y[node] + self.placedb.pin_y_offset[pin]
+        return pin_x, pin_y
+
+    @staticmethod
+    def add_pins(bound, bound_cnt, local, pin_x, pin_y):
+        for k, (loc, func) in enumerate(
+            [
+                (pin_x, np.minimum),
+                (pin_x, np.maximum),
+                (pin_y, np.minimum),
+                (pin_y, np.maximum),
+            ]
+        ):
+            old = bound[k].copy()
+            func.at(bound[k], local, loc)
+            # 边界移动后原来在边上的 pin 不再计数
+            bound_cnt[k][bound[k] != old] = 0
+            np.add.at(bound_cnt[k], local[loc == bound[k][local]], 1)
+
+    @staticmethod
+    def remove_pins(bound, bound_cnt, local, pin_x, pin_y):
+        for k, loc in enumerate([pin_x, pin_x, pin_y, pin_y]):
+            np.subtract.at(bound_cnt[k], local[loc == bound[k][local]], 1)
+
+    def scan(self, nets, placed, center_x, center_y):
+        bound = np.empty((4, len(nets)))
+        bound[0::2] = np.inf
+        bound[1::2] = -np.inf
+        bound_cnt = np.zeros((4, len(nets)), dtype=np.int64)
+        pin, local = csr_rows(self.placedb.net_start, nets)
+        keep = placed[self.placedb.pin_node[pin]]
+        pin, local = pin[keep], local[keep]
+        self.add_pins(bound, bound_cnt, local, *self.pin_loc(pin, center_x, center_y))
+        return bound, bound_cnt
+
+    @staticmethod
+    def cal_net_hpwl(bound):
+        # 与 cal_net_hpwl 的计算顺序一致，没有 pin 的 net 为 0
+        net_hpwl = bound[1] - bound[0] + bound[3] - bound[2]
+        net_hpwl[~np.isfinite(bound[0])] = 0
+        return net_hpwl
+
+    def propose(self, place_record: PlaceRecord, moved: List[str] = None) -> float:
+        # moved 为空时，与已接受的布局逐个比较找出移动过的 node
+        placedb = self.placedb
+        if moved is None:
+            moved = np.flatnonzero(
+                (place_record.placed != self.placed)
+                | (place_record.center_x != self.center_x)
+                | (place_record.center_y != self.center_y)
+            )
+        else:
+            moved = np.array([placedb.node_index[n] for n in moved], dtype=np.int64)
+        placed = self.placed.copy()
+        center_x = self.center_x.copy()
+        center_y = self.center_y.copy()
+        placed[moved] = place_record.placed[moved]
+        center_x[moved] = place_record.center_x[moved]
+        center_y[moved] = place_record.center_y[moved]
+
+        pin_pos, _ = csr_rows(placedb.node_pin_start, moved)
+        pin = placedb.node_pin[pin_pos]
+        nets = np.unique(placedb.pin_net[pin])
+        local = np.searchsorted(nets, placedb.pin_net[pin])
+        bound = self.bound[:, nets]
+        bound_cnt = self.bound_cnt[:, nets]
+
+        old_pin = self.placed[placedb.pin_node[pin]]
+        had_pin = np.isfinite(bound[0])
+        self.remove_pins(
+            bound,
+            bound_cnt,
+            local[old_pin],
+            *self.pin_loc(pin[old_pin], self.center_x, self.center_y),
+        )
+        # 某条边上的 pin 全部移走后，需要重新扫描该 net
+        dirty = had_pin & np.any(bound_cnt == 0, axis=0)
+        new_pin = placed[placedb.pin_node[pin]]
+        self.add_pins(
+            bound,
+            bound_cnt,
+            local[new_pin],
+            *self.pin_loc(pin[new_pin], center_x, center_y),
+        )
+        if np.any(dirty):
+            bound[:, dirty], bound_cnt[:, dirty] = self.scan(
+                nets[dirty], placed, center_x, center_y
+            )
+
+        net_hpwl = self.cal_net_hpwl(bound)
+        # 总 hpwl 不做增量累加（会有舍入误差的积累），与 cal_hpwl 一样按 net 顺序重新求和，
+        # 保证与 cal_hpwl 的结果完全一致
+        all_net_hpwl = self.net_hpwl.copy()
+        all_net_hpwl[nets] = net_hpwl
+        hpwl = sum(all_net_hpwl.tolist())
+        self.pending = (
+            placed,
+            center_x,
+            center_y,
+            nets,
+            bound,
+            bound_cnt,
+            net_hpwl,
+            hpwl,
+        )
+        return hpwl
+
+    def commit(self):
+        assert self.pending is not None
+        (
+            placed,
+            center_x,
+            center_y,
+            nets,
+            bound,
+            bound_cnt,
+            net_hpwl,
+            hpwl,
+        ) = self.pending
+        self.placed, self.center_x, self.center_y = placed, center_x, center_y
+        self.bound[:, nets] = bound
+        self.bound_cnt[:, nets] = bound_cnt
+        self.net_hpwl[nets] = net_hpwl
+        self.hpwl = hpwl
+        self.pending = None
+
+
+def m2m_flow_from_matrix(
+    m2m_matrix: sparse.csr_matrix, macro_name: List[str], threshold=1e-2
+) -> M2MFlow:
+    # (m1, m2) 或 (m2, m1) 任一方向超过阈值即视为相连，两个方向都取较大的 flow
+    # 内层 dict 的插入顺序与按行扫描稠密矩阵时一致，cal_dataflow 的求和顺序不变
+    num = len(macro_name)
+    coo = m2m_matrix.tocoo()
+    keep = coo.data >= threshold
+    row = coo.row[keep].astype(np.int64)
+    col = coo.col[keep].astype(np.int64)
+    pos = row * num + col
+    src = np.concatenate([row, col])
+    dst = np.concatenate([col, row])
+    pos = np.concatenate([pos, pos])
+    # 同一条边只保留最先扫描到的位置
+    order = np.lexsort((pos, dst, src))
+    src, dst, pos = src[order], dst[order], pos[order]
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    src, dst, pos = src[first], dst[first], pos[first]
+    order = np.lexsort((pos, src))
+    src, dst = src[order], dst[order]
+    sym_matrix = m2m_matrix.maximum(m2m_matrix.T).tocsr()
+    flow = np.asarray(sym_matrix[src, dst]).ravel()
+
     m2m_flow = {}
-    for mi in df.index:
+    for mi in macro_name:
         m2m_flow[mi] = {}
-    x, y = np.where(df >= threshold)
-    for id1, id2 in zip(x, y):
-        m1_name = df.columns[id1]
-        m2_name = df.columns[id2]
-        df12 = max(df.iloc[id1, id2], df.iloc[id2, id1])
-        m2m_flow[m1_name][m2_name] = m2m_flow[m2_name][m1_name] = df12
+    for id1, id2, df12 in zip(src.tolist(), dst.tolist(), flow.tolist()):
+        m2m_flow[macro_name[id1]][macro_name[id2]] = df12
     return m2m_flow
 
 
+def convert_m2m_flow(m2m_csv_file, m2m_npz_file=None) -> str:
+    # 稠密的 macro2macro.csv 转为 CSR 格式的 .npz，只保存非零元素和 macro 名字顺序
+    if m2m_npz_file is None:
+        m2m_npz_file = os.path.splitext(m2m_csv_file)[0] + ".npz"
+    df = pd.read_csv(m2m_csv_file, index_col=0)
+    if list(df.index) != list(df.columns):
+        raise ValueError(f"{m2m_csv_file}: row and column macro order differ")
+    m2m_matrix = sparse.csr_matrix(df.to_numpy(dtype=np.float64))
+    tmp_file = m2m_npz_file + ".tmp.npz"
+    np.savez(
+        tmp_file,
+        macro_name=np.array(df.columns, dtype=str),
+        data=m2m_matrix.data,
+        indices=m2m_matrix.indices,
+        indptr=m2m_matrix.indptr,
+    )
+    os.replace(tmp_file, m2m_npz_file)
+    return m2m_npz_file
+
+
+def load_m2m_flow(m2m_flow_file, threshold=1e-2) -> Tuple[sparse.csr_matrix, M2MFlow]:
+    if m2m_flow_file.endswith(".npz"):
+        with np.load(m2m_flow_file) as f:
+            macro_name = f["macro_name"].tolist()
+            m2m_matrix = sparse.csr_matrix(
+                (f["data"], f["indices"], f["indptr"]),
+                shape=(len(macro_name), len(macro_name)),
+            )
+    else:
+        df = pd.read_csv(m2m_flow_file, index_col=0)
+        macro_name = list(df.columns)
+        m2m_matrix = sparse.csr_matrix(df.to_numpy(dtype=np.float64))
+    return m2m_matrix, m2m_flow_from_matrix(m2m_matrix, macro_name, threshold)
+
+
+def m2m_flow_file(benchmark: str) -> str:
+    # 优先使用转换好的稀疏格式，csv 更新过时仍读 csv
+    m2m_csv_file = os.path.join("benchmarks", benchmark, "macro2macro.csv")
+    m2m_npz_file = os.path.join("benchmarks", benchmark, "macro2macro.npz")
+    if os.path.exists(m2m_npz_file) and (
+        not os.path.exists(m2m_csv_file)
+        or os.path.getmtime(m2m_npz_file) >= os.path.getmtime(m2m_csv_file)
+    ):
+        return m2m_npz_file
+    return m2m_csv_file
+
+
+def get_m2m_flow(m2m_flow_file, threshold=1e-2) -> M2MFlow:
+    return load_m2m_flow(m2m_flow_file, threshold)[1]
+
+
 def cal_dataflow(place_record: PlaceRecord, placedb: PlaceDB, m2m_flow: M2MFlow):
     dataflow_total = 0
     for node_name1 in placedb.macro_name:
@@ -301,63 +701,60 @@ def cal_dataflow(place_record: PlaceRecord, placedb: PlaceDB, m2m_flow: M2MFlow)
 
 
 def cal_regularity(place_record: PlaceRecord, placedb: PlaceDB):
-    regularity = 0
-    for node_name in placedb.macro_name:
-        left_x = place_record[node_name].bottom_left_x
-        right_x = place_record[node_name].bottom_left_x + place_record[node_name].width
-        bottom_y = place_record[node_name].bottom_left_y
-        top_y = place_record[node_name].bottom_left_y + place_record[node_name].height
-        regularity += placedb.node_info[node_name].area * cal_pos_regularity(
-            left_x, right_x, bottom_y, top_y, node_name, placedb
-        )
+    macro_name = list(placedb.macro_name)
+    node_idx = [place_record.node_index[node_name] for node_name in macro_name]
+    regu = cal_pos_regularity(
+        place_record.bottom_left_x[node_idx],
+        place_record.bottom_left_y[node_idx],
+        place_record.width[node_idx],
+        place_record.height[node_idx],
+        placedb,
+    )
+    area = np.array([placedb.node_info[node_name].area for node_name in macro_name])
+    # 按 macro 顺序逐个累加
+    regularity = sum((area * regu).tolist())
     return regularity
 
 
-def cal_pos_regularity(left_x, right_x, bottom_y, top_y, node_name, placedb: PlaceDB):
-    center_x = left_x + 0.5 * placedb.node_info[node_name].width
-    center_y = bottom_y + 0.5 * placedb.node_info[node_name].height
-    dist = distance.euclidean(
-        (center_x, center_y), (placedb.center_x, placedb.center_y)
+def cal_pos_regularity(left_x, bottom_y, width, height, placedb: PlaceDB):
+    # 支持 numpy 数组广播，逐元素计算 macro 放在 (left_x, bottom_y) 时的规整度
+    right_x = left_x + width
+    top_y = bottom_y + height
+    center_x = left_x + 0.5 * width
+    center_y = bottom_y + 0.5 * height
+    dist = np.hypot(center_x - placedb.center_x, center_y - placedb.center_y)
+    in_virtual_boundary = (
+        (left_x >= placedb.left_boundary)
+        & (right_x <= placedb.right_boundary)
+        & (bottom_y >= placedb.bottom_boundary)
+        & (top_y <= placedb.top_boundary)
+    )
+    left_right_mid = (
+        ((left_x <= placedb.left_boundary) | (right_x >= placedb.right_boundary))
+        & (top_y <= placedb.top_boundary)
+        & (bottom_y >= placedb.bottom_boundary)
+    )
+    mid_bottom_top = (
+        ((bottom_y <= placedb.bottom_boundary) | (top_y >= placedb.top_boundary))
+        & (left_x >= placedb.left_boundary)
+        & (right_x <= placedb.right_boundary)
+    )
+    dist_x = np.minimum(
+        np.abs(left_x - placedb.left_boundary), np.abs(placedb.right_boundary - right_x)
+    )
+    dist_y = np.minimum(
+        np.abs(bottom_y - placedb.bottom_boundary), np.abs(placedb.top_boundary - top_y)
+    )
+    regu = np.select(
+        [dist <= placedb.r, in_virtual_boundary, left_right_mid, mid_bottom_top],
+        [
+            placedb.L2 / (dist + 1e-5),
+            np.minimum(dist_x, dist_y),
+            dist_x,
+            dist_y,
+        ],
+        np.maximum(dist_x, dist_y),
     )
-    if dist > placedb.r:
-        if placedb.in_virtual_boundary(left_x, right_x, bottom_y, top_y):
-            regu = min(
-                abs(left_x - placedb.left_boundary),
-                abs(placedb.right_boundary - right_x),
-                abs(bottom_y - placedb.bottom_boundary),
-                abs(placedb.top_boundary - top_y),
-            )
-        elif (
-            (left_x <= placedb.left_boundary or right_x >= placedb.right_boundary)
-            and top_y <= placedb.top_boundary
-            and bottom_y >= placedb.bottom_boundary
-        ):  # left/right - mid
-            regu = min(
-                abs(placedb.left_boundary - left_x),
-                abs(right_x - placedb.right_boundary),
-            )
-        elif (
-            (bottom_y <= placedb.bottom_boundary or top_y >= placedb.top_boundary)
-            and left_x >= placedb.left_boundary
-            and right_x <= placedb.right_boundary
-        ):  # mid - bottom/top
-            regu = min(
-                abs(placedb.bottom_boundary - bottom_y),
-                abs(top_y - placedb.top_boundary),
-            )
-        else:
-            regu = max(
-                min(
-                    abs(left_x - placedb.left_boundary),
-                    abs(placedb.right_boundary - right_x),
-                ),
-                min(
-                    abs(bottom_y - placedb.bottom_boundary),
-                    abs(placedb.top_boundary - top_y),
-                ),
-            )
-    else:
-        regu = placedb.L2 / (dist + 1e-5)
     return regu
 
 
@@ -369,6 +766,31 @@ def df_div(d, df):
     return d / df
 
 
+def weighted_l1(points: np.ndarray, weights: np.ndarray, coords: np.ndarray):
+    # 对每个 coords[j] 计算 sum_i weights[i] * |points[i] - coords[j]|：
+    # points 排序后用前缀和分别求左右两侧的和，O((n + m) log n)
+    order = np.argsort(points)
+    points, weights = points[order], weights[order]
+    weight_sum = np.concatenate([[0.0], np.cumsum(weights)])
+    moment_sum = np.concatenate([[0.0], np.cumsum(points * weights)])
+    k = np.searchsorted(points, coords)
+    left = coords * weight_sum[k] - moment_sum[k]
+    right = (moment_sum[-1] - moment_sum[k]) - coords * (weight_sum[-1] - weight_sum[k])
+    return left + right
+
+
+def is_exact_weighted_l1(
+    points: np.ndarray, weights: np.ndarray, coords: np.ndarray, frac_bits: int = 8
+) -> bool:
+    # 输入全是 2^-frac_bits 的整数倍且乘积之和足够小时，前缀和与逐项累加都没有舍入
+    values = np.concatenate([points, weights, coords])
+    scaled = values * (1 << frac_bits)
+    if not np.all(np.floor(scaled) == scaled):
+        return False
+    bound = (np.max(np.abs(points)) + np.max(np.abs(coords))) * np.sum(np.abs(weights))
+    return bound < 2.0 ** (51 - 2 * frac_bits)
+
+
 def cal_datamask(
     node_name1: str,
     placedb: PlaceDB,
@@ -379,27 +801,35 @@ def cal_datamask(
     m2m_flow,
     df_func=df_mul,
 ):
-    data_mask = np.zeros((grid_num, grid_num))
-    for node_name2 in m2m_flow[node_name1]:
-        # 在 m2m_flow 中的点，可能是被删除的 port，所以需要标记是否有效
-        if node_name2 in place_record:
-            pos_x2, pos_y2 = (
-                place_record[node_name2].center_x,
-                place_record[node_name2].center_y,
+    # 在 m2m_flow 中的点，可能是被删除的 port，所以需要标记是否有效
+    node_name_ls = [
+        node_name2 for node_name2 in m2m_flow[node_name1] if node_name2 in place_record
+    ]
+    if len(node_name_ls) == 0:
+        return np.zeros((grid_num, grid_num))
+    node_idx = [place_record.node_index[node_name2] for node_name2 in node_name_ls]
+    pos_x2 = place_record.center_x[node_idx]
+    pos_y2 = place_record.center_y[node_idx]
+    flow = np.array([m2m_flow[node_name1][node_name2] for node_name2 in node_name_ls])
+    # 使用曼哈顿距离，data mask 在 x/y 方向可分离
+    coords = grid_coords(grid_num, grid_size)
+    pos_x = coords + 0.5 * placedb.node_info[node_name1].width
+    pos_y = coords + 0.5 * placedb.node_info[node_name1].height
+
+    # df_mul/df_div 对距离是线性的，每个方向是一个带权 L1 距离之和，可以用前缀和计算。
+    # 前缀和改变了求和顺序，只在没有舍入时使用（df_div 要求 flow 为 2 的幂）
+    if df_func is df_mul or (df_func is df_div and np.all(np.frexp(flow)[0] == 0.5)):
+        weights = flow if df_func is df_mul else 1 / flow
+        if is_exact_weighted_l1(
+            np.concatenate([pos_x2, pos_y2]), weights, np.concatenate([pos_x, pos_y])
+        ):
+            return (
+                weighted_l1(pos_x2, weights, pos_x)[:, None]
+                + weighted_l1(pos_y2, weights, pos_y)[None, :]
             )
-            for col in range(grid_num):
-                # 改为使用曼哈顿距离，减少对 row 的遍历，降低计算量
-                row = col
-                pos_x = row * grid_size + 0.5 * placedb.node_info[node_name1].width
-                pos_y = col * grid_size + 0.5 * placedb.node_info[node_name1].height
-                data_mask[row, :] += df_func(
-                    abs(pos_x2 - pos_x), m2m_flow[node_name1][node_name2]
-                )
-                data_mask[:, col] += df_func(
-                    abs(pos_y2 - pos_y), m2m_flow[node_name1][node_name2]
-                )
-
-    return data_mask
+    x_cost = df_func(np.abs(pos_x2[:, None] - pos_x[None, :]), flow[:, None])
+    y_cost = df_func(np.abs(pos_y2[:, None] - pos_y[None, :]), flow[:, None])
+    return combine_separable_cost(x_cost, y_cost)
 
 
 def draw_mask(mask: np.ndarray):
@@ -408,37 +838,68 @@ def draw_mask(mask: np.ndarray):
     plt.close()
 
 
+class OccupancyGrid:
+    # 已放置 macro 占据的网格，由 placer 维护，每放置一个 macro 只标记一次。
+    # 某个尺寸的 macro 的 position mask 由占据网格的二维前缀和得到，
+    # 代价是 O(grid_num^2)，与已经放置的 macro 数量无关
+    def __init__(self, grid_num: int) -> None:
+        self.grid_num = grid_num
+        self.occupied = np.zeros((grid_num, grid_num), dtype=bool)
+        self.integral: np.ndarray = None  # 前缀和，按需重新计算
+
+    def copy(self) -> "OccupancyGrid":
+        occupancy = OccupancyGrid(self.grid_num)
+        occupancy.occupied = self.occupied.copy()
+        occupancy.integral = self.integral
+        return occupancy
+
+    def place(self, record: Record):
+        left_x = max(0, record.grid_x)
+        bottom_y = max(0, record.grid_y)
+        right_x = min(self.grid_num, record.grid_x + record.scaled_width)
+        top_y = min(self.grid_num, record.grid_y + record.scaled_height)
+        if left_x < right_x and bottom_y < top_y:
+            self.occupied[left_x:right_x, bottom_y:top_y] = True
+            self.integral = None
+
+    def position_mask(self, scaled_width: int, scaled_height: int) -> np.ndarray:
+        # (x, y) 合法当且仅当 [x, x + w) x [y, y + h) 内没有被占据的网格
+        position_mask = np.zeros((self.grid_num, self.grid_num), dtype=bool)
+        num_x = self.grid_num - scaled_width
+        num_y = self.grid_num - scaled_height
+        if num_x <= 0 or num_y <= 0:
+            return position_mask
+        if self.integral is None:
+            self.integral = np.zeros((self.grid_num + 1, self.grid_num + 1), np.int32)
+            self.integral[1:, 1:] = self.occupied.cumsum(0).cumsum(1)
+        integral = self.integral
+        window_sum = (
+            integral[
+                scaled_width : scaled_width + num_x,
+                scaled_height : scaled_height + num_y,
+            ]
+            - integral[:num_x, scaled_height : scaled_height + num_y]
+            - integral[scaled_width : scaled_width + num_x, :num_y]
+            + integral[:num_x, :num_y]
+        )
+        position_mask[:num_x, :num_y] = window_sum == 0
+        return position_mask
+
+
 def cal_positionmask(
     node_name1: str,
     placedb: PlaceDB,
     place_record: PlaceRecord,
     grid_num,  # , draw=False
 ):
-    scaled_width = placedb.node_info[node_name1].scaled_width
-    scaled_height = placedb.node_info[node_name1].scaled_height
-
-    position_mask = np.zeros((grid_num, grid_num), dtype=bool)
-    position_mask[: grid_num - scaled_width, : grid_num - scaled_height] = True
-    # draw_position_mask(position_mask)
-
-    for node_name2 in place_record.keys():
-        bottom_left_x = max(0, place_record[node_name2].grid_x - scaled_width + 1)
-        bottom_left_y = max(0, place_record[node_name2].grid_y - scaled_height + 1)
-        top_right_x = min(
-            grid_num - 1,
-            place_record[node_name2].grid_x + place_record[node_name2].scaled_width,
-        )
-        top_right_y = min(
-            grid_num - 1,
-            place_record[node_name2].grid_y + place_record[node_name2].scaled_height,
-        )
-
-        position_mask[bottom_left_x:top_right_x, bottom_left_y:top_right_y] = False
-        # if draw and (node_name1 == "o451617" or node_name1 == "o450928"):
-        #     draw_mask(position_mask)
-        # pass
-        # draw_position_mask(position_mask)
-    return position_mask
+    # 从头构造 occupancy，placer 中应直接维护 OccupancyGrid
+    occupancy = OccupancyGrid(grid_num)
+    for record in place_record.values():
+        occupancy.place(record)
+    return occupancy.position_mask(
+        placedb.node_info[node_name1].scaled_width,
+        placedb.node_info[node_name1].scaled_height,
+    )
 
 
 def chose_position(
@@ -446,23 +907,31 @@ def chose_position(
     value_mask: np.ndarray,
     position_mask: np.ndarray,
     place_record: PlaceRecord,
+    select: str = "nearest",
+    top_k: int = 1,
 ) -> Tuple[int, int]:
-    min_ele = np.min(value_mask[position_mask])
-    chosen_loc_x, chosen_loc_y = np.where(value_mask == min_ele)
-    distance_ls = []
-    pos_ls = []
-    for grid_xi, grid_yi in zip(chosen_loc_x, chosen_loc_y):
-        if position_mask[grid_xi, grid_yi]:
-            pos_ls.append((grid_xi, grid_yi))
-            distance_ls.append(
-                distance.euclidean(
-                    (grid_xi, grid_yi),
-                    (place_record[node_name].grid_x, place_record[node_name].grid_y),
-                )
-            )
-    idx = np.argmin(distance_ls)
-    chosen_loc_x, chosen_loc_y = pos_ls[idx]
-    return chosen_loc_x, chosen_loc_y
+    # 只在合法格子上比较。select 为 nearest 时选择 value 最小的格子，相同时选择离
+    # guiding 最近的格子，距离也相同时取行优先扫描中最先出现的格子，与原先逐个计算
+    # euclidean 距离再 argmin 的结果一致；
+    # random：在 value 最小的格子中均匀随机选择；
+    # top_k：按 (value, 距离) 排序取前 top_k 个格子，从中均匀随机选择
+    feasible_x, feasible_y = np.nonzero(position_mask)
+    value = value_mask[feasible_x, feasible_y]
+    dist = (feasible_x - place_record[node_name].grid_x) ** 2 + (
+        feasible_y - place_record[node_name].grid_y
+    ) ** 2
+    if select == "nearest":
+        tie = np.flatnonzero(value == np.min(value))
+        idx = tie[np.argmin(dist[tie])]
+    elif select == "random":
+        tie = np.flatnonzero(value == np.min(value))
+        idx = tie[np.random.randint(len(tie))]
+    elif select == "top_k":
+        best = np.lexsort((dist, value))[:top_k]
+        idx = best[np.random.randint(len(best))]
+    else:
+        raise ValueError(f"unknown select: {select}")
+    return feasible_x[idx], feasible_y[idx]
 
 
 #! 实现 data-based 贪心策略
@@ -475,7 +944,8 @@ def datamask_placer(
     m2m_flow,
 ):
     shuffle = 0
-    new_place_record: PlaceRecord = {}
+    new_place_record = PlaceRecord(placedb, grid_size)
+    occupancy = OccupancyGrid(grid_num)
 
     time_start = time.time()
     N2_time = 0
@@ -488,13 +958,14 @@ def datamask_placer(
             bottom_left_y = placedb.node_info[node_name].bottom_left_y
         else:
             #! 这部分为什么不直接用 place_record 里的结果？line 294-300
-            position_mask = cal_positionmask(
-                node_name, placedb, new_place_record, grid_num
+            position_mask = occupancy.position_mask(
+                placedb.node_info[node_name].scaled_width,
+                placedb.node_info[node_name].scaled_height,
             )
             if not np.any(position_mask == 1):
                 print("no_legal_place")
                 print("\n")
-                return {}, my_inf
+                return PlaceRecord(placedb, grid_size), my_inf
 
             # TODO !
             time0 = time.time()
@@ -515,20 +986,10 @@ def datamask_placer(
             bottom_left_y = grid_size * chosen_loc_y
             N2_time += time.time() - time0
 
-        width, height = (
-            placedb.node_info[node_name].width,
-            placedb.node_info[node_name].height,
-        )
-        new_place_record[node_name] = Record(
-            node_name,
-            width,
-            height,
-            chosen_loc_x,
-            chosen_loc_y,
-            bottom_left_x,
-            bottom_left_y,
-            grid_size,
+        new_place_record.set(
+            node_name, chosen_loc_x, chosen_loc_y, bottom_left_x, bottom_left_y
         )
+        occupancy.place(new_place_record[node_name])
     time_end = time.time()
 
     verified_hpwl = cal_hpwl(new_place_record, placedb)
@@ -542,73 +1003,190 @@ def datamask_placer(
     return new_place_record, verified_hpwl
 
 
+@lru_cache(maxsize=None)
+def grid_coords(grid_num: int, grid_size: int) -> np.ndarray:
+    # 每个网格左下角的坐标，col * grid_size
+    coords = np.arange(grid_num, dtype=float) * grid_size
+    coords.flags.writeable = False
+    return coords
+
+
+@lru_cache(maxsize=None)
+def upper_triangle(grid_num: int) -> np.ndarray:
+    # mask[row, col] 中 row <= col 的部分
+    upper = np.triu(np.ones((grid_num, grid_num), dtype=bool))
+    upper.flags.writeable = False
+    return upper
+
+
+def cal_wire_cost(
+    coords: np.ndarray,
+    pin_offset: np.ndarray,
+    net_min: np.ndarray,
+    net_max: np.ndarray,
+) -> np.ndarray:
+    # 每个 pin 一行：pin 坐标落在 net bbox 外时，到 bbox 边界的距离
+    # x_min <= x_max，两个 clip 至多有一个非零，和逐列 if/elif 的结果一致
+    pin_co = coords[None, :] + pin_offset[:, None]
+    return np.maximum(net_min[:, None] - pin_co, 0) + np.maximum(
+        pin_co - net_max[:, None], 0
+    )
+
+
+def is_exact_sum(cost: np.ndarray, frac_bits: int = 8) -> bool:
+    # cost 全是 2^-frac_bits 的整数倍且总和足够小时，浮点加法没有舍入，
+    # 任意求和顺序的结果都完全相同
+    scaled = cost * (1 << frac_bits)
+    if not np.all(np.floor(scaled) == scaled):
+        return False
+    return np.sum(np.max(cost, axis=1)) < 2.0 ** (52 - frac_bits)
+
+
 def cal_wiremask(
     node_name,
     placedb: PlaceDB,
     grid_num,
     grid_size,
-    net_ls: Dict[str, Net],
-    hpwl_info_for_each_net,
+    net_bbox: "NetBBox",
 ):
+    # 把 macro 所有 pin 及其 net 的 bbox 展开成数组，一次性广播计算
+    net_ids, pin_x_offset, pin_y_offset = placedb.node_pins[node_name]
+    placed = net_bbox.placed()[net_ids]
+    if not np.any(placed):
+        return np.zeros((grid_num, grid_num))
+    net_ids = net_ids[placed]
+    x_offset = pin_x_offset[placed] + 0.5 * placedb.node_info[node_name].width
+    y_offset = pin_y_offset[placed] + 0.5 * placedb.node_info[node_name].height
+
+    coords = grid_coords(grid_num, grid_size)
+    x_cost = cal_wire_cost(
+        coords, x_offset, net_bbox.x_min[net_ids], net_bbox.x_max[net_ids]
+    )
+    y_cost = cal_wire_cost(
+        coords, y_offset, net_bbox.y_min[net_ids], net_bbox.y_max[net_ids]
+    )
+    return combine_separable_cost(x_cost, y_cost)
+
+
+def combine_separable_cost(x_cost: np.ndarray, y_cost: np.ndarray) -> np.ndarray:
+    # wire/data mask 在 x/y 方向可分离：mask[row, col] = x_cost[row] + y_cost[col]
+    if is_exact_sum(x_cost) and is_exact_sum(y_cost):
+        return x_cost.sum(axis=0)[:, None] + y_cost.sum(axis=0)[None, :]
+    # 存在舍入时按逐列累加的顺序求和，保证与原实现逐位一致：
+    # 每个 pin 依次处理，row <= col 的格子先加 x 再加 y，其余先加 y 再加 x
+    grid_num = x_cost.shape[1]
+    upper = upper_triangle(grid_num)
     wire_mask = np.zeros((grid_num, grid_num))
-    for net_name in net_ls.keys():
-        if net_name in hpwl_info_for_each_net.keys():
-            for pin in net_ls[net_name][node_name]:
-                x_offset = pin.x_offset + 0.5 * placedb.node_info[node_name].width
-                y_offset = pin.y_offset + 0.5 * placedb.node_info[node_name].height
-                for col in range(grid_num):
-                    x_co = col * grid_size + x_offset
-                    y_co = col * grid_size + y_offset
-                    if x_co < hpwl_info_for_each_net[net_name]["x_min"]:
-                        wire_mask[col, :] += (
-                            hpwl_info_for_each_net[net_name]["x_min"] - x_co
-                        )
-                    elif x_co > hpwl_info_for_each_net[net_name]["x_max"]:
-                        wire_mask[col, :] += (
-                            x_co - hpwl_info_for_each_net[net_name]["x_max"]
-                        )
-                    if y_co < hpwl_info_for_each_net[net_name]["y_min"]:
-                        wire_mask[:, col] += (
-                            hpwl_info_for_each_net[net_name]["y_min"] - y_co
-                        )
-                    elif y_co > hpwl_info_for_each_net[net_name]["y_max"]:
-                        wire_mask[:, col] += (
-                            y_co - hpwl_info_for_each_net[net_name]["y_max"]
-                        )
+    for x_pin, y_pin in zip(x_cost, y_cost):
+        x_pin, y_pin = x_pin[:, None], y_pin[None, :]
+        wire_mask = np.where(
+            upper, (wire_mask + x_pin) + y_pin, (wire_mask + y_pin) + x_pin
+        )
     return wire_mask
 
 
+class NetBBox:
+    # 每个 net 中已放置的 pin 的 bbox，下标与 placedb.net_name_ls 一致，
+    # 还没有 pin 被放置的 net 为 (inf, -inf)
+    def __init__(self, net_cnt: int) -> None:
+        self.x_min = np.full(net_cnt, np.inf)
+        self.x_max = np.full(net_cnt, -np.inf)
+        self.y_min = np.full(net_cnt, np.inf)
+        self.y_max = np.full(net_cnt, -np.inf)
+
+    def copy(self) -> "NetBBox":
+        net_bbox = NetBBox(0)
+        net_bbox.x_min = self.x_min.copy()
+        net_bbox.x_max = self.x_max.copy()
+        net_bbox.y_min = self.y_min.copy()
+        net_bbox.y_max = self.y_max.copy()
+        return net_bbox
+
+    def placed(self) -> np.ndarray:
+        return self.x_min <= self.x_max
+
+
 def update_info(
     node_name,
     placedb: PlaceDB,
     bottom_left_x,
     bottom_left_y,
-    net_ls: Dict[str, Net],
-    hpwl_info_for_each_net,
+    net_bbox: NetBBox,
 ):
     center_loc_x = bottom_left_x + 0.5 * placedb.node_info[node_name].width
     center_loc_y = bottom_left_y + 0.5 * placedb.node_info[node_name].height
-    for net_name in net_ls.keys():
-        for pin in net_ls[net_name][node_name]:
-            x_offset = pin.x_offset + center_loc_x
-            y_offset = pin.y_offset + center_loc_y
-            if net_name not in hpwl_info_for_each_net.keys():
-                hpwl_info_for_each_net[net_name] = {
-                    "x_max": x_offset,
-                    "x_min": x_offset,
-                    "y_max": y_offset,
-                    "y_min": y_offset,
-                }
-            else:
-                if hpwl_info_for_each_net[net_name]["x_max"] < x_offset:
-                    hpwl_info_for_each_net[net_name]["x_max"] = x_offset
-                elif hpwl_info_for_each_net[net_name]["x_min"] > x_offset:
-                    hpwl_info_for_each_net[net_name]["x_min"] = x_offset
-                if hpwl_info_for_each_net[net_name]["y_max"] < y_offset:
-                    hpwl_info_for_each_net[net_name]["y_max"] = y_offset
-                elif hpwl_info_for_each_net[net_name]["y_min"] > y_offset:
-                    hpwl_info_for_each_net[net_name]["y_min"] = y_offset
-    return hpwl_info_for_each_net
+    net_ids, pin_x_offset, pin_y_offset = placedb.node_pins[node_name]
+    x_offset = pin_x_offset + center_loc_x
+    y_offset = pin_y_offset + center_loc_y
+    # 同一个 net 可能有多个 pin，需要用 ufunc.at 累积
+    np.minimum.at(net_bbox.x_min, net_ids, x_offset)
+    np.maximum.at(net_bbox.x_max, net_ids, x_offset)
+    np.minimum.at(net_bbox.y_min, net_ids, y_offset)
+    np.maximum.at(net_bbox.y_max, net_ids, y_offset)
+    return net_bbox
+
+
+class PlacerTrace:
+    # 记录一次贪心放置中每一步的 guiding 位置和最终选择的位置。
+    # 第 i 步的结果只取决于前 i 步的结果和第 i 个 macro 的 guiding 位置，
+    # 因此下一次放置可以直接复用未变化的前缀，从第一个变化的位置继续放置。
+    def __init__(self, grid_num: int, grid_size: int) -> None:
+        self.grid_num = grid_num
+        self.grid_size = grid_size
+        self.node_name_ls: List[str] = []
+        self.guiding: List[Tuple[int, int]] = []
+        self.chosen: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.node_name_ls)
+
+    def copy(self) -> "PlacerTrace":
+        trace = PlacerTrace(self.grid_num, self.grid_size)
+        trace.node_name_ls = self.node_name_ls.copy()
+        trace.guiding = self.guiding.copy()
+        trace.chosen = self.chosen.copy()
+        return trace
+
+    def append(self, node_name: str, guiding, chosen):
+        self.node_name_ls.append(node_name)
+        self.guiding.append(guiding)
+        self.chosen.append(chosen)
+
+    def truncate(self, length: int):
+        del self.node_name_ls[length:]
+        del self.guiding[length:]
+        del self.chosen[length:]
+
+    def resume_index(
+        self, node_name_ls: List[str], placedb: PlaceDB, place_record: PlaceRecord
+    ) -> int:
+        # 第一个不能复用的位置。guiding 等于上次选择的位置时，该位置在同样的状态下
+        # 仍是 value 最小且距离为 0 的格子，结果不变，同样可以复用
+        for cnt, node_name in enumerate(node_name_ls):
+            if cnt >= len(self.node_name_ls) or self.node_name_ls[cnt] != node_name:
+                return cnt
+            if placedb.node_info[node_name].is_port:  # port 位置固定
+                continue
+            guiding = (place_record[node_name].grid_x, place_record[node_name].grid_y)
+            if guiding != self.guiding[cnt] and guiding != self.chosen[cnt]:
+                return cnt
+        return len(node_name_ls)
+
+
+def resume_trace(
+    trace: PlacerTrace,
+    node_name_ls: List[str],
+    placedb: PlaceDB,
+    grid_num,
+    grid_size,
+    place_record: PlaceRecord,
+) -> int:
+    if trace is None:
+        return 0
+    assert trace.grid_num == grid_num and trace.grid_size == grid_size
+    start = trace.resume_index(node_name_ls, placedb, place_record)
+    trace.truncate(start)
+    return start
 
 
 # wire-based 贪心策略
@@ -618,65 +1196,78 @@ def wiremask_placer(
     grid_num,
     grid_size,
     place_record: PlaceRecord,
+    trace: PlacerTrace = None,
+    hpwl_evaluator: "IncrementalHPWL" = None,
 ):
+    # trace 不为空时，复用其中未变化的前缀，并原地更新为本次放置的记录；
+    # hpwl_evaluator 不为空时，增量计算 hpwl（propose），是否接受由调用方 commit
     shuffle = 0
-    new_place_record: PlaceRecord = {}
-    hpwl_info_for_each_net = {}
+    new_place_record = PlaceRecord(placedb, grid_size)
+    net_bbox = NetBBox(len(placedb.net_name_ls))
+    occupancy = OccupancyGrid(grid_num)
 
     time_start = time.time()
     N2_time = 0
-    for node_name in node_name_ls:
-        net_ls = {}
-        for net_id in placedb.net_info:
-            if node_name in placedb.net_info[net_id]:
-                net_ls[net_id] = placedb.net_info[net_id]
+    start = resume_trace(
+        trace, node_name_ls, placedb, grid_num, grid_size, place_record
+    )
+    for cnt, node_name in enumerate(node_name_ls):
         if placedb.node_info[node_name].is_port:
             new_place_record[node_name] = place_record[node_name]
             bottom_left_x = placedb.node_info[node_name].bottom_left_x
             bottom_left_y = placedb.node_info[node_name].bottom_left_y
+            if trace is not None and cnt >= start:
+                trace.append(node_name, None, None)
         else:
-            #! 这部分为什么不直接用 place_record 里的结果？line 294-300
-            position_mask = cal_positionmask(
-                node_name, placedb, new_place_record, grid_num
-            )
-            if not np.any(position_mask == 1):
-                print("no_legal_place\n\n")
-                return {}, my_inf
+            if cnt < start:
+                chosen_loc_x, chosen_loc_y = trace.chosen[cnt]
+            else:
+                #! 这部分为什么不直接用 place_record 里的结果？line 294-300
+                position_mask = occupancy.position_mask(
+                    placedb.node_info[node_name].scaled_width,
+                    placedb.node_info[node_name].scaled_height,
+                )
+                if not np.any(position_mask == 1):
+                    print("no_legal_place\n\n")
+                    return PlaceRecord(placedb, grid_size), my_inf
 
-            time0 = time.time()
-            wire_mask = cal_wiremask(
-                node_name, placedb, grid_num, grid_size, net_ls, hpwl_info_for_each_net
-            )
-            chosen_loc_x, chosen_loc_y = chose_position(
-                node_name, wire_mask, position_mask, place_record
-            )
+                time0 = time.time()
+                wire_mask = cal_wiremask(
+                    node_name, placedb, grid_num, grid_size, net_bbox
+                )
+                chosen_loc_x, chosen_loc_y = chose_position(
+                    node_name, wire_mask, position_mask, place_record
+                )
+                N2_time += time.time() - time0
+                if trace is not None:
+                    trace.append(
+                        node_name,
+                        (
+                            place_record[node_name].grid_x,
+                            place_record[node_name].grid_y,
+                        ),
+                        (chosen_loc_x, chosen_loc_y),
+                    )
             bottom_left_x = grid_size * chosen_loc_x
             bottom_left_y = grid_size * chosen_loc_y
-            new_place_record[node_name] = Record(
-                node_name,
-                placedb.node_info[node_name].width,
-                placedb.node_info[node_name].height,
-                chosen_loc_x,
-                chosen_loc_y,
-                bottom_left_x,
-                bottom_left_y,
-                grid_size,
+            new_place_record.set(
+                node_name, chosen_loc_x, chosen_loc_y, bottom_left_x, bottom_left_y
             )
-            N2_time += time.time() - time0
-        hpwl_info_for_each_net = update_info(
-            node_name,
-            placedb,
-            bottom_left_x,
-            bottom_left_y,
-            net_ls,
-            hpwl_info_for_each_net,
+        occupancy.place(new_place_record[node_name])
+        net_bbox = update_info(
+            node_name, placedb, bottom_left_x, bottom_left_y, net_bbox
         )
     time_end = time.time()
 
-    hpwl = cal_hpwl(new_place_record, placedb)
+    if hpwl_evaluator is None:
+        hpwl = cal_hpwl(new_place_record, placedb)
+    else:
+        hpwl = hpwl_evaluator.propose(new_place_record)
     # print("time: {}\nN2_time: {}\nhpwl: {}\nshuffle or not: {}".format(time_end - time_start, N2_time, hpwl, shuffle))
     print("time:", time_end - time_start)
     print("N2_time:", N2_time)
+    if trace is not None:
+        print("resume from:", start)
     print("hpwl:", hpwl)
     print("shuffle or not: ", shuffle)
     print("\n")
@@ -686,17 +1277,19 @@ def wiremask_placer(
 def cal_regularity_mask(
     node_name1: str, placedb: PlaceDB, grid_num: int, grid_size: int
 ):
-    regu_mask = np.zeros((grid_num, grid_num))
-    for row in range(grid_num):
-        left_x = row * grid_size
-        right_x = row * grid_size + placedb.node_info[node_name1].width
-        for col in range(grid_num):
-            bottom_y = col * grid_size
-            top_y = col * grid_size + placedb.node_info[node_name1].height
-            regu_mask[row, col] = cal_pos_regularity(
-                left_x, right_x, bottom_y, top_y, node_name1, placedb
-            )
-    return regu_mask
+    # 规整度 mask 只与 macro 尺寸、网格和 center core/virtual boundary 的参数有关，
+    # 缓存在 placedb 中，跨 placer 调用复用
+    width = placedb.node_info[node_name1].width
+    height = placedb.node_info[node_name1].height
+    key = (width, height, grid_num, grid_size) + placedb.regularity_params()
+    if key not in placedb.regularity_mask:
+        coords = grid_coords(grid_num, grid_size)
+        regu_mask = cal_pos_regularity(
+            coords[:, None], coords[None, :], width, height, placedb
+        )
+        regu_mask.flags.writeable = False
+        placedb.regularity_mask[key] = regu_mask
+    return placedb.regularity_mask[key]
 
 
 def mixed_placer(
@@ -709,26 +1302,37 @@ def mixed_placer(
     alpha=0.6,
     beta=0.3,
     gamma=0.1,
+    trace: PlacerTrace = None,
 ):
+    # trace 的用法同 wiremask_placer，同一个 trace 只能用于相同的 alpha/beta/gamma
     alpha, beta, gamma = l1_normalize([alpha, beta, gamma])
-    place_record_new: PlaceRecord = {}
-    hpwl_info_for_each_net = {}
+    place_record_new = PlaceRecord(placedb, grid_size)
+    net_bbox = NetBBox(len(placedb.net_name_ls))
     total_regu_mask = {}
+    occupancy = OccupancyGrid(grid_num)
 
-    for node_name in node_name_ls:
-        if alpha > 0:
-            net_ls = {}
-            for net_id in placedb.net_info:
-                if node_name in placedb.net_info[net_id]:
-                    net_ls[net_id] = placedb.net_info[net_id]
+    start = resume_trace(
+        trace, node_name_ls, placedb, grid_num, grid_size, place_record
+    )
+    for cnt, node_name in enumerate(node_name_ls):
         if placedb.node_info[node_name].is_port:
             place_record_new[node_name] = place_record[node_name]
             bottom_left_x = placedb.node_info[node_name].bottom_left_x
             bottom_left_y = placedb.node_info[node_name].bottom_left_y
+            if trace is not None and cnt >= start:
+                trace.append(node_name, None, None)
+        elif cnt < start:
+            chosen_loc_x, chosen_loc_y = trace.chosen[cnt]
+            bottom_left_x = grid_size * chosen_loc_x
+            bottom_left_y = grid_size * chosen_loc_y
+            place_record_new.set(
+                node_name, chosen_loc_x, chosen_loc_y, bottom_left_x, bottom_left_y
+            )
         else:
             # print(node_name, end=", ")
-            position_mask = cal_positionmask(
-                node_name, placedb, place_record_new, grid_num
+            position_mask = occupancy.position_mask(
+                placedb.node_info[node_name].scaled_width,
+                placedb.node_info[node_name].scaled_height,
             )
             if not np.any(position_mask):
                 print(f"\n{node_name}\tno_legal_place")
@@ -738,12 +1342,7 @@ def mixed_placer(
 
             if alpha > 0:
                 wiremask = cal_wiremask(
-                    node_name,
-                    placedb,
-                    grid_num,
-                    grid_size,
-                    net_ls,
-                    hpwl_info_for_each_net,
+                    node_name, placedb, grid_num, grid_size, net_bbox
                 )
                 wiremask = normalize(wiremask)
             else:
@@ -773,26 +1372,21 @@ def mixed_placer(
             chosen_loc_x, chosen_loc_y = chose_position(
                 node_name, mask, position_mask, place_record
             )
+            if trace is not None:
+                trace.append(
+                    node_name,
+                    (place_record[node_name].grid_x, place_record[node_name].grid_y),
+                    (chosen_loc_x, chosen_loc_y),
+                )
             bottom_left_x = grid_size * chosen_loc_x
             bottom_left_y = grid_size * chosen_loc_y
-            place_record_new[node_name] = Record(
-                node_name,
-                placedb.node_info[node_name].width,
-                placedb.node_info[node_name].height,
-                chosen_loc_x,
-                chosen_loc_y,
-                bottom_left_x,
-                bottom_left_y,
-                grid_size,
+            place_record_new.set(
+                node_name, chosen_loc_x, chosen_loc_y, bottom_left_x, bottom_left_y
             )
+        occupancy.place(place_record_new[node_name])
         if alpha > 0:
-            hpwl_info_for_each_net = update_info(
-                node_name,
-                placedb,
-                bottom_left_x,
-                bottom_left_y,
-                net_ls,
-                hpwl_info_for_each_net,
+            net_bbox = update_info(
+                node_name, placedb, bottom_left_x, bottom_left_y, net_bbox
             )
 
     return place_record_new, True
@@ -927,7 +1521,7 @@ def draw_macro_placement(
 def read_placement(
     placedb: PlaceDB, grid_size, file_path
 ) -> PlaceRecord:  # 将所有macro随机放置
-    place_record: PlaceRecord = {}
+    place_record = PlaceRecord(placedb, grid_size)
     f = open(file_path, encoding="utf8")
     # 将 f 移动到最后一个记录的位置
     pos = 0
@@ -945,15 +1539,8 @@ def read_placement(
         bottom_left_x, bottom_left_y = int(bottom_left_x), int(bottom_left_y)
         chosen_loc_x = bottom_left_x // grid_size
         chosen_loc_y = bottom_left_y // grid_size
-        place_record[node_name] = Record(
-            node_name,
-            placedb.node_info[node_name].width,
-            placedb.node_info[node_name].height,
-            chosen_loc_x,
-            chosen_loc_y,
-            bottom_left_x,
-            bottom_left_y,
-            grid_size,
+        place_record.set(
+            node_name, chosen_loc_x, chosen_loc_y, bottom_left_x, bottom_left_y
         )
         line = f.readline()
     return place_record
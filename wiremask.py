@@ -1,13 +1,23 @@
 import argparse
 import csv
+import math
+import multiprocessing
 import os
 import random
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import spearmanr
 
 from common import grid_setting, my_inf
+from eval_cache import EvalCache
 from place_db import PlaceDB
+from surrogate import SwapSurrogate
 from utils import (
-    Record,
+    IncrementalHPWL,
+    PlaceRecord,
+    PlacerTrace,
     random_guiding,
     rank_macros_area,
     wiremask_placer,
@@ -15,17 +25,359 @@ from utils import (
     write_pl_for_refine,
     draw_macros,
 )
+from wiremask_kernel import select_placer
+
+# population 模式下 worker 由 fork 创建，直接继承父进程的 placedb，不需要重新解析 benchmark
+shared_placedb: PlaceDB = None
+# 放置结果的模板（port 的位置和放置顺序），worker 只接收 macro 的 grid 坐标
+shared_template: PlaceRecord = None
+shared_macro_idx: np.ndarray = None
+# 贪心放置的实现，由 bbo 根据 backend 选择，worker 同样由 fork 继承
+placer = wiremask_placer
+
+
+def record_template(node_id_ls, placedb: PlaceDB, grid_size) -> PlaceRecord:
+    # port 的位置固定，与 random_guiding 相同；macro 的位置由 rebuild_record 填入
+    template = PlaceRecord(placedb, grid_size)
+    for node_name in node_id_ls:
+        node_info = placedb.node_info[node_name]
+        template.set(
+            node_name,
+            node_info.bottom_left_x // grid_size,
+            node_info.bottom_left_y // grid_size,
+            node_info.bottom_left_x,
+            node_info.bottom_left_y,
+        )
+    return template
+
+
+def rebuild_record(grid_x: np.ndarray, grid_y: np.ndarray) -> PlaceRecord:
+    # 放置结果中 macro 的左下角就是 grid 坐标乘以 grid_size，port 的位置由模板给出
+    place_record = shared_template.copy()
+    idx = shared_macro_idx
+    place_record.grid_x[idx] = grid_x[idx]
+    place_record.grid_y[idx] = grid_y[idx]
+    place_record.bottom_left_x[idx] = grid_x[idx] * place_record.grid_size
+    place_record.bottom_left_y[idx] = grid_y[idx] * place_record.grid_size
+    place_record.refresh(idx)
+    return place_record
+
+
+def evaluate_swap(
+    node_id_ls,
+    grid_num,
+    grid_size,
+    grid_x: np.ndarray,
+    grid_y: np.ndarray,
+    trace: PlacerTrace,
+    node_a,
+    node_b,
+):
+    # 在 worker 中执行，只传入当前最优解的 grid 坐标，trace 是父进程传来的副本；
+    # 同样只返回放置结果的 grid 坐标，由父进程用 rebuild_record 重建
+    place_record = rebuild_record(grid_x, grid_y)
+    place_record.swap(node_a, node_b)
+    placed_macro, hpwl = placer(
+        node_id_ls, shared_placedb, grid_num, grid_size, place_record, trace
+    )
+    return placed_macro.grid_x, placed_macro.grid_y, hpwl, trace
+
+
+def population_EA(
+    stop_round,
+    population,
+    placedb: PlaceDB,
+    grid_num,
+    grid_size,
+    node_id_ls,
+    best_placed_macro: PlaceRecord,
+    best_hpwl,
+    best_trace: PlacerTrace,
+    hpwl_writer,
+    curve_fp,
+    placement_file,
+    eval_cache: EvalCache = None,
+):
+    # 每一代由父进程依次抽取 population 个交换，在进程池中并行放置，
+    # 取其中 hpwl 最小的一个（相同时取先抽到的），按原有规则决定是否接受。
+    # 所有随机数都在父进程中生成，结果只取决于 seed
+    global shared_placedb, shared_template, shared_macro_idx
+    shared_placedb = placedb
+    shared_template = record_template(node_id_ls, placedb, grid_size)
+    shared_macro_idx = np.array(
+        [
+            placedb.node_index[node_name]
+            for node_name in node_id_ls
+            if not placedb.node_info[node_name].is_port
+        ],
+        dtype=np.int64,
+    )
+    candidates = sorted(placedb.macro_name)
+    with ProcessPoolExecutor(
+        max_workers=min(population, os.cpu_count()),
+        mp_context=multiprocessing.get_context("fork"),
+    ) as executor:
+        for cnt in range(stop_round):
+            print(cnt)
+            swaps = [random.sample(candidates, 2) for _ in range(population)]
+            # 命中缓存的交换不再提交给进程池
+            keys = [None] * population
+            results = [None] * population
+            futures = {}
+            for i, (node_a, node_b) in enumerate(swaps):
+                if eval_cache is not None:
+                    guiding = best_placed_macro.copy()
+                    guiding.swap(node_a, node_b)
+                    keys[i] = eval_cache.key(node_id_ls, guiding)
+                    results[i] = eval_cache.get(keys[i])
+                if results[i] is None:
+                    futures[i] = executor.submit(
+                        evaluate_swap,
+                        node_id_ls,
+                        grid_num,
+                        grid_size,
+                        best_placed_macro.grid_x,
+                        best_placed_macro.grid_y,
+                        best_trace.copy(),
+                        node_a,
+                        node_b,
+                    )
+            for i, future in futures.items():
+                grid_x, grid_y, hpwl, trace = future.result()
+                results[i] = rebuild_record(grid_x, grid_y), hpwl, trace
+                if eval_cache is not None:
+                    eval_cache.put(keys[i], *results[i])
+            for _, hpwl, _ in results:
+                hpwl_writer.writerow([hpwl, time.time(), cnt])
+            curve_fp.flush()
+            placed_macro, hpwl, trace = results[
+                int(np.argmin([hpwl for _, hpwl, _ in results]))
+            ]
+            if hpwl < best_hpwl:
+                best_hpwl = hpwl
+                best_placed_macro = placed_macro
+                best_trace = trace
+                write_final_placement(best_placed_macro, best_hpwl, placement_file)
+    return best_placed_macro, best_hpwl
+
+
+def fidelity_levels(placedb: PlaceDB, grid_num, grid_size, fidelity):
+    # 由粗到细的网格，每一级为 (factor, placedb, grid_num, grid_size)，最后一级是原网格
+    levels = []
+    for factor in sorted(set(fidelity), reverse=True):
+        if factor > 1:
+            levels.append(
+                (
+                    factor,
+                    placedb.resize_grid(grid_size * factor),
+                    grid_num // factor,
+                    grid_size * factor,
+                )
+            )
+    levels.append((1, placedb, grid_num, grid_size))
+    return levels
+
+
+def coarse_guiding(
+    place_record: PlaceRecord, placedb: PlaceDB, grid_size, factor
+) -> PlaceRecord:
+    # 原网格上的 guiding 映射到粗网格，port 的位置固定，按实际坐标换算
+    coarse_record = PlaceRecord(placedb, grid_size)
+    for node_name, record in place_record.items():
+        if placedb.node_info[node_name].is_port:
+            grid_x = record.bottom_left_x // grid_size
+            grid_y = record.bottom_left_y // grid_size
+        else:
+            grid_x = record.grid_x // factor
+            grid_y = record.grid_y // factor
+        coarse_record.set(
+            node_name, grid_x, grid_y, record.bottom_left_x, record.bottom_left_y
+        )
+    return coarse_record
+
+
+def rank_correlation(x, y) -> float:
+    if len(x) < 2 or np.all(np.equal(x, x[0])) or np.all(np.equal(y, y[0])):
+        return math.nan
+    return float(spearmanr(x, y)[0])
 
 
-def swap(node1: Record, node2: Record, grid_size: int):
-    node1.bottom_left_x, node2.bottom_left_x = node2.bottom_left_x, node1.bottom_left_x
-    node1.bottom_left_y, node2.bottom_left_y = node2.bottom_left_y, node1.bottom_left_y
+def successive_halving(
+    guidings,
+    levels,
+    node_id_ls,
+    promote_ratio,
+    base_traces=None,
+    fidelity_writer=None,
+    cnt=None,
+    audit=0,
+    eval_cache: EvalCache = None,
+    hpwl_evaluator: IncrementalHPWL = None,
+):
+    # 所有 guiding 先在最粗的网格上放置，每一级只把 hpwl 最小的 promote_ratio 部分
+    # （至少 2 个）提升到下一级，最后一级为原网格。base_traces 为当前最优解在每一级上的 trace，
+    # 用于复用放置前缀。
+    # 每一级另外从被淘汰的候选中按排名均匀取 audit 个，也在下一级上放置，
+    # 只用于计算相邻两级的秩相关（只用提升的候选时范围过窄），不再继续提升。
+    # eval_cache 和 hpwl_evaluator 只用于原网格。
+    # 返回在原网格上放置过的候选 [(idx, placed_macro, hpwl, traces)]
+    alive = list(range(len(guidings)))
+    traces = [[None] * len(levels) for _ in guidings]
+    score = {}
+    for level_id, (factor, placedb_l, grid_num_l, grid_size_l) in enumerate(levels):
+        audited = []
+        if level_id > 0:
+            ranked = sorted(alive, key=lambda i: score[i])
+            keep = min(len(ranked), max(2, math.ceil(len(ranked) * promote_ratio)))
+            alive, dropped = ranked[:keep], ranked[keep:]
+            if audit > 0 and dropped:
+                picks = np.linspace(0, len(dropped) - 1, min(audit, len(dropped)))
+                audited = [dropped[k] for k in sorted(set(np.round(picks).astype(int)))]
+        prev_score, score, placed = score, {}, {}
+        for i in alive + audited:
+            if factor == 1:
+                guiding = guidings[i]
+            else:
+                guiding = coarse_guiding(guidings[i], placedb_l, grid_size_l, factor)
+            key = cached = None
+            if factor == 1 and eval_cache is not None:
+                key = eval_cache.key(node_id_ls, guiding)
+                cached = eval_cache.get(key)
+            if cached is not None:
+                placed[i], score[i], trace = cached
+            else:
+                if base_traces is None:
+                    trace = PlacerTrace(grid_num_l, grid_size_l)
+                else:
+                    trace = base_traces[level_id].copy()
+                placed[i], score[i] = placer(
+                    node_id_ls,
+                    placedb_l,
+                    grid_num_l,
+                    grid_size_l,
+                    guiding,
+                    trace,
+                    hpwl_evaluator if factor == 1 else None,
+                )
+                if key is not None:
+                    eval_cache.put(key, placed[i], score[i], trace)
+            traces[i][level_id] = trace
+        if level_id > 0:
+            # 少于 2 个候选或某一级的 hpwl 全部相同时秩相关没有定义，不记录
+            measured = [i for i in alive + audited if prev_score[i] < my_inf]
+            corr = rank_correlation(
+                [prev_score[i] for i in measured], [score[i] for i in measured]
+            )
+            if not math.isnan(corr):
+                print(
+                    f"fidelity {levels[level_id - 1][0]} -> {factor}: spearman {corr}"
+                )
+                if fidelity_writer is not None:
+                    fidelity_writer.writerow(
+                        [
+                            cnt,
+                            levels[level_id - 1][0],
+                            factor,
+                            len(alive),
+                            len(measured),
+                            corr,
+                        ]
+                    )
+    return [(i, placed[i], score[i], traces[i]) for i in placed]
+
+
+def fidelity_bbo(
+    init_round,
+    stop_round,
+    population,
+    placedb: PlaceDB,
+    grid_num,
+    grid_size,
+    node_id_ls,
+    fidelity,
+    promote_ratio,
+    hpwl_writer,
+    curve_fp,
+    placement_file,
+    fidelity_file,
+    audit=2,
+    eval_cache: EvalCache = None,
+):
+    # successive halving：初始化的 init_round 个随机 guiding 和 EA 每一代的 population 个交换
+    # 都先在粗网格上评估，只有排名靠前的部分在原网格上重新放置
+    assert population > 1, "multi-fidelity needs more than one swap per generation"
+    levels = fidelity_levels(placedb, grid_num, grid_size, fidelity)
+    fidelity_fp = open(fidelity_file, "a+") if fidelity_file else None
+    fidelity_writer = csv.writer(fidelity_fp) if fidelity_fp else None
 
-    node1.grid_x, node2.grid_x = node2.grid_x, node1.grid_x
-    node1.grid_y, node2.grid_y = node2.grid_y, node1.grid_y
+    best_hpwl = my_inf
+    best_placed_macro = PlaceRecord(placedb, grid_size)
+    best_traces = None
+    guidings = [
+        random_guiding(node_id_ls, placedb, grid_size) for _ in range(init_round)
+    ]
+    results = successive_halving(
+        guidings,
+        levels,
+        node_id_ls,
+        promote_ratio,
+        None,
+        fidelity_writer,
+        "init",
+        audit,
+    )
+    for _, placed_macro, hpwl, traces in results:
+        if hpwl < best_hpwl:
+            best_hpwl = hpwl
+            best_placed_macro = placed_macro
+            best_traces = traces
+        hpwl_writer.writerow([hpwl, time.time(), "init"])
+    curve_fp.flush()
+    if best_hpwl == my_inf:
+        return best_placed_macro, best_hpwl
+    write_final_placement(best_placed_macro, best_hpwl, placement_file)
 
-    node1.refresh(grid_size)
-    node2.refresh(grid_size)
+    # 与逐个交换的 EA 相同，原网格上只有交换位置之后的 macro 会移动
+    hpwl_evaluator = IncrementalHPWL(best_placed_macro, placedb)
+    candidates = sorted(placedb.macro_name)
+    for cnt in range(stop_round):
+        print(cnt)
+        guidings = []
+        for _ in range(population):
+            guiding = best_placed_macro.copy()
+            guiding.swap(*random.sample(candidates, 2))
+            guidings.append(guiding)
+        results = successive_halving(
+            guidings,
+            levels,
+            node_id_ls,
+            promote_ratio,
+            best_traces,
+            fidelity_writer,
+            cnt,
+            audit,
+            eval_cache,
+            hpwl_evaluator,
+        )
+        for _, _, hpwl, _ in results:
+            hpwl_writer.writerow([hpwl, time.time(), cnt])
+        curve_fp.flush()
+        if fidelity_fp is not None:
+            fidelity_fp.flush()
+        _, placed_macro, hpwl, traces = min(results, key=lambda result: result[2])
+        if hpwl < best_hpwl:
+            best_hpwl = hpwl
+            best_placed_macro = placed_macro
+            best_traces = traces
+            # 最后一次 propose 不一定是接受的候选，重新 propose 后再 commit
+            hpwl_evaluator.propose(placed_macro)
+            hpwl_evaluator.commit()
+            write_final_placement(best_placed_macro, best_hpwl, placement_file)
+    if fidelity_fp is not None:
+        fidelity_fp.close()
+    if eval_cache is not None:
+        print(eval_cache.report())
+    return best_placed_macro, best_hpwl
 
 
 def bbo(
@@ -36,51 +388,143 @@ def bbo(
     grid_size,
     curve_file,
     placement_file,
+    population=1,
+    fidelity=None,
+    promote_ratio=0.25,
+    fidelity_file=None,
+    surrogate: SwapSurrogate = None,
+    eval_cache: EvalCache = None,
+    backend="numpy",
+    fidelity_audit=2,
 ):
+    # surrogate 不为空时，逐个交换的 EA 由 surrogate 预筛选候选交换；
+    # eval_cache 不为空时，EA 中重复出现的状态直接使用缓存的放置结果；
+    # backend 为 numba 时，每次贪心放置由一次编译后的调用完成，结果与 numpy 实现相同
+    global placer
+    placer = select_placer(backend)
     curve_fp = open(curve_file, "a+")
     hpwl_writer = csv.writer(curve_fp)
     node_id_ls = rank_macros_area(placedb)
 
+    if fidelity:
+        place_record, best_hpwl = fidelity_bbo(
+            init_round,
+            stop_round,
+            population,
+            placedb,
+            grid_num,
+            grid_size,
+            node_id_ls,
+            fidelity,
+            promote_ratio,
+            hpwl_writer,
+            curve_fp,
+            placement_file,
+            fidelity_file,
+            fidelity_audit,
+            eval_cache,
+        )
+        hpwl_writer.writerow([best_hpwl, time.time()])
+        curve_fp.flush()
+        return place_record, best_hpwl
+
     # initialize
     best_hpwl = my_inf
     for cnt in range(init_round):
         print(f"init {cnt}")
         place_record = random_guiding(node_id_ls, placedb, grid_size)
-        placed_macros, hpwl = wiremask_placer(
-            node_id_ls, placedb, grid_num, grid_size, place_record
+        trace = PlacerTrace(grid_num, grid_size)
+        placed_macros, hpwl = placer(
+            node_id_ls, placedb, grid_num, grid_size, place_record, trace
         )
         if hpwl < best_hpwl:
             best_hpwl = hpwl
             best_placed_macro = placed_macros
+            best_trace = trace
             write_final_placement(best_placed_macro, best_hpwl, placement_file)
         hpwl_writer.writerow([hpwl, time.time(), "init"])
         curve_fp.flush()
     # EA
     candidates = sorted(placedb.macro_name)
-    if best_hpwl != my_inf:
+    if best_hpwl != my_inf and population > 1:
+        write_final_placement(best_placed_macro, best_hpwl, placement_file)
+        place_record, best_hpwl = population_EA(
+            stop_round,
+            population,
+            placedb,
+            grid_num,
+            grid_size,
+            node_id_ls,
+            best_placed_macro,
+            best_hpwl,
+            best_trace,
+            hpwl_writer,
+            curve_fp,
+            placement_file,
+            eval_cache,
+        )
+        hpwl_writer.writerow([best_hpwl, time.time()])
+        curve_fp.flush()
+        if eval_cache is not None:
+            print(eval_cache.report())
+    elif best_hpwl != my_inf:
         write_final_placement(best_placed_macro, best_hpwl, placement_file)
         place_record = best_placed_macro
+        # 只有交换位置之后的 macro 会移动，hpwl 只需更新与它们相连的 net
+        hpwl_evaluator = IncrementalHPWL(best_placed_macro, placedb)
         for cnt in range(stop_round):
             print(cnt)
-            node_a, node_b = random.sample(candidates, 2)
-            swap(place_record[node_a], place_record[node_b], grid_size)
+            if surrogate is None:
+                node_a, node_b = random.sample(candidates, 2)
+            else:
+                node_a, node_b = surrogate.propose(
+                    place_record, lambda: random.sample(candidates, 2)
+                )
+            place_record.swap(node_a, node_b)
 
-            placed_macro, hpwl = wiremask_placer(
-                node_id_ls, placedb, grid_num, grid_size, place_record
-            )
+            cached = None
+            if eval_cache is not None:
+                key = eval_cache.key(node_id_ls, place_record)
+                cached = eval_cache.get(key)
+            if cached is not None:
+                placed_macro, hpwl, trace = cached
+                if hpwl < best_hpwl:
+                    hpwl_evaluator.propose(placed_macro)
+            else:
+                # 交换位置之前的 macro 放置结果不变，从 best_trace 的前缀继续放置
+                trace = best_trace.copy()
+                placed_macro, hpwl = placer(
+                    node_id_ls,
+                    placedb,
+                    grid_num,
+                    grid_size,
+                    place_record,
+                    trace,
+                    hpwl_evaluator,
+                )
+                if eval_cache is not None:
+                    eval_cache.put(key, placed_macro, hpwl, trace)
+            if surrogate is not None:
+                surrogate.update(best_hpwl, hpwl)
             if hpwl >= best_hpwl:
                 # 没有优化，恢复原状
-                swap(place_record[node_a], place_record[node_b], grid_size)
+                place_record.swap(node_a, node_b)
             else:
                 best_hpwl = hpwl
                 best_placed_macro = place_record = placed_macro
+                best_trace = trace
+                hpwl_evaluator.commit()
                 write_final_placement(best_placed_macro, best_hpwl, placement_file)
-            hpwl_writer.writerow([hpwl, time.time()])
+            hpwl_writer.writerow([hpwl, time.time(), cnt])
             curve_fp.flush()
         hpwl_writer.writerow([best_hpwl, time.time()])
         curve_fp.flush()
+        if surrogate is not None:
+            print(surrogate.report())
+        if eval_cache is not None:
+            print(eval_cache.report())
     else:
-        place_record = {}
+        place_record = PlaceRecord(placedb, grid_size)
     return place_record, best_hpwl
 
 
@@ -90,16 +534,49 @@ def main():
     parser.add_argument("--seed", required=True)
     parser.add_argument("--init_round", default=100)
     parser.add_argument("--stop_round", default=my_inf)
+    # 每一代并行评估的交换个数，1 表示逐个交换
+    parser.add_argument("--population", default=1)
+    # 多精度评估的降采样倍数，例如 4 或 4,2，为空时只在原网格上评估；
+    # 此时 --population 为 EA 每一代评估的交换个数
+    parser.add_argument("--fidelity", default="")
+    parser.add_argument("--promote_ratio", default=0.25)
+    # 每一级额外在下一级上评估的被淘汰候选个数，只用于计算秩相关，0 表示不计算
+    parser.add_argument("--fidelity_audit", default=2)
+    parser.add_argument("--surrogate", action="store_true")
+    # EA 评估缓存的内存上限（MB），0 表示不使用缓存
+    parser.add_argument("--eval_cache_mb", default=256)
+    # 贪心放置的实现：numpy 或 numba，numba 不可用时退回 numpy
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "numba"])
     args = parser.parse_args()
     benchmark = args.dataset
     seed1 = args.seed
     stop_round = int(args.stop_round)
     init_round = int(args.init_round)
+    population = int(args.population)
+    fidelity = [int(factor) for factor in args.fidelity.split(",") if factor]
+    promote_ratio = float(args.promote_ratio)
+    # 每一级至少提升 2 个候选，population 过小时没有候选被淘汰，只会更慢
+    if fidelity and max(2, math.ceil(population * promote_ratio)) >= population:
+        parser.error(
+            "--fidelity needs a --population larger than the promoted candidates "
+            "(at least 2, or population * promote_ratio)"
+        )
+    if fidelity and args.surrogate:
+        parser.error("--surrogate is not supported with --fidelity")
+    if population > 1 and args.surrogate:
+        parser.error("--surrogate is not supported with --population > 1")
     random.seed(seed1)
+    np.random.seed(int(seed1))
 
     grid_num = grid_setting[benchmark]["grid_num"]
     grid_size = grid_setting[benchmark]["grid_size"]
     placedb = PlaceDB(benchmark, grid_size)
+    surrogate = None
+    if args.surrogate:
+        surrogate = SwapSurrogate(placedb, sorted(placedb.macro_name))
+    eval_cache = None
+    if int(args.eval_cache_mb) > 0:
+        eval_cache = EvalCache(placedb, int(args.eval_cache_mb) << 20)
 
     result_dir = os.path.join("results_macro_front_bbo", benchmark)
     if not os.path.exists(result_dir):
@@ -107,12 +584,27 @@ def main():
 
     curve_file = os.path.join(result_dir, f"curve_seed_{seed1}.csv")
     placement_file = os.path.join(result_dir, f"placement_seed_{seed1}.csv")
+    fidelity_file = os.path.join(result_dir, f"fidelity_seed_{seed1}.csv")
     # pl_file_for_detailed = os.path.join(result_dir, f"{benchmark}_for_detailed.gp.pl")
     pl_file_for_refine = os.path.join(result_dir, f"{benchmark}.gp.pl")
 
     start = time.time()
     place_record, hpwl = bbo(
-        init_round, stop_round, placedb, grid_num, grid_size, curve_file, placement_file
+        init_round,
+        stop_round,
+        placedb,
+        grid_num,
+        grid_size,
+        curve_file,
+        placement_file,
+        population,
+        fidelity,
+        promote_ratio,
+        fidelity_file,
+        surrogate,
+        eval_cache,
+        args.backend,
+        int(args.fidelity_audit),
     )
     end = time.time()
     print(f"time: {end-start}s")
@@ -0,0 +1,509 @@
+import argparse
+import glob
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from common import grid_setting, my_inf
+from place_db import PlaceDB
+from utils import (
+    IncrementalHPWL,
+    PlaceRecord,
+    PlacerTrace,
+    cal_hpwl,
+    random_guiding,
+    rank_macros_area,
+    resume_trace,
+    wiremask_placer,
+)
+
+try:
+    import numba
+    from numba import njit
+
+    has_numba = True
+    # NUMBA_DISABLE_JIT=1 时 njit 不编译，kernel 以普通 python 执行
+    jit_enabled = not numba.config.DISABLE_JIT
+except ImportError:
+    has_numba = False
+    jit_enabled = False
+
+    def njit(*args, **kwargs):
+        # 没有 numba 时 kernel 仍可以作为普通 python 函数执行，只用于 parity 检查
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def place_occupied(occupied, grid_x, grid_y, scaled_width, scaled_height):
+    # 与 OccupancyGrid.place 一致，超出网格的部分被截断
+    grid_num = occupied.shape[0]
+    left_x = max(0, grid_x)
+    bottom_y = max(0, grid_y)
+    right_x = min(grid_num, grid_x + scaled_width)
+    top_y = min(grid_num, grid_y + scaled_height)
+    for x in range(left_x, right_x):
+        for y in range(bottom_y, top_y):
+            occupied[x, y] = True
+
+
+@njit(cache=True)
+def update_integral(occupied, integral):
+    grid_num = occupied.shape[0]
+    for x in range(grid_num):
+        row_sum = 0
+        for y in range(grid_num):
+            row_sum += occupied[x, y]
+            integral[x + 1, y + 1] = integral[x, y + 1] + row_sum
+
+
+@njit(cache=True)
+def wire_cost(coords, offset, net_min, net_max, cost):
+    # 与 cal_wire_cost 相同的表达式，逐元素计算
+    for col in range(coords.shape[0]):
+        pin_co = coords[col] + offset
+        low = net_min - pin_co
+        high = pin_co - net_max
+        cost[col] = (low if low > 0.0 else 0.0) + (high if high > 0.0 else 0.0)
+
+
+@njit(cache=True)
+def is_exact_cost(cost, pin_cnt, frac_bits=8):
+    # 与 is_exact_sum 相同的判定
+    scale = float(1 << frac_bits)
+    total = 0.0
+    for p in range(pin_cnt):
+        row_max = -np.inf
+        for col in range(cost.shape[1]):
+            scaled = cost[p, col] * scale
+            if math.floor(scaled) != scaled:
+                return False
+            row_max = max(row_max, cost[p, col])
+        total += row_max
+    return total < 2.0 ** (52 - frac_bits)
+
+
+@njit(cache=True)
+def fill_wire_mask(x_cost, y_cost, pin_cnt, wire_mask):
+    # 与 combine_separable_cost 逐位一致：精确时直接按行列求和，否则按原实现的顺序逐 pin 累加
+    grid_num = wire_mask.shape[0]
+    if is_exact_cost(x_cost, pin_cnt) and is_exact_cost(y_cost, pin_cnt):
+        x_sum = np.zeros(grid_num)
+        y_sum = np.zeros(grid_num)
+        for p in range(pin_cnt):
+            for i in range(grid_num):
+                x_sum[i] += x_cost[p, i]
+                y_sum[i] += y_cost[p, i]
+        for row in range(grid_num):
+            for col in range(grid_num):
+                wire_mask[row, col] = x_sum[row] + y_sum[col]
+        return
+    wire_mask[:, :] = 0.0
+    for p in range(pin_cnt):
+        for row in range(grid_num):
+            for col in range(grid_num):
+                if row <= col:
+                    wire_mask[row, col] = (
+                        wire_mask[row, col] + x_cost[p, row]
+                    ) + y_cost[p, col]
+                else:
+                    wire_mask[row, col] = (
+                        wire_mask[row, col] + y_cost[p, col]
+                    ) + x_cost[p, row]
+
+
+@njit(cache=True)
+def greedy_place(
+    order,
+    is_port,
+    record_grid_x,
+    record_grid_y,
+    record_bottom_left_x,
+    record_bottom_left_y,
+    node_bottom_left_x,
+    node_bottom_left_y,
+    width,
+    height,
+    scaled_width,
+    scaled_height,
+    node_pin_start,
+    node_pin,
+    pin_net,
+    pin_x_offset,
+    pin_y_offset,
+    net_cnt,
+    grid_num,
+    grid_size,
+    start,
+    chosen_x,
+    chosen_y,
+):
+    # 按 order 依次放置所有 node，与 wiremask_placer 的每一步逐位一致：
+    # port 使用 record 中的位置；macro 在合法位置中选择 wire mask 最小的格子，
+    # 相同时选择离 guiding（record_grid_x/y）欧氏距离最近的、行优先扫描中最先出现的格子。
+    # chosen_x/y 的前 start 个为复用的结果，其余由本函数写入。
+    # 返回完成放置的 node 个数，小于 len(order) 表示该 node 没有合法位置
+    x_min = np.full(net_cnt, np.inf)
+    x_max = np.full(net_cnt, -np.inf)
+    y_min = np.full(net_cnt, np.inf)
+    y_max = np.full(net_cnt, -np.inf)
+    occupied = np.zeros((grid_num, grid_num), dtype=np.bool_)
+    integral = np.zeros((grid_num + 1, grid_num + 1), dtype=np.int64)
+    integral_dirty = True
+    coords = np.arange(grid_num) * float(grid_size)
+    wire_mask = np.zeros((grid_num, grid_num))
+    max_pin_cnt = 0
+    for cnt in range(order.shape[0]):
+        idx = order[cnt]
+        max_pin_cnt = max(max_pin_cnt, node_pin_start[idx + 1] - node_pin_start[idx])
+    x_cost = np.zeros((max_pin_cnt, grid_num))
+    y_cost = np.zeros((max_pin_cnt, grid_num))
+
+    for cnt in range(order.shape[0]):
+        idx = order[cnt]
+        if is_port[idx]:
+            grid_x = record_grid_x[idx]
+            grid_y = record_grid_y[idx]
+            occupied_width = math.ceil(
+                (width[idx] + record_bottom_left_x[idx] - grid_size * grid_x)
+                / grid_size
+            )
+            occupied_height = math.ceil(
+                (height[idx] + record_bottom_left_y[idx] - grid_size * grid_y)
+                / grid_size
+            )
+            bottom_left_x = node_bottom_left_x[idx]
+            bottom_left_y = node_bottom_left_y[idx]
+        else:
+            if cnt >= start:
+                # position mask
+                num_x = grid_num - scaled_width[idx]
+                num_y = grid_num - scaled_height[idx]
+                if num_x <= 0 or num_y <= 0:
+                    return cnt
+                if integral_dirty:
+                    update_integral(occupied, integral)
+                    integral_dirty = False
+
+                # wire mask
+                pin_cnt = 0
+                for k in range(node_pin_start[idx], node_pin_start[idx + 1]):
+                    pin = node_pin[k]
+                    net = pin_net[pin]
+                    if x_min[net] <= x_max[net]:
+                        wire_cost(
+                            coords,
+                            pin_x_offset[pin] + 0.5 * width[idx],
+                            x_min[net],
+                            x_max[net],
+                            x_cost[pin_cnt],
+                        )
+                        wire_cost(
+                            coords,
+                            pin_y_offset[pin] + 0.5 * height[idx],
+                            y_min[net],
+                            y_max[net],
+                            y_cost[pin_cnt],
+                        )
+                        pin_cnt += 1
+                fill_wire_mask(x_cost, y_cost, pin_cnt, wire_mask)
+
+                # chose position
+                sw = scaled_width[idx]
+                sh = scaled_height[idx]
+                guiding_x = record_grid_x[idx]
+                guiding_y = record_grid_y[idx]
+                found = False
+                best_value = 0.0
+                best_dist = 0
+                best_x = 0
+                best_y = 0
+                for x in range(num_x):
+                    for y in range(num_y):
+                        window_sum = (
+                            integral[x + sw, y + sh]
+                            - integral[x, y + sh]
+                            - integral[x + sw, y]
+                            + integral[x, y]
+                        )
+                        if window_sum != 0:
+                            continue
+                        value = wire_mask[x, y]
+                        dist = (x - guiding_x) ** 2 + (y - guiding_y) ** 2
+                        if (
+                            not found
+                            or value < best_value
+                            or (value == best_value and dist < best_dist)
+                        ):
+                            found = True
+                            best_value = value
+                            best_dist = dist
+                            best_x = x
+                            best_y = y
+                if not found:
+                    return cnt
+                chosen_x[cnt] = best_x
+                chosen_y[cnt] = best_y
+            grid_x = chosen_x[cnt]
+            grid_y = chosen_y[cnt]
+            occupied_width = math.ceil(width[idx] / grid_size)
+            occupied_height = math.ceil(height[idx] / grid_size)
+            bottom_left_x = grid_size * grid_x
+            bottom_left_y = grid_size * grid_y
+        place_occupied(occupied, grid_x, grid_y, occupied_width, occupied_height)
+        integral_dirty = True
+
+        # 与 update_info 相同，更新 net bbox
+        center_x = bottom_left_x + 0.5 * width[idx]
+        center_y = bottom_left_y + 0.5 * height[idx]
+        for k in range(node_pin_start[idx], node_pin_start[idx + 1]):
+            pin = node_pin[k]
+            net = pin_net[pin]
+            pin_x = pin_x_offset[pin] + center_x
+            pin_y = pin_y_offset[pin] + center_y
+            x_min[net] = min(x_min[net], pin_x)
+            x_max[net] = max(x_max[net], pin_x)
+            y_min[net] = min(y_min[net], pin_y)
+            y_max[net] = max(y_max[net], pin_y)
+    return order.shape[0]
+
+
+def wiremask_placer_compiled(
+    node_name_ls: List[str],
+    placedb: PlaceDB,
+    grid_num,
+    grid_size,
+    place_record: PlaceRecord,
+    trace: PlacerTrace = None,
+    hpwl_evaluator: IncrementalHPWL = None,
+):
+    # 与 wiremask_placer 的接口和结果完全相同，整个贪心过程在一次 greedy_place 调用中完成
+    time_start = time.time()
+    start = resume_trace(
+        trace, node_name_ls, placedb, grid_num, grid_size, place_record
+    )
+    order = np.array([placedb.node_index[name] for name in node_name_ls], np.int64)
+    is_port = np.zeros(len(placedb.node_name_ls), dtype=bool)
+    node_bottom_left_x = np.zeros(len(placedb.node_name_ls), dtype=np.int64)
+    node_bottom_left_y = np.zeros(len(placedb.node_name_ls), dtype=np.int64)
+    scaled_width = np.zeros(len(placedb.node_name_ls), dtype=np.int64)
+    scaled_height = np.zeros(len(placedb.node_name_ls), dtype=np.int64)
+    for idx, node_name in zip(order.tolist(), node_name_ls):
+        node = placedb.node_info[node_name]
+        is_port[idx] = node.is_port
+        node_bottom_left_x[idx] = node.bottom_left_x
+        node_bottom_left_y[idx] = node.bottom_left_y
+        scaled_width[idx] = node.scaled_width
+        scaled_height[idx] = node.scaled_height
+    chosen_x = np.zeros(len(node_name_ls), dtype=np.int64)
+    chosen_y = np.zeros(len(node_name_ls), dtype=np.int64)
+    for cnt in range(start):
+        if trace.chosen[cnt] is not None:
+            chosen_x[cnt], chosen_y[cnt] = trace.chosen[cnt]
+
+    time0 = time.time()
+    done = greedy_place(
+        order,
+        is_port,
+        place_record.grid_x,
+        place_record.grid_y,
+        place_record.bottom_left_x,
+        place_record.bottom_left_y,
+        node_bottom_left_x,
+        node_bottom_left_y,
+        placedb.node_width,
+        placedb.node_height,
+        scaled_width,
+        scaled_height,
+        placedb.node_pin_start,
+        placedb.node_pin,
+        placedb.pin_net,
+        placedb.pin_x_offset,
+        placedb.pin_y_offset,
+        len(placedb.net_name_ls),
+        grid_num,
+        grid_size,
+        start,
+        chosen_x,
+        chosen_y,
+    )
+    N2_time = time.time() - time0
+
+    if trace is not None:
+        for cnt in range(start, done):
+            node_name = node_name_ls[cnt]
+            if is_port[order[cnt]]:
+                trace.append(node_name, None, None)
+            else:
+                trace.append(
+                    node_name,
+                    (place_record[node_name].grid_x, place_record[node_name].grid_y),
+                    (int(chosen_x[cnt]), int(chosen_y[cnt])),
+                )
+    if done < len(node_name_ls):
+        print("no_legal_place\n\n")
+        return PlaceRecord(placedb, grid_size), my_inf
+
+    new_place_record = PlaceRecord(placedb, grid_size)
+    port = is_port[order]
+    grid_x = np.where(port, place_record.grid_x[order], chosen_x)
+    grid_y = np.where(port, place_record.grid_y[order], chosen_y)
+    new_place_record.placed[order] = True
+    new_place_record.order = order.tolist()
+    new_place_record.grid_x[order] = grid_x
+    new_place_record.grid_y[order] = grid_y
+    new_place_record.bottom_left_x[order] = np.where(
+        port, place_record.bottom_left_x[order], grid_size * grid_x
+    )
+    new_place_record.bottom_left_y[order] = np.where(
+        port, place_record.bottom_left_y[order], grid_size * grid_y
+    )
+    new_place_record.refresh(order)
+    time_end = time.time()
+
+    if hpwl_evaluator is None:
+        hpwl = cal_hpwl(new_place_record, placedb)
+    else:
+        hpwl = hpwl_evaluator.propose(new_place_record)
+    print("time:", time_end - time_start)
+    print("N2_time:", N2_time)
+    if trace is not None:
+        print("resume from:", start)
+    print("hpwl:", hpwl)
+    print("\n")
+    return new_place_record, hpwl
+
+
+def select_placer(backend: str = "numpy"):
+    # numba 不可用时退回 numpy 实现
+    if backend == "numba":
+        if has_numba:
+            return wiremask_placer_compiled
+        print("numba is not available, fall back to numpy")
+    elif backend != "numpy":
+        raise ValueError(f"unknown placer backend: {backend}")
+    return wiremask_placer
+
+
+def same_placement(record1: PlaceRecord, record2: PlaceRecord) -> bool:
+    return record1.order == record2.order and all(
+        np.array_equal(getattr(record1, name), getattr(record2, name))
+        for name in [
+            "placed",
+            "grid_x",
+            "grid_y",
+            "bottom_left_x",
+            "bottom_left_y",
+            "scaled_width",
+            "scaled_height",
+            "center_x",
+            "center_y",
+        ]
+    )
+
+
+def parity_check(placedb: PlaceDB, grid_num, grid_size, rounds, swaps) -> bool:
+    # 随机 guiding 以及在其上的随机交换（复用 trace 前缀），逐位比较两种实现的结果
+    node_name_ls = rank_macros_area(placedb)
+    candidates = sorted(placedb.macro_name)
+    ok = True
+    for r in range(rounds):
+        place_record = random_guiding(node_name_ls, placedb, grid_size)
+        trace_ref = PlacerTrace(grid_num, grid_size)
+        trace_new = PlacerTrace(grid_num, grid_size)
+        for s in range(swaps + 1):
+            if s > 0 and len(candidates) >= 2:
+                place_record.swap(*random.sample(candidates, 2))
+            ref_record, ref_hpwl = wiremask_placer(
+                node_name_ls, placedb, grid_num, grid_size, place_record, trace_ref
+            )
+            new_record, new_hpwl = wiremask_placer_compiled(
+                node_name_ls, placedb, grid_num, grid_size, place_record, trace_new
+            )
+            same = (
+                ref_hpwl == new_hpwl
+                and same_placement(ref_record, new_record)
+                and trace_ref.chosen == trace_new.chosen
+                and trace_ref.guiding == trace_new.guiding
+            )
+            print(f"round {r} swap {s}: hpwl {ref_hpwl} {new_hpwl}, same {same}")
+            ok = ok and same
+    return ok
+
+
+def tracked_designs() -> List[str]:
+    # 仓库中自带的小设计 benchmarks/simple/*
+    return sorted(
+        os.path.relpath(os.path.dirname(aux_file), "benchmarks")
+        for aux_file in glob.glob(os.path.join("benchmarks", "simple", "*", "*.aux"))
+    )
+
+
+def run_parity(args, benchmark) -> bool:
+    random.seed(args.seed)
+    np.random.seed(int(args.seed))
+    if args.grid_num is not None:
+        grid_num, grid_size = int(args.grid_num), int(args.grid_size)
+    elif benchmark in grid_setting:
+        grid_num = grid_setting[benchmark]["grid_num"]
+        grid_size = grid_setting[benchmark]["grid_size"]
+    else:
+        # 没有预设的小设计：以最小的 node 尺寸为网格，网格覆盖所有 node
+        placedb = PlaceDB(benchmark, 1)
+        grid_size = int(min(placedb.node_width.min(), placedb.node_height.min()))
+        grid_num = math.ceil(max(placedb.max_width, placedb.max_height) / grid_size)
+        grid_num += math.ceil(
+            max(placedb.node_width.max(), placedb.node_height.max()) / grid_size
+        )
+    placedb = PlaceDB(benchmark, 1).resize_grid(grid_size)
+    return parity_check(placedb, grid_num, grid_size, int(args.rounds), int(args.swaps))
+
+
+def main():
+    # 与 wiremask_placer 的 parity 检查，默认在仓库自带的 benchmarks/simple/* 上运行，例如
+    # python wiremask_kernel.py
+    # python wiremask_kernel.py --dataset adaptec1 --backend numba
+    # backend python 时 kernel 以普通 python 执行（只检查逻辑，速度很慢），
+    # numba 时 kernel 被编译，没有安装 numba 时跳过
+    parser = argparse.ArgumentParser(description="compiled wiremask placer parity")
+    parser.add_argument("--dataset", nargs="+", default=None)
+    parser.add_argument(
+        "--backend", nargs="+", default=["python", "numba"], choices=["python", "numba"]
+    )
+    parser.add_argument("--grid_num", default=None)
+    parser.add_argument("--grid_size", default=None)
+    parser.add_argument("--rounds", default=2)
+    parser.add_argument("--swaps", default=2)
+    parser.add_argument("--seed", default=2027)
+    args = parser.parse_args()
+    datasets = args.dataset or tracked_designs()
+    print("numba:", has_numba, "jit:", jit_enabled)
+
+    results = {}
+    for backend in args.backend:
+        if backend == "numba" and not jit_enabled:
+            print("numba is not available or jit is disabled, skip the numba backend")
+        elif backend == "python" and jit_enabled:
+            # 已经加载的 kernel 是编译后的版本，在关闭 jit 的子进程中重新运行
+            env = dict(os.environ, NUMBA_DISABLE_JIT="1")
+            command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:]]
+            command += ["--dataset", *datasets, "--backend", "python"]
+            results["python"] = subprocess.run(command, env=env).returncode == 0
+        else:
+            for benchmark in datasets:
+                results[f"{backend} {benchmark}"] = run_parity(args, benchmark)
+    for name, ok in results.items():
+        print(f"{name}: {'pass' if ok else 'FAIL'}")
+    if not all(results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()